@@ -1,9 +1,12 @@
 """Agenre de Integrações em apis"""
 
 import asyncio
+import time
 import uuid
 import logging
 import os
+from contextlib import asynccontextmanager
+from typing import Dict, Optional
 
 from fastapi.responses import HTMLResponse
 from fastapi.templating import Jinja2Templates
@@ -18,15 +21,24 @@ from dotenv import load_dotenv
 from langchain.chat_models import init_chat_model
 from langgraph.checkpoint.memory import MemorySaver
 from langgraph.prebuilt import create_react_agent
-from langchain_mcp_adapters.client import MultiServerMCPClient
 from prompts_agents import agent_integration_ml
 from mcp_servers import MCP_SERVERS_CONFIG
+from utils.mcp_pool import mcp_pool
 
 # Carrega .env
 load_dotenv()
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Aquece as conexões MCP no startup e renova os schemas em segundo plano"""
+    app.state.mcp_warmup = asyncio.create_task(mcp_pool.warmup(MCP_SERVERS_CONFIG))
+    mcp_pool.start_refresh(MCP_SERVERS_CONFIG)
+    yield
+    app.state.mcp_warmup.cancel()
+    await mcp_pool.aclose()
+
 # Configura FastAPI
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 app.add_middleware(SessionMiddleware, secret_key="sua_chave_secreta_aqui_mude_para_producao")
 app.add_middleware(
     CORSMiddleware,
@@ -47,29 +59,68 @@ logger = logging.getLogger(__name__)
 # Armazenar agentes por sessão
 agents = {}
 
+# Prazo total para conectar os servidores MCP ao criar um agente e timeout de cada um
+MCP_DEADLINE = float(os.getenv("AGENT_MCP_DEADLINE", "10"))
+MCP_SERVER_TIMEOUT = float(os.getenv("AGENT_MCP_TIMEOUT", "8"))
+
 # Dados do request
 class ChatRequest(BaseModel):
     message: str
 
+async def _connect_server(server_name: str, server_config: dict, timeout: float):
+    """Tools de um servidor via pool, registrando a latência da conexão"""
+    started = time.perf_counter()
+    try:
+        server_tools = await mcp_pool.acquire_server(server_name, server_config, timeout=timeout)
+    except Exception as e:
+        logger.warning(f"Falha ao conectar ao servidor {server_name} em {(time.perf_counter() - started) * 1000:.0f}ms: {e!r}")
+        raise
+    logger.info(f"Servidor {server_name} conectado em {(time.perf_counter() - started) * 1000:.0f}ms ({len(server_tools)} tools)")
+    return server_tools
+
+
+def _log_late_result(server_name: str):
+    def callback(task: asyncio.Task):
+        if not task.cancelled() and task.exception() is None:
+            logger.info(f"Servidor {server_name} concluiu após o prazo; fica no pool para as próximas sessões")
+    return callback
+
+
+async def connect_mcp_servers(config: Dict[str, dict], deadline: float = MCP_DEADLINE,
+                              timeouts: Optional[Dict[str, float]] = None):
+    """Conecta todos os servidores em paralelo e devolve as tools dos que responderem até o prazo.
+
+    Cada servidor tem seu timeout (``timeouts[nome]`` ou MCP_SERVER_TIMEOUT);
+    os que ainda estiverem conectando no fim do ``deadline`` continuam em
+    segundo plano e ficam no pool para a próxima sessão.
+    """
+    timeouts = timeouts or {}
+    tasks = {
+        asyncio.create_task(_connect_server(name, server_config, timeouts.get(name, MCP_SERVER_TIMEOUT))): name
+        for name, server_config in config.items()
+    }
+    tools = []
+    successful_servers = []
+    done, pending = await asyncio.wait(tasks, timeout=deadline)
+    for task in done:
+        if task.exception() is None:
+            tools.extend(task.result())
+            successful_servers.append(tasks[task])
+    for task in pending:
+        logger.warning(f"Servidor {tasks[task]} não respondeu no prazo de {deadline:g}s; seguindo sem ele")
+        task.add_done_callback(_log_late_result(tasks[task]))
+    return tools, successful_servers
+
+
 # Criação do agente
-async def create_agent_with_fallback():
+async def create_agent_with_fallback(deadline: float = MCP_DEADLINE, timeouts: Optional[Dict[str, float]] = None):
     llm = init_chat_model("google_genai:gemini-2.5-flash")
     memoria = MemorySaver()
-    tools = []
-    successful_servers = []
 
-    for server_name, server_config in MCP_SERVERS_CONFIG.items():
-        try:
-            logger.info(f"Tentando conectar ao servidor {server_name}...")
-            single_server_config = {server_name: server_config}
-            mcp_client = MultiServerMCPClient(single_server_config)
-            server_tools = await mcp_client.get_tools()
-            tools.extend(server_tools)
-            successful_servers.append(server_name)
-            logger.info(f"Servidor {server_name} conectado com sucesso")
-        except Exception as e:
-            logger.warning(f"Falha ao conectar ao servidor {server_name}: {str(e)}")
-            continue
+    started = time.perf_counter()
+    tools, successful_servers = await connect_mcp_servers(MCP_SERVERS_CONFIG, deadline, timeouts)
+    logger.info(f"{len(successful_servers)}/{len(MCP_SERVERS_CONFIG)} servidores MCP em "
+                f"{(time.perf_counter() - started) * 1000:.0f}ms: {successful_servers}")
 
     if not tools:
         logger.warning("Nenhum servidor MCP conectado, criando agente sem ferramentas externas")
@@ -153,6 +204,11 @@ async def clear_session(request: Request):
     request.session['session_id'] = str(uuid.uuid4())
     return {'success': True}
 
+@app.get("/ready")
+async def readiness():
+    """200 quando o warmup das conexões MCP terminou (mesmo com servidores fora), 503 antes"""
+    return JSONResponse(mcp_pool.warmup_state, status_code=200 if mcp_pool.warmup_state["ready"] else 503)
+
 @app.get("/", response_class=HTMLResponse)
 async def index(request: Request):
     session_id = request.session.get("session_id")
@@ -0,0 +1,162 @@
+"""
+Latência sob concorrência: MemoryManager síncrono vs AsyncMemoryManager
+
+Dispara N requisições simultâneas que fazem as mesmas chamadas de memória do
+handler /binance-agent (com uma espera simulando o LLM) e mede p50/p99 de:
+  - latência das requisições de agente;
+  - atraso de um endpoint leve (/health) atendido pelo mesmo event loop.
+
+Um segundo processo/worker é simulado por uma thread que segura o lock de
+escrita do SQLite por alguns milissegundos de tempos em tempos, como acontece
+com vários workers uvicorn escrevendo no mesmo agent_memory.db.
+
+Cada cenário roda ``--rounds`` rajadas (vale a pior) e o script termina com
+código 1 se a cauda do agente async crescer mais que ``--max-growth`` sob
+carga, passar a do caminho sync ou se o /health travar.
+
+Uso:
+    python benchmarks/bench_async_memory.py [--requests 100] [--rounds 3] [--max-growth 2.5]
+"""
+import argparse
+import asyncio
+import os
+import sys
+import sqlite3
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.memory_manager import MemoryManager
+from utils.async_memory_manager import AsyncMemoryManager
+
+LLM_LATENCY = 0.05
+LOCK_HOLD = 0.005
+
+
+def _percentile(values, pct):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index] * 1000
+
+
+async def _sync_handler(mm: MemoryManager, i: int):
+    thread_id, user_id = f"binance_{i}", f"user_{i}"
+    block = mm.build_context(thread_id, user_id, "binance", query="preço do BTC")
+    mm.update_session_activity(thread_id, "binance")
+    await asyncio.sleep(LLM_LATENCY)
+    mm.save_conversation_context(thread_id, {"type": "geral", "content": {"prompt": "p" * 80, "response": "r" * 500}}, "binance")
+    mm.save_performance_metric("binance", user_id, "response_length", 500)
+    mm.save_performance_metric("binance", user_id, "context_tokens_saved", block.tokens_saved)
+
+
+async def _async_handler(mm: AsyncMemoryManager, i: int):
+    # Mesmas chamadas, na mesma ordem, do handler /binance-agent
+    thread_id, user_id = f"binance_{i}", f"user_{i}"
+    block = await mm.build_context(thread_id, user_id, "binance", query="preço do BTC")
+    await mm.update_session_activity(thread_id, "binance")
+    await asyncio.sleep(LLM_LATENCY)
+    await mm.save_conversation_context(thread_id, {"type": "geral", "content": {"prompt": "p" * 80, "response": "r" * 500}}, "binance")
+    await mm.save_performance_metric("binance", user_id, "response_length", 500)
+    await mm.save_performance_metric("binance", user_id, "context_tokens_saved", block.tokens_saved)
+
+
+async def _timed(coro, sink):
+    start = time.perf_counter()
+    await coro
+    sink.append(time.perf_counter() - start)
+
+
+async def _health_probe(stop: asyncio.Event, sink):
+    """Simula um endpoint trivial: mede o atraso do loop para atendê-lo"""
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(0.001)
+        sink.append(max(0.0, time.perf_counter() - start - 0.001))
+
+
+def _competing_writer(db_path: str, stop: threading.Event):
+    """Outro worker gravando no mesmo arquivo e segurando o lock de escrita"""
+    conn = sqlite3.connect(db_path, timeout=10, isolation_level=None)
+    while not stop.is_set():
+        conn.execute("BEGIN IMMEDIATE")
+        time.sleep(LOCK_HOLD)
+        conn.execute("COMMIT")
+        time.sleep(LOCK_HOLD)
+    conn.close()
+
+
+async def _scenario(handler, mm, concurrency):
+    agent_latencies, probe_latencies = [], []
+    stop = asyncio.Event()
+    writer_stop = threading.Event()
+    writer = threading.Thread(target=_competing_writer, args=(mm.db_path, writer_stop))
+    writer.start()
+    probe = asyncio.create_task(_health_probe(stop, probe_latencies))
+    await asyncio.sleep(0.01)
+    await asyncio.gather(*(_timed(handler(mm, i), agent_latencies) for i in range(concurrency)))
+    stop.set()
+    await probe
+    writer_stop.set()
+    writer.join()
+    return agent_latencies, probe_latencies
+
+
+async def _settle(mm):
+    """Intervalo entre rajadas: fila write-behind gravada e índice de contexto em dia"""
+    if isinstance(mm, AsyncMemoryManager):
+        await mm.flush()
+    await asyncio.sleep(0.2)
+
+
+async def main_async(args) -> int:
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        sync_mm = MemoryManager(os.path.join(tmp, "sync.db"))
+        async_mm = AsyncMemoryManager(os.path.join(tmp, "async.db"))
+
+        print(f"{'modo':<8}{'concorrência':>14}{'agente p50':>12}{'agente p99':>12}{'/health p99':>13}  (ms, pior rodada)")
+        print("-" * 65)
+        for concurrency in (1, args.requests):
+            for label, handler, mm in (("sync", _sync_handler, sync_mm), ("async", _async_handler, async_mm)):
+                rounds = []
+                for _ in range(args.rounds):
+                    agent, probe = await _scenario(handler, mm, concurrency)
+                    rounds.append((_percentile(agent, 50), _percentile(agent, 99), _percentile(probe, 99)))
+                    await _settle(mm)
+                p50, p99, health = max(rounds, key=lambda r: r[1])
+                results[label, concurrency] = (p99, health)
+                print(f"{label:<8}{concurrency:>14}{p50:>12.1f}{p99:>12.1f}{health:>13.2f}")
+
+        sync_mm.close()
+        await async_mm.close()
+
+    # A mesma rajada não pode piorar a cauda do agente além da folga, nem travar o loop
+    idle_p99 = results["async", 1][0]
+    busy_p99, busy_health = results["async", args.requests]
+    checks = [
+        (f"p99 async com {args.requests} <= {args.max_growth:.2f}x p99 com 1",
+         busy_p99 <= idle_p99 * args.max_growth),
+        (f"p99 async com {args.requests} <= p99 sync", busy_p99 <= results["sync", args.requests][0]),
+        (f"/health p99 async <= {args.max_health_ms:.0f}ms", busy_health <= args.max_health_ms),
+    ]
+    print()
+    for name, ok in checks:
+        print(f"{'✅' if ok else '❌'} {name}")
+    return 0 if all(ok for _, ok in checks) else 1
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--requests", type=int, default=100, help="requisições simultâneas")
+    parser.add_argument("--rounds", type=int, default=3, help="rajadas por cenário (vale a pior)")
+    parser.add_argument("--max-growth", type=float, default=2.5,
+                        help="p99 do agente sob carga / p99 com uma requisição (async)")
+    parser.add_argument("--max-health-ms", type=float, default=50.0)
+    args = parser.parse_args()
+    sys.exit(asyncio.run(main_async(args)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""
+RSS e latência por turno: MemorySaver vs CompactingSqliteSaver
+
+Cada modo roda em um subprocesso separado para que o pico de RSS de um não
+contamine o outro. Um grafo LangGraph mínimo (sem LLM) responde com ~2 KB por
+turno, simulando o histórico de mensagens que cresce em cada thread.
+
+Uso:
+    python benchmarks/bench_checkpointer.py [--threads 200] [--turns 20]
+"""
+import argparse
+import asyncio
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def _build_graph(checkpointer):
+    from langchain_core.messages import AIMessage
+    from langgraph.graph import StateGraph, MessagesState, START, END
+
+    def responder(state: MessagesState):
+        return {"messages": [AIMessage(content="x" * 2048)]}
+
+    builder = StateGraph(MessagesState)
+    builder.add_node("responder", responder)
+    builder.add_edge(START, "responder")
+    builder.add_edge("responder", END)
+    return builder.compile(checkpointer=checkpointer)
+
+
+async def _worker(mode, db_dir, threads, turns):
+    from utils.memory_manager import MemoryManager
+
+    mm = MemoryManager(os.path.join(db_dir, "bench.db"), checkpointer=mode)
+    graph = _build_graph(mm.get_sqlite_saver("bench"))
+    latencies = []
+    for turn in range(turns):
+        for t in range(threads):
+            config = {"configurable": {"thread_id": f"bench_{t}"}}
+            start = time.perf_counter()
+            await graph.ainvoke({"messages": [("user", f"pergunta {turn}")]}, config)
+            latencies.append(time.perf_counter() - start)
+
+    # Recuperação: um saver novo (como após restart) enxerga as threads?
+    recovered = None
+    if mode == "sqlite":
+        await mm.aclose_checkpointers()
+        graph = _build_graph(mm.get_sqlite_saver("bench"))
+        state = await graph.aget_state({"configurable": {"thread_id": "bench_0"}})
+        recovered = len(state.values.get("messages", []))
+        await mm.aclose_checkpointers()
+
+    latencies.sort()
+    rss_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print(json.dumps({
+        "p50_ms": latencies[len(latencies) // 2] * 1000,
+        "p99_ms": latencies[int(len(latencies) * 0.99) - 1] * 1000,
+        "rss_mb": rss_kb / 1024,
+        "recovered_messages": recovered,
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--threads", type=int, default=200)
+    parser.add_argument("--turns", type=int, default=20)
+    parser.add_argument("--worker", choices=["memory", "sqlite"], help=argparse.SUPPRESS)
+    parser.add_argument("--db-dir", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        asyncio.run(_worker(args.worker, args.db_dir, args.threads, args.turns))
+        return
+
+    print(f"{'modo':<8}{'p50 (ms)':>10}{'p99 (ms)':>10}{'RSS pico (MB)':>15}{'recuperado':>12}")
+    print("-" * 55)
+    for mode in ("memory", "sqlite"):
+        with tempfile.TemporaryDirectory() as tmp:
+            output = subprocess.check_output([
+                sys.executable, __file__, "--worker", mode, "--db-dir", tmp,
+                "--threads", str(args.threads), "--turns", str(args.turns),
+            ], cwd=ROOT)
+        result = json.loads(output.decode().strip().splitlines()[-1])
+        recovered = "-" if result["recovered_messages"] is None else f"{result['recovered_messages']} msgs"
+        print(f"{mode:<8}{result['p50_ms']:>10.2f}{result['p99_ms']:>10.2f}{result['rss_mb']:>15.1f}{recovered:>12}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""
+Benchmark do formato de long_term_context.content: JSON (TEXT) vs BLOB zstd
+sem dicionário vs BLOB zstd com dicionário treinado no próprio histórico
+
+Uso:
+    python benchmarks/bench_context_compression.py [--rows 20000] [--samples 5000]
+"""
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.context_codec import ContextCodec, zstandard
+from utils.memory_manager import MemoryManager
+
+PROMPTS = [
+    "Qual o preço do {par} agora?",
+    "Faça uma análise técnica do {par} no gráfico de 4h",
+    "Quais as odds para {jogo} hoje?",
+    "Vale a pena apostar no over 2.5 em {jogo}?",
+    "Mostre o saldo da minha carteira em {par}",
+]
+PHRASES = [
+    "O {par} está sendo negociado em {valor} USDT, com variação de {pct}% nas últimas 24 horas.",
+    "O volume de negociação está acima da média e o RSI indica {estado}.",
+    "Suporte próximo de {valor} e resistência em {valor2}; atenção ao rompimento.",
+    "As odds atuais para {jogo} são {odd} para o mandante e {odd2} para o visitante.",
+    "Historicamente os confrontos diretos terminaram com mais de 2.5 gols em {pct}% dos casos.",
+    "Isto não é recomendação de investimento; avalie seu perfil de risco antes de operar.",
+]
+PARES = ["BTCUSDT", "ETHUSDT", "SOLUSDT", "BNBUSDT", "XRPUSDT"]
+JOGOS = ["Flamengo x Palmeiras", "Real Madrid x Barcelona", "Arsenal x Chelsea", "Inter x Milan"]
+
+
+def _content(rng: random.Random) -> dict:
+    fields = {
+        "par": rng.choice(PARES), "jogo": rng.choice(JOGOS),
+        "valor": f"{rng.uniform(0.5, 70000):.2f}", "valor2": f"{rng.uniform(0.5, 70000):.2f}",
+        "pct": f"{rng.uniform(-9, 9):.2f}", "odd": f"{rng.uniform(1.2, 5):.2f}",
+        "odd2": f"{rng.uniform(1.2, 5):.2f}", "estado": rng.choice(["sobrecompra", "sobrevenda", "neutralidade"]),
+    }
+    response = " ".join(p.format(**fields) for p in rng.sample(PHRASES, 4))[:500]
+    return {"prompt": rng.choice(PROMPTS).format(**fields), "response": response}
+
+
+def _fill(db_path: str, contents, compression: str):
+    mm = MemoryManager(db_path, pool_size=1, context_compression=compression)
+    with mm.pool.transaction() as conn:
+        for i, content in enumerate(contents):
+            conn.execute(*mm.context_insert(f"thread_{i % 200}", "binance", "conversation",
+                                            content, 1, f"user_{i % 50}"))
+    return mm
+
+
+def _db_size(db_path: str) -> int:
+    conn = sqlite3.connect(db_path, isolation_level=None)
+    conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    conn.execute("VACUUM")
+    content = conn.execute("SELECT SUM(length(content)) FROM long_term_context").fetchone()[0]
+    conn.close()
+    return os.path.getsize(db_path), content
+
+
+def _throughput(codec: ContextCodec, contents, repeat: int = 3):
+    best_encode = best_decode = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        encoded = [codec.encode(c) for c in contents]
+        best_encode = min(best_encode, time.perf_counter() - started)
+        started = time.perf_counter()
+        for value in encoded:
+            codec.decode(value)
+        best_decode = min(best_decode, time.perf_counter() - started)
+    return len(contents) / best_encode, len(contents) / best_decode
+
+
+def _run(tmp: str, name: str, contents, samples: int, dict_size: int):
+    db_path = os.path.join(tmp, f"{name}.db")
+    if name == "zstd+dicionário":
+        # Treina sobre o histórico já salvo em JSON e recomprime, como em produção
+        _fill(db_path, contents, "off").close()
+        mm = MemoryManager(db_path, pool_size=1, context_compression="zstd")
+        mm.train_context_dictionary(samples, dict_size, recompress=True)
+    else:
+        mm = _fill(db_path, contents, "zstd" if name == "zstd" else "off")
+    encode_rate, decode_rate = _throughput(mm.codec, contents[:5000])
+    mm.close()
+    size, content_bytes = _db_size(db_path)
+    return size, content_bytes, encode_rate, decode_rate
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rows", type=int, default=20000, help="linhas de contexto")
+    parser.add_argument("--samples", type=int, default=5000, help="linhas usadas no treino do dicionário")
+    parser.add_argument("--dict-size", type=int, default=32 * 1024, help="tamanho do dicionário (bytes)")
+    args = parser.parse_args()
+    if zstandard is None:
+        sys.exit("❌ pacote zstandard não instalado (pip install zstandard)")
+
+    rng = random.Random(42)
+    contents = [_content(rng) for _ in range(args.rows)]
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for name in ("json", "zstd", "zstd+dicionário"):
+            results[name] = _run(tmp, name, contents, args.samples, args.dict_size)
+
+    print(f"{'formato':<18}{'banco (KB)':>12}{'content (KB)':>14}{'encode (linhas/s)':>20}{'decode (linhas/s)':>20}")
+    print("-" * 84)
+    for name, (size, content_bytes, encode_rate, decode_rate) in results.items():
+        print(f"{name:<18}{size / 1024:>12.0f}{content_bytes / 1024:>14.0f}{encode_rate:>20.0f}{decode_rate:>20.0f}")
+    base = results["json"]
+    best = results["zstd+dicionário"]
+    print(f"\nbanco: {base[0] / best[0]:.2f}x menor, content: {base[1] / best[1]:.2f}x menor com dicionário")
+
+
+if __name__ == "__main__":
+    main()
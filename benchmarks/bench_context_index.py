@@ -0,0 +1,97 @@
+"""
+Benchmark do índice de recuperação: latência da busca top-k por tamanho do
+histórico e acerto contra a ordenação antiga (importance_score, created_at)
+
+Uso:
+    python benchmarks/bench_context_index.py [--sizes 1000 10000] [--queries 200]
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.memory_manager import MemoryManager
+
+TOPICS = {
+    "btc": ("Qual o preço do bitcoin hoje?", "O BTC está cotado em alta, suporte em 60 mil e resistência em 65 mil."),
+    "eth": ("Como está o ethereum?", "ETH caiu 3% nas últimas 24 horas com volume baixo na Binance."),
+    "futebol": ("Quais as odds do jogo do Flamengo?", "Flamengo paga 1.85 para vitória, empate em 3.40 na Bet365."),
+    "django": ("Como criar um model no Django?", "Defina uma classe herdando de models.Model e rode makemigrations."),
+    "react": ("Como usar useEffect no React?", "useEffect recebe uma função e a lista de dependências do componente."),
+    "docker": ("Como subir o banco com docker compose?", "Declare o serviço postgres no docker-compose.yml e rode docker compose up."),
+}
+QUERIES = {
+    "btc": "bitcoin subiu? qual a cotação do btc",
+    "eth": "o que aconteceu com o ethereum ontem",
+    "futebol": "odds do Flamengo na rodada",
+    "django": "migrations de model Django",
+    "react": "dependências do useEffect",
+    "docker": "docker compose com postgres",
+}
+
+
+def _populate(mm, thread_id, size):
+    rng = random.Random(size)
+    topics = list(TOPICS)
+    with mm.pool.transaction() as conn:
+        conn.executemany(
+            "INSERT INTO long_term_context (thread_id, agent_type, context_type, content, importance_score) "
+            "VALUES (?, 'default', 'geral', ?, ?)",
+            [(thread_id, f'{{"prompt": "{TOPICS[t][0]} #{i}", "response": "{TOPICS[t][1]}"}}', rng.randint(1, 3))
+             for i, t in ((i, rng.choice(topics)) for i in range(size))],
+        )
+
+
+def _topic_of(entry):
+    for topic, (prompt, _) in TOPICS.items():
+        if entry["content"]["prompt"].startswith(prompt):
+            return topic
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000])
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("-k", type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"{'entradas':>9}{'carga (s)':>11}{'busca (ms)':>12}{'ms/1k':>8}{'acerto índice':>15}{'acerto antigo':>15}")
+    print("-" * 70)
+    with tempfile.TemporaryDirectory() as tmp:
+        for size in args.sizes:
+            # Sem cotas: a de 500 linhas por thread despejaria quase todo o histórico sintético
+            mm = MemoryManager(os.path.join(tmp, f"ctx_{size}.db"), cache_size=0,
+                               quotas={"thread_context": 0, "user_context": 0, "user_sessions": 0})
+            try:
+                _populate(mm, "thread", size)
+                # Carga inicial em segundo plano, como no primeiro pedido de um servidor
+                start = time.perf_counter()
+                mm.context_index.start_build()
+                mm.context_index.wait_ready()
+                load = time.perf_counter() - start
+
+                topics = list(QUERIES)
+                start = time.perf_counter()
+                for i in range(args.queries):
+                    mm.context_index.search(QUERIES[topics[i % len(topics)]], "thread", "default", args.k)
+                search_ms = (time.perf_counter() - start) * 1000 / args.queries
+
+                hits = baseline = 0
+                for topic, query in QUERIES.items():
+                    found = mm.search_conversation_context("thread", query, limit=args.k)
+                    hits += sum(_topic_of(e) == topic for e in found)
+                    recent = mm.get_conversation_context("thread", limit=args.k)
+                    baseline += sum(_topic_of(e) == topic for e in recent)
+                total = len(QUERIES) * args.k
+                print(f"{size:>9}{load:>11.2f}{search_ms:>12.3f}{search_ms * 1000 / size:>8.3f}"
+                      f"{hits / total:>15.0%}{baseline / total:>15.0%}")
+            finally:
+                mm.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""
+Benchmark do classificador de intenções: tempo de carga dos pesos, vazão do
+classify_batch e acurácia (validação cruzada) contra as palavras-chave
+
+Uso:
+    python benchmarks/bench_intent_classifier.py [--batch 5000] [--folds 5]
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils import bet365_intent_parser, binance_intent_parser, intent_parser
+from utils.intent_classifier import INTENTS_DIR, IntentClassifier, load_examples
+
+PARSERS = [
+    ("intencao", intent_parser),
+    ("binance", binance_intent_parser),
+    ("bet365", bet365_intent_parser),
+]
+
+
+def _load_ms(path: str, repeat: int = 20) -> float:
+    times = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        IntentClassifier.load(path)
+        times.append((time.perf_counter() - started) * 1000)
+    return statistics.median(times)
+
+
+def _cross_validate(texts, labels, keywords, min_confidence: float, folds: int):
+    """Acurácia fora da amostra: só palavras-chave, só classificador e classificador + fallback"""
+    fold_of = np.random.default_rng(1).permutation(len(texts)) % folds
+    hits = {"palavras": 0, "classificador": 0, "combinado": 0}
+    for k in range(folds):
+        train = [i for i in range(len(texts)) if fold_of[i] != k]
+        test = [i for i in range(len(texts)) if fold_of[i] == k]
+        model = IntentClassifier.fit([texts[i] for i in train], [labels[i] for i in train])
+        results = model.classify_batch([texts[i] for i in test])
+        for i, (intent, confidence) in zip(test, results):
+            keyword = keywords(texts[i])
+            hits["palavras"] += keyword == labels[i]
+            hits["classificador"] += intent == labels[i]
+            hits["combinado"] += (intent if confidence >= min_confidence else keyword) == labels[i]
+    return {name: count / len(texts) for name, count in hits.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--batch", type=int, default=5000, help="mensagens por chamada de classify_batch")
+    parser.add_argument("--folds", type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"{'parser':<10}{'carga (ms)':>12}{'lote (msg/s)':>14}{'palavras':>10}{'classif.':>10}{'combinado':>11}")
+    print("-" * 67)
+    for name, module in PARSERS:
+        weights = os.path.join(INTENTS_DIR, f"{name}.npz")
+        texts, labels = load_examples(os.path.join(INTENTS_DIR, f"{name}.jsonl"))
+        model = IntentClassifier.load(weights)
+        batch = (texts * (args.batch // len(texts) + 1))[:args.batch]
+        started = time.perf_counter()
+        model.classify_batch(batch)
+        rate = len(batch) / (time.perf_counter() - started)
+        accuracy = _cross_validate(texts, labels, module._intent_engine.classify, module.MIN_CONFIDENCE,
+                                   args.folds)
+        print(f"{name:<10}{_load_ms(weights):>12.2f}{rate:>14.0f}{accuracy['palavras']:>10.1%}"
+              f"{accuracy['classificador']:>10.1%}{accuracy['combinado']:>11.1%}")
+
+
+if __name__ == "__main__":
+    main()
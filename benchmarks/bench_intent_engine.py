@@ -0,0 +1,171 @@
+"""
+Benchmark dos detectores de intenção: varreduras sequenciais com ``in``
+(implementação anterior) vs IntentEngine (uma regex compilada por parser)
+
+Mede só as palavras-chave: os ``detectar_intencao*`` passam primeiro pelo
+classificador, medido à parte em bench_intent_classifier.py
+
+Uso:
+    python benchmarks/bench_intent_engine.py [--prompts 100000]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.bet365_intent_parser import INTENT_RULES as BET365_RULES
+from utils.binance_intent_parser import INTENT_RULES as BINANCE_RULES
+from utils.intent_engine import IntentEngine
+from utils.intent_parser import INTENT_RULES as DEV_RULES
+
+FILLER = ("por favor me ajuda com isso hoje agora qual quero saber sobre o a de do da para "
+          "com uma um meu minha rapidamente obrigado olá tudo bem preciso entender melhor").split()
+
+
+# Implementações anteriores, copiadas como linha de base
+def legado_intencao(mensagem: str) -> str:
+    if not mensagem:
+        return "geral"
+    mensagem = mensagem.lower()
+    if "serializer" in mensagem or "model" in mensagem or "view" in mensagem or "drf" in mensagem or "django" in mensagem:
+        return "backend"
+    if "react native" in mensagem or "component" in mensagem or "hook" in mensagem or "context" or "tela" in mensagem:
+        return "frontend"
+    if "refatore" in mensagem or "melhore" in mensagem or "otimize" in mensagem:
+        return "refatoracao"
+    if "explique" in mensagem or "o que faz" in mensagem or "entenda esse código" in mensagem:
+        return "explicacao"
+    if "erro" in mensagem or "stacktrace" in mensagem or "exception" in mensagem:
+        return "debug"
+    if "snippet" in mensagem or "exemplo" in mensagem or "como faço" in mensagem:
+        return "snippet"
+    return "geral"
+
+
+def legado_binance(mensagem: str) -> str:
+    if not mensagem:
+        return "geral"
+    mensagem = mensagem.lower()
+    if any(palavra in mensagem for palavra in ["análise", "analise", "preço", "precos", "gráfico", "grafico", "tendência", "tendencia", "indicador", "rsi", "macd", "bollinger"]):
+        return "analise_mercado"
+    if any(palavra in mensagem for palavra in ["comprar", "vender", "ordem", "trade", "trading", "bot", "automatico", "automático", "estratégia", "estrategia"]):
+        return "trading_automatico"
+    if any(palavra in mensagem for palavra in ["risco", "stop", "loss", "profit", "posição", "posicao", "portfolio", "diversificação", "diversificacao"]):
+        return "gestao_risco"
+    if any(palavra in mensagem for palavra in ["relatório", "relatorio", "performance", "lucro", "prejuízo", "prejuizo", "histórico", "historico", "monitorar"]):
+        return "monitoramento"
+    if any(palavra in mensagem for palavra in ["configurar", "setup", "api", "chave", "conectar", "autenticação", "autenticacao"]):
+        return "configuracao"
+    return "geral"
+
+
+def legado_bet365(mensagem: str) -> str:
+    if not mensagem:
+        return "geral"
+    mensagem = mensagem.lower()
+    if any(palavra in mensagem for palavra in ["análise", "analise", "estatística", "estatistica", "time", "jogador", "equipe", "histórico", "historico", "forma", "desempenho"]):
+        return "analise_esportiva"
+    if any(palavra in mensagem for palavra in ["aposta", "apostar", "bet", "stake", "bankroll", "gestão", "gestao", "estratégia", "estrategia"]):
+        return "gestao_apostas"
+    if any(palavra in mensagem for palavra in ["odds", "cotação", "cotacao", "probabilidade", "value", "arbitragem", "comparar"]):
+        return "analise_odds"
+    if any(palavra in mensagem for palavra in ["futebol", "football", "soccer", "copa", "campeonato", "liga"]):
+        return "futebol"
+    elif any(palavra in mensagem for palavra in ["basquete", "basketball", "nba", "euroliga"]):
+        return "basquete"
+    elif any(palavra in mensagem for palavra in ["tênis", "tennis", "atp", "wta", "grand slam"]):
+        return "tenis"
+    elif any(palavra in mensagem for palavra in ["e-sports", "esports", "cs:go", "lol", "dota"]):
+        return "esports"
+    if any(palavra in mensagem for palavra in ["relatório", "relatorio", "roi", "lucro", "prejuízo", "prejuizo", "performance", "histórico", "historico"]):
+        return "relatorios"
+    if any(palavra in mensagem for palavra in ["configurar", "setup", "conta", "login", "api", "conectar"]):
+        return "configuracao"
+    return "geral"
+
+
+PARSERS = [
+    ("intencao", DEV_RULES, legado_intencao),
+    ("binance", BINANCE_RULES, legado_binance),
+    ("bet365", BET365_RULES, legado_bet365),
+]
+
+
+def _synthetic_rules(n_keywords: int, rng: random.Random, intents: int = 10):
+    """Tabela com ``n_keywords`` palavras inventadas, para medir o custo por palavra"""
+    letters = "abcdefghijlmnoprstuv"
+    rules = []
+    for i in range(intents):
+        words = ["".join(rng.choices(letters, k=rng.randint(4, 10))) for _ in range(n_keywords // intents)]
+        rules.append((f"intencao_{i}", words))
+    return rules
+
+
+def _scan(rules):
+    """Mesmo formato das funções anteriores: um ``any(... in ...)`` por intenção"""
+    def detectar(mensagem: str) -> str:
+        mensagem = mensagem.lower()
+        for intent, words in rules:
+            if any(palavra in mensagem for palavra in words):
+                return intent
+        return "geral"
+    return detectar
+
+
+def _prompts(rules, n: int, rng: random.Random):
+    """Frases com 8-40 palavras de enchimento e 0-2 palavras-chave das regras"""
+    keywords = [k for _, words in rules for k in words]
+    prompts = []
+    for _ in range(n):
+        words = rng.choices(FILLER, k=rng.randint(8, 40))
+        for _ in range(rng.choice([0, 1, 1, 2])):
+            words.insert(rng.randrange(len(words) + 1), rng.choice(keywords))
+        text = " ".join(words)
+        prompts.append(text.capitalize() if rng.random() < 0.3 else text)
+    return prompts
+
+
+def _rate(fn, prompts, repeat: int = 3) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for prompt in prompts:
+            fn(prompt)
+        best = min(best, time.perf_counter() - started)
+    return len(prompts) / best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--prompts", type=int, default=100000, help="mensagens por parser")
+    parser.add_argument("--scale", type=int, nargs="+", default=[50, 200, 1000],
+                        help="tamanhos de tabela sintética (palavras-chave)")
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    print(f"{'parser':<10}{'anterior (msg/s)':>18}{'engine (msg/s)':>16}{'ganho':>8}{'mesma intenção':>16}")
+    print("-" * 68)
+    for name, rules, legacy in PARSERS:
+        engine = IntentEngine(rules).classify
+        prompts = _prompts(rules, args.prompts, rng)
+        old_rate = _rate(legacy, prompts)
+        new_rate = _rate(engine, prompts)
+        same = sum(legacy(p) == engine(p) for p in prompts) / len(prompts)
+        print(f"{name:<10}{old_rate:>18.0f}{new_rate:>16.0f}{new_rate / old_rate:>7.2f}x{same:>15.1%}")
+    print("'intencao' diverge por correção: a versão anterior classificava quase tudo como frontend")
+
+    print(f"\n{'palavras':<10}{'any/in (msg/s)':>18}{'engine (msg/s)':>16}{'ganho':>8}")
+    print("-" * 52)
+    for n_keywords in args.scale:
+        rules = _synthetic_rules(n_keywords, rng)
+        prompts = _prompts(rules, args.prompts // 10, rng)
+        old_rate = _rate(_scan(rules), prompts)
+        new_rate = _rate(IntentEngine(rules).classify, prompts)
+        print(f"{n_keywords:<10}{old_rate:>18.0f}{new_rate:>16.0f}{new_rate / old_rate:>7.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""
+Benchmark de partida a frio: tempo do início do processo até as tools prontas
+(agente montável) e até a primeira chamada de tool respondida, com e sem o
+cache de schemas em disco
+
+Uso:
+    python benchmarks/bench_mcp_cold_start.py [--config MCP_BINANCE] [--runs 3]
+    python benchmarks/bench_mcp_cold_start.py --config servidores.json --tool soma --args '{"a": 1, "b": 2}'
+
+``--config`` é o nome de um dict de mcp_servers.py (precisa de
+SMITHERY_API_KEY e rede) ou um JSON ``{nome: config}``. Cada medida roda num
+processo novo; a primeira rodada com cache só o preenche e é descartada.
+"""
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+STARTED = time.perf_counter()
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def _load_config(name: str) -> dict:
+    if name.endswith(".json"):
+        with open(name, encoding="utf-8") as f:
+            return json.load(f)
+    import mcp_servers
+    from utils.toolsets import union_servers
+    config = getattr(mcp_servers, name)
+    if all("url" in c or "command" in c for c in config.values()):
+        return config
+    return union_servers(config.values())
+
+
+async def _child(args):
+    """Um processo: tools prontas e primeira chamada, em ms desde o início do processo"""
+    from utils.mcp_pool import MCPPool
+    from utils.tool_schema_cache import ToolSchemaCache
+
+    cache = ToolSchemaCache(args.cache_dir) if args.cache_dir else None
+    pool = MCPPool(schema_cache=cache)
+    tools = await pool.acquire_tools(_load_config(args.config))
+    ready_ms = (time.perf_counter() - STARTED) * 1000
+    tool = next((t for t in tools if t.name == args.tool), tools[0] if tools else None)
+    answer_ms = None
+    if tool is not None:
+        try:
+            await tool.ainvoke(json.loads(args.args))
+        except Exception as e:
+            print(f"⚠️ {tool.name}: {e}", file=sys.stderr)
+        answer_ms = (time.perf_counter() - STARTED) * 1000
+    await pool.aclose()
+    print(json.dumps({"ready_ms": ready_ms, "answer_ms": answer_ms, "tools": len(tools)}))
+
+
+def _run(args, cache_dir):
+    command = [sys.executable, os.path.abspath(__file__), "--child", "--config", args.config,
+               "--args", args.args] + (["--tool", args.tool] if args.tool else []) \
+        + (["--cache-dir", cache_dir] if cache_dir else [])
+    output = subprocess.run(command, capture_output=True, text=True, check=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--config", default="MCP_BINANCE")
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--tool", help="tool chamada na primeira resposta (padrão: a primeira)")
+    parser.add_argument("--args", default="{}", help="argumentos JSON da tool")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--cache-dir", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        asyncio.run(_child(args))
+        return
+
+    cache_dir = tempfile.mkdtemp(prefix="mcp_cache_")
+    try:
+        _run(args, cache_dir)
+        results = {"sem cache": [_run(args, None) for _ in range(args.runs)],
+                   "com cache": [_run(args, cache_dir) for _ in range(args.runs)]}
+    finally:
+        shutil.rmtree(cache_dir, ignore_errors=True)
+
+    print(f"{'':<12}{'tools prontas (ms)':>20}{'1ª resposta (ms)':>18}")
+    print("-" * 50)
+    for label, runs in results.items():
+        answers = [r["answer_ms"] for r in runs if r["answer_ms"] is not None]
+        print(f"{label:<12}{statistics.median(r['ready_ms'] for r in runs):>20.0f}"
+              f"{statistics.median(answers) if answers else float('nan'):>18.0f}")
+
+
+if __name__ == "__main__":
+    main()
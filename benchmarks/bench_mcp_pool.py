@@ -0,0 +1,71 @@
+"""
+Benchmark do carregamento de tools MCP: um MultiServerMCPClient novo por
+pedido (implementação anterior) vs pool de sessões compartilhado por endpoint
+
+Uso:
+    python benchmarks/bench_mcp_pool.py [--config MCP_BINANCE] [--requests 10]
+
+Conecta aos servidores de verdade (precisa de SMITHERY_API_KEY e rede).
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import mcp_servers
+from langchain_mcp_adapters.client import MultiServerMCPClient
+from utils.mcp_pool import MCPPool
+from utils.toolsets import server_identity
+
+
+def _flatten(config: dict) -> dict:
+    """MCP_DEV_CONFIG é {intenção: {nome: config}}; os demais já são {nome: config}"""
+    if all("url" in c or "command" in c for c in config.values()):
+        return dict(config)
+    return {f"{intent}.{name}": c for intent, servers in config.items() for name, c in servers.items()}
+
+
+async def _legacy(config: dict, requests: int) -> float:
+    started = time.perf_counter()
+    for _ in range(requests):
+        await MultiServerMCPClient(config).get_tools()
+    return (time.perf_counter() - started) * 1000 / requests
+
+
+async def _pooled(pool: MCPPool, config: dict, requests: int) -> float:
+    started = time.perf_counter()
+    for _ in range(requests):
+        await pool.acquire_tools(config)
+    return (time.perf_counter() - started) * 1000 / requests
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--config", default="MCP_BINANCE",
+                        help="MCP_SERVERS_CONFIG, MCP_DEV_CONFIG, MCP_BINANCE ou MCP_BET365")
+    parser.add_argument("--requests", type=int, default=10, help="pedidos simulados")
+    args = parser.parse_args()
+
+    config = _flatten(getattr(mcp_servers, args.config))
+    endpoints = len({server_identity(c) for c in config.values()})
+    print(f"📋 {args.config}: {len(config)} nomes lógicos, {endpoints} endpoints distintos")
+
+    legacy_ms = await _legacy(config, args.requests)
+    pool = MCPPool()
+    pooled_ms = await _pooled(pool, config, args.requests)
+    stats = pool.stats()
+    await pool.aclose()
+
+    print(f"{'':<12}{'ms/pedido':>12}{'conexões/pedido':>18}")
+    print("-" * 42)
+    print(f"{'anterior':<12}{legacy_ms:>12.0f}{len(config):>18}")
+    print(f"{'pool':<12}{pooled_ms:>12.0f}{stats['opened'] / args.requests:>18.2f}")
+    print(f"\nreuso: {stats['reuse_rate']:.1%}  conexões poupadas por alias: {stats['connections_saved']}  "
+          f"carga: {stats['load_ms_avg']:.0f}ms média / {stats['load_ms_max']:.0f}ms máx")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
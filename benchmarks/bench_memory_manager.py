@@ -0,0 +1,108 @@
+"""
+Micro-benchmark da camada de memória: conexão por chamada vs pool WAL
+(com e sem a fila write-behind)
+
+Uso:
+    python benchmarks/bench_memory_manager.py [--ops 2000]
+"""
+import argparse
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.memory_manager import MemoryManager
+
+
+class _ConnectPerCallPool:
+    """Reproduz o comportamento antigo: sqlite3.connect() + close() a cada operação"""
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+
+    @contextmanager
+    def connection(self):
+        conn = sqlite3.connect(self.db_path)
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    @contextmanager
+    def transaction(self):
+        conn = sqlite3.connect(self.db_path)
+        try:
+            yield conn
+            conn.commit()
+        finally:
+            conn.close()
+
+    def close(self):
+        pass
+
+
+class LegacyMemoryManager(MemoryManager):
+    def __init__(self, db_path):
+        super().__init__(db_path)
+        self.pool.close()
+        self.pool = _ConnectPerCallPool(db_path)
+        # Volta ao journal padrão (rollback) usado antes do pool
+        with self.pool.connection() as conn:
+            conn.execute("PRAGMA journal_mode=DELETE")
+
+
+def _operations(mm):
+    """Operações executadas por requisição nos servidores de agentes"""
+    return {
+        "save_conversation_context": lambda i: mm.save_conversation_context(
+            f"thread_{i % 50}", {"type": "geral", "content": {"prompt": "p" * 80, "response": "r" * 500}, "importance": 2}, "binance"),
+        "get_conversation_context": lambda i: mm.get_conversation_context(f"thread_{i % 50}", "binance", limit=5),
+        "save_user_preference": lambda i: mm.save_user_preference(f"user_{i % 50}", f"key_{i % 5}", "valor", "binance"),
+        "get_user_preferences": lambda i: mm.get_user_preferences(f"user_{i % 50}", "binance"),
+        "update_session_activity": lambda i: mm.update_session_activity(f"thread_{i % 50}"),
+        "save_performance_metric": lambda i: mm.save_performance_metric("binance", f"user_{i % 50}", "response_length", float(i)),
+        "get_performance_metrics": lambda i: mm.get_performance_metrics("binance", f"user_{i % 50}", days=1),
+    }
+
+
+def _run(mm, ops):
+    results = {}
+    for name, fn in _operations(mm).items():
+        start = time.perf_counter()
+        for i in range(ops):
+            fn(i)
+        elapsed = time.perf_counter() - start
+        results[name] = ops / elapsed
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--ops", type=int, default=2000, help="operações por método")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        legacy = LegacyMemoryManager(os.path.join(tmp, "legacy.db"))
+        pooled = MemoryManager(os.path.join(tmp, "pooled.db"))
+        batched = MemoryManager(os.path.join(tmp, "batched.db"), write_behind=True)
+        try:
+            before = _run(legacy, args.ops)
+            after = _run(pooled, args.ops)
+            behind = _run(batched, args.ops)
+        finally:
+            pooled.close()
+            batched.close()
+
+    print(f"{'método':<28}{'antes (ops/s)':>16}{'pool (ops/s)':>16}{'write-behind':>14}{'ganho':>9}")
+    print("-" * 83)
+    for name in before:
+        best = max(after[name], behind[name])
+        print(f"{name:<28}{before[name]:>16.0f}{after[name]:>16.0f}{behind[name]:>14.0f}{best / before[name]:>8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
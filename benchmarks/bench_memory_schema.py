@@ -0,0 +1,101 @@
+"""
+Planos de query e latência do MemoryManager antes/depois da migração de índices
+
+Popula um banco com o schema antigo (sem índices) com N linhas por tabela,
+mede cada query do MemoryManager, aplica as migrações e mede de novo.
+
+Uso:
+    python benchmarks/bench_memory_schema.py [--rows 1000000]
+"""
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils import memory_manager as mm
+from utils.memory_schema import create_tables, apply_migrations
+
+USERS = 20000
+QUERIES = {
+    "get_conversation_context": (mm.SQL_SELECT_CONTEXT, lambda r: (f"thread_{r.randrange(USERS)}", "binance", 5)),
+    "get_user_preferences": (mm.SQL_SELECT_PREFERENCES, lambda r: (f"user_{r.randrange(USERS)}", "binance")),
+    "update_session_activity": (mm.SQL_TOUCH_SESSION, lambda r: (datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S"), f"thread_{r.randrange(USERS)}")),
+    "get_performance_metrics": (mm.SQL_SELECT_METRICS, lambda r: ("binance", f"user_{r.randrange(USERS)}", datetime.now() - timedelta(days=30))),
+    "cleanup (context)": ("SELECT COUNT(*) FROM long_term_context WHERE created_at < ? AND importance_score < 3",
+                          lambda r: (datetime.now() - timedelta(days=300),)),
+    "cleanup (metrics)": ("SELECT COUNT(*) FROM performance_metrics WHERE timestamp < ?",
+                          lambda r: (datetime.now() - timedelta(days=300),)),
+}
+
+
+def _populate(conn, rows):
+    rnd = random.Random(42)
+    now = datetime.now()
+
+    def stamp():
+        return (now - timedelta(seconds=rnd.randrange(365 * 86400))).strftime("%Y-%m-%d %H:%M:%S")
+
+    conn.executemany(
+        "INSERT INTO long_term_context (thread_id, agent_type, context_type, content, importance_score, created_at) VALUES (?, 'binance', 'geral', '{}', ?, ?)",
+        ((f"thread_{rnd.randrange(USERS)}", rnd.randint(1, 3), stamp()) for _ in range(rows)))
+    # Duplicatas acumuladas pelo antigo INSERT OR REPLACE sem chave única
+    conn.executemany(
+        "INSERT INTO user_preferences (user_id, agent_type, preference_key, preference_value) VALUES (?, 'binance', ?, ?)",
+        ((f"user_{rnd.randrange(USERS)}", f"key_{rnd.randrange(5)}", str(i)) for i in range(rows)))
+    conn.executemany(
+        "INSERT INTO agent_sessions (session_id, agent_type, user_id, thread_id) VALUES (?, 'binance', ?, ?)",
+        ((f"session_{i}", f"user_{i % USERS}", f"thread_{i % USERS}") for i in range(rows)))
+    conn.executemany(
+        "INSERT INTO performance_metrics (agent_type, user_id, metric_type, metric_value, timestamp) VALUES ('binance', ?, 'response_length', ?, ?)",
+        ((f"user_{rnd.randrange(USERS)}", float(i), stamp()) for i in range(rows)))
+    conn.commit()
+
+
+def _measure(conn, label, repeat):
+    print(f"\n== {label} ==")
+    for name, (sql, params) in QUERIES.items():
+        rnd = random.Random(7)
+        plan = " | ".join(row[-1] for row in conn.execute("EXPLAIN QUERY PLAN " + sql, params(rnd)))
+        start = time.perf_counter()
+        for _ in range(repeat):
+            conn.execute(sql, params(rnd)).fetchall()
+        conn.rollback()
+        elapsed_ms = (time.perf_counter() - start) / repeat * 1000
+        print(f"{name:<26}{elapsed_ms:>10.3f} ms  {plan}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rows", type=int, default=1_000_000, help="linhas por tabela")
+    parser.add_argument("--repeat", type=int, default=20, help="execuções por query")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        conn = sqlite3.connect(os.path.join(tmp, "schema.db"))
+        conn.execute("PRAGMA journal_mode=WAL")
+        create_tables(conn)
+
+        start = time.perf_counter()
+        _populate(conn, args.rows)
+        print(f"📦 {args.rows} linhas por tabela em {time.perf_counter() - start:.1f}s")
+
+        _measure(conn, "antes (sem índices)", max(1, args.repeat // 10))
+
+        start = time.perf_counter()
+        apply_migrations(conn)
+        conn.commit()
+        prefs = conn.execute("SELECT COUNT(*) FROM user_preferences").fetchone()[0]
+        print(f"🗄️ Migração em {time.perf_counter() - start:.1f}s; user_preferences deduplicada: {args.rows} -> {prefs}")
+
+        _measure(conn, "depois (migrado)", args.repeat)
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
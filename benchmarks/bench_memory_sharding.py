@@ -0,0 +1,90 @@
+"""
+Benchmark de escrita com 4 agentes concorrentes (um processo por agente,
+como os servidores uvicorn): banco único vs um shard por agent_type
+
+Uso:
+    python benchmarks/bench_memory_sharding.py [--ops 1500] [--user-shards 1]
+"""
+import argparse
+import multiprocessing as mp
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.memory_manager import MemoryManager
+from utils.memory_router import ShardedMemoryManager
+
+AGENTS = ["default", "main", "binance", "bet365"]
+
+
+def _agent(db_path, agent_type, sharded, user_shards, ops, start, results):
+    if sharded:
+        mm = ShardedMemoryManager(db_path, user_shards=user_shards)
+    else:
+        mm = MemoryManager(db_path)
+    start.wait()
+    latencies = []
+    began = time.perf_counter()
+    for i in range(ops):
+        user_id = f"user_{i % 20}"
+        thread_id = f"{agent_type}_{user_id}"
+        t0 = time.perf_counter()
+        if i % 3 == 0:
+            mm.save_conversation_context(thread_id, {"type": "geral", "content": {
+                "prompt": "p" * 80, "response": "r" * 400}, "importance": 2}, agent_type)
+        elif i % 3 == 1:
+            mm.save_performance_metric(agent_type, user_id, "response_time", float(i))
+        else:
+            mm.save_user_preference(user_id, f"key_{i % 5}", "valor", agent_type)
+        latencies.append(time.perf_counter() - t0)
+    results.put((agent_type, ops / (time.perf_counter() - began), sorted(latencies)))
+    mm.close()
+
+
+def _run(db_path, sharded, user_shards, ops):
+    # Cria schema/shards antes de medir
+    setup = ShardedMemoryManager(db_path, user_shards=user_shards) if sharded else MemoryManager(db_path)
+    if sharded:
+        for agent_type in AGENTS:
+            setup.shards(agent_type)
+    setup.close()
+
+    start, results = mp.Event(), mp.Queue()
+    procs = [mp.Process(target=_agent, args=(db_path, a, sharded, user_shards, ops, start, results))
+             for a in AGENTS]
+    for p in procs:
+        p.start()
+    time.sleep(1.0)
+    began = time.perf_counter()
+    start.set()
+    rows = [results.get() for _ in procs]
+    elapsed = time.perf_counter() - began
+    for p in procs:
+        p.join()
+    latencies = sorted(l for _, _, lat in rows for l in lat)
+    p99 = latencies[int(len(latencies) * 0.99)] * 1000
+    return len(AGENTS) * ops / elapsed, p99, {a: rate for a, rate, _ in rows}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--ops", type=int, default=1500, help="escritas por agente")
+    parser.add_argument("--user-shards", type=int, default=1, help="shards por agent_type")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        single = _run(os.path.join(tmp, "single.db"), False, 1, args.ops)
+        sharded = _run(os.path.join(tmp, "sharded.db"), True, args.user_shards, args.ops)
+
+    print(f"{'modo':<16}{'total (ops/s)':>15}{'p99 (ms)':>10}" + "".join(f"{a:>10}" for a in AGENTS))
+    print("-" * (41 + 10 * len(AGENTS)))
+    for name, (total, p99, per_agent) in (("banco único", single), ("sharded", sharded)):
+        print(f"{name:<16}{total:>15.0f}{p99:>10.2f}" + "".join(f"{per_agent[a]:>10.0f}" for a in AGENTS))
+    print(f"\nganho de throughput: {sharded[0] / single[0]:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -68,8 +68,8 @@ async def main():
     config = {"configurable": {"thread_id": "bet365_agent_001"}}
 
     # Inicializar gerenciador de memória
-    from utils.memory_manager import PersistentMemoryManager
-    memory_manager = PersistentMemoryManager()
+    from utils.memory_router import create_memory_manager
+    memory_manager = create_memory_manager()
     
     # Gerar IDs únicos
     import hashlib
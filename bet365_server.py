@@ -1,3 +1,4 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, Request, Form
 from fastapi.responses import HTMLResponse, JSONResponse
 from fastapi.templating import Jinja2Templates
@@ -8,21 +9,34 @@ from datetime import datetime
 
 from prompts_agents import agent_bet365
 from mcp_servers import MCP_BET365
-from utils.bet365_intent_parser import detectar_intencao_bet365, carregar_tools_bet365
+from utils.bet365_intent_parser import ranquear_intencoes_bet365, carregar_tools_bet365
+from utils.mcp_pool import mcp_pool
 from utils.schemas import FormPrompt
-from utils.memory_manager import PersistentMemoryManager
+from utils.async_memory_manager import AsyncMemoryManager
 
 from langchain.chat_models import init_chat_model
 from langgraph.prebuilt import create_react_agent
 
 import asyncio
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Agenda a retenção da memória, aquece as conexões MCP e fecha tudo ao encerrar o servidor"""
+    memory_manager.start_retention()
+    # Warmup em segundo plano: o servidor já atende, /ready diz quando as tools estão prontas
+    app.state.mcp_warmup = asyncio.create_task(mcp_pool.warmup(MCP_BET365))
+    mcp_pool.start_refresh(MCP_BET365)
+    yield
+    app.state.mcp_warmup.cancel()
+    await mcp_pool.aclose()
+    await memory_manager.close()
+
+app = FastAPI(lifespan=lifespan)
 templates = Jinja2Templates(directory="templates")
 app.mount("/static", StaticFiles(directory="static"), name="static")
 
 # Inicializar gerenciador de memória
-memory_manager = PersistentMemoryManager()
+memory_manager = AsyncMemoryManager()
 agent_cache = {}
 
 def get_user_id(request: Request) -> str:
@@ -53,27 +67,17 @@ async def process_bet365_prompt(request: Request, mensagem: str = Form(...)):
         print(f"📝 Prompt: {prompt[:100]}...")
         
         # Detectar intenção
-        intencao = detectar_intencao_bet365(prompt)
-        print(f"🎯 Intenção detectada: {intencao}")
-        
-        # Recuperar contexto anterior
-        contexto_anterior = memory_manager.get_conversation_context(thread_id, "bet365", limit=5)
-        user_preferences = memory_manager.get_user_preferences(user_id, "bet365")
-        
-        # Construir contexto enriquecido
-        contexto_enriquecido = ""
-        if contexto_anterior:
-            contexto_enriquecido += "\n\n[CONTEXTO APOSTAS ANTERIOR]:\n"
-            for ctx in contexto_anterior:
-                contexto_enriquecido += f"- {ctx['type']}: {str(ctx['content'])[:200]}...\n"
+        ranking = ranquear_intencoes_bet365([prompt])[0]
+        intencao = ranking[0][0]
+        print(f"🎯 Intenções detectadas: {ranking}")
         
-        if user_preferences:
-            contexto_enriquecido += "\n[PREFERÊNCIAS DE APOSTAS]:\n"
-            for key, value in user_preferences.items():
-                contexto_enriquecido += f"- {key}: {value}\n"
+        # Contexto anterior + preferências, dentro do orçamento de tokens
+        bloco_contexto = await memory_manager.build_context(thread_id, user_id, "bet365", query=prompt)
+        contexto_enriquecido = bloco_contexto.text
+        print(f"🧮 Contexto: {bloco_contexto.tokens} tokens ({bloco_contexto.tokens_saved} economizados)")
         
         # Carregar ferramentas
-        tools = await carregar_tools_bet365(intencao, MCP_BET365)
+        tools = await carregar_tools_bet365(ranking, MCP_BET365)
         print(f"🔧 Tools carregadas: {len(tools)}")
         
         # Criar ou reutilizar agente
@@ -86,6 +90,7 @@ async def process_bet365_prompt(request: Request, mensagem: str = Form(...)):
                 tools=tools,
                 prompt=agent_bet365 + contexto_enriquecido,
                 checkpointer=checkpointer,
+                pre_model_hook=memory_manager.history_window("bet365"),
             )
             agent_cache[thread_id] = agente
             print(f"🤖 Novo agente Bet365 criado para {thread_id}")
@@ -94,7 +99,7 @@ async def process_bet365_prompt(request: Request, mensagem: str = Form(...)):
             print(f"♻️ Reutilizando agente Bet365 para {thread_id}")
         
         # Atualizar atividade da sessão
-        memory_manager.update_session_activity(thread_id)
+        await memory_manager.update_session_activity(thread_id, "bet365")
         
         config = {"configurable": {"thread_id": thread_id}}
         mensagem_usuario = {"role": "user", "content": prompt}
@@ -122,7 +127,7 @@ async def process_bet365_prompt(request: Request, mensagem: str = Form(...)):
             resposta_final = "Desculpe, não consegui processar sua solicitação de apostas. Tente reformular."
         
         # Salvar contexto importante
-        memory_manager.save_conversation_context(thread_id, {
+        await memory_manager.save_conversation_context(thread_id, {
             'type': intencao,
             'content': {
                 'prompt': prompt,
@@ -131,13 +136,14 @@ async def process_bet365_prompt(request: Request, mensagem: str = Form(...)):
                 'tools_used': len(tools)
             },
             'importance': 3 if intencao in ['gestao_apostas', 'analise_odds'] else 2
-        }, "bet365")
+        }, "bet365", user_id)
         
         # Salvar métrica de performance
-        memory_manager.save_performance_metric("bet365", user_id, "response_length", len(resposta_final))
+        await memory_manager.save_performance_metric("bet365", user_id, "response_length", len(resposta_final))
+        await memory_manager.save_performance_metric("bet365", user_id, "context_tokens_saved", bloco_contexto.tokens_saved)
         
         print(f"✅ Resposta Bet365 gerada: {len(resposta_final)} caracteres")
-        return JSONResponse({"resposta": resposta_final, "intencao": intencao})
+        return JSONResponse({"resposta": resposta_final, "intencao": intencao, "intencoes": ranking})
         
     except Exception as e:
         print(f"❌ Erro no Bet365 Agent: {e}")
@@ -164,7 +170,7 @@ async def save_bet365_preference(request: Request, key: str = Form(...), value:
     """Salva preferência do usuário para Bet365"""
     try:
         user_id = get_user_id(request)
-        memory_manager.save_user_preference(user_id, key, value, "bet365")
+        await memory_manager.save_user_preference(user_id, key, value, "bet365")
         return JSONResponse({"message": "Preferência Bet365 salva com sucesso"})
     except Exception as e:
         return JSONResponse({"erro": str(e)}, status_code=500)
@@ -174,14 +180,33 @@ async def get_bet365_metrics(request: Request):
     """Recupera métricas de performance do Bet365"""
     try:
         user_id = get_user_id(request)
-        metrics = memory_manager.get_performance_metrics("bet365", user_id)
-        return JSONResponse({"metrics": metrics})
+        metrics = await memory_manager.get_performance_metrics("bet365", user_id, limit=50)
+        summary = await memory_manager.get_metrics_summary("bet365", days=30)
+        return JSONResponse({"metrics": metrics, "summary": summary})
+    except Exception as e:
+        return JSONResponse({"erro": str(e)}, status_code=500)
+
+@app.get("/search_context")
+async def search_bet365_context(request: Request, q: str, page: int = 1, page_size: int = 10):
+    """Busca textual no histórico Bet365 (ranqueada, paginada e com trechos)"""
+    try:
+        user_id = get_user_id(request)
+        thread_id = get_thread_id(user_id)
+        resultado = await memory_manager.search_context(thread_id, q, "bet365", page, page_size)
+        return JSONResponse({**resultado, "thread_id": thread_id})
     except Exception as e:
         return JSONResponse({"erro": str(e)}, status_code=500)
 
+@app.get("/ready")
+async def readiness():
+    """200 quando o warmup das conexões MCP terminou (mesmo com servidores fora), 503 antes"""
+    return JSONResponse(mcp_pool.warmup_state, status_code=200 if mcp_pool.warmup_state["ready"] else 503)
+
 @app.get("/health")
 async def health_check():
-    return {"status": "ok", "service": "bet365-agent", "memory": "enabled"}
+    return {"status": "ok", "service": "bet365-agent", "memory": "enabled", "cache": memory_manager.cache_stats(),
+            "retention": memory_manager.retention_stats(), "mcp": mcp_pool.stats(),
+            "quota": await memory_manager.get_quota_usage(agent_type="bet365")}
 
 if __name__ == "__main__":
     import uvicorn
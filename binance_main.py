@@ -6,7 +6,7 @@ from langgraph.prebuilt import create_react_agent
 from utils.binance_intent_parser import detectar_intencao_binance, carregar_tools_binance
 from mcp_servers import MCP_BINANCE
 from prompts_agents import agent_binance
-from utils.memory_manager import PersistentMemoryManager
+from utils.memory_router import create_memory_manager
 
 async def main():
     print("🚀 Agente Binance Trading com Memória Persistente")
@@ -14,7 +14,7 @@ async def main():
     print("=" * 60)
     
     # Inicializar gerenciador de memória
-    memory_manager = PersistentMemoryManager()
+    memory_manager = create_memory_manager()
     
     # Gerar IDs únicos
     user_id = hashlib.md5("binance_user".encode()).hexdigest()[:16]
@@ -58,9 +58,13 @@ async def main():
             continue
         
         if entrada.lower() == 'metrics':
-            metrics = memory_manager.get_performance_metrics("binance", user_id)
-            print(f"\n📊 Métricas de Trading dos últimos 30 dias: {len(metrics)} registros")
-            for metric in metrics[-5:]:  # Últimas 5
+            resumo = memory_manager.get_metrics_summary("binance", days=30)
+            total = sum(m['count'] for m in resumo.values())
+            print(f"\n📊 Métricas de Trading dos últimos 30 dias: {total} registros")
+            for tipo, m in resumo.items():
+                print(f"  • {tipo}: média {m['avg']:.2f} | p50 {m['p50']:.2f} | p95 {m['p95']:.2f} | p99 {m['p99']:.2f}")
+            metrics = memory_manager.get_performance_metrics("binance", user_id, limit=5)
+            for metric in metrics:  # Últimas 5
                 print(f"  • {metric['type']}: {metric['value']} ({metric['timestamp']})")
             continue
             
@@ -72,21 +76,10 @@ async def main():
         intencao = detectar_intencao_binance(entrada)
         print(f"📍 Intenção detectada: {intencao}")
         
-        # Recuperar contexto anterior
-        contexto_anterior = memory_manager.get_conversation_context(thread_id, "binance", limit=5)
-        user_preferences = memory_manager.get_user_preferences(user_id, "binance")
-        
-        # Construir contexto enriquecido
-        contexto_enriquecido = ""
-        if contexto_anterior:
-            contexto_enriquecido += "\n\n[CONTEXTO TRADING ANTERIOR]:\n"
-            for ctx in contexto_anterior:
-                contexto_enriquecido += f"- {ctx['type']}: {str(ctx['content'])[:200]}...\n"
-        
-        if user_preferences:
-            contexto_enriquecido += "\n[PREFERÊNCIAS DE TRADING]:\n"
-            for key, value in user_preferences.items():
-                contexto_enriquecido += f"- {key}: {value}\n"
+        # Contexto anterior + preferências, dentro do orçamento de tokens
+        bloco_contexto = memory_manager.build_context(thread_id, user_id, "binance", query=entrada)
+        contexto_enriquecido = bloco_contexto.text
+        print(f"🧮 Contexto: {bloco_contexto.tokens} tokens ({bloco_contexto.tokens_saved} economizados)")
         
         # Carregar ferramentas
         tools = await carregar_tools_binance(intencao, MCP_BINANCE)
@@ -98,10 +91,11 @@ async def main():
             tools=tools,
             prompt=agent_binance + contexto_enriquecido,
             checkpointer=checkpointer,
+            pre_model_hook=memory_manager.history_window("binance"),
         )
         
         # Atualizar atividade da sessão
-        memory_manager.update_session_activity(thread_id)
+        memory_manager.update_session_activity(thread_id, "binance")
         
         mensagem = {"role": "user", "content": entrada}
         
@@ -132,11 +126,12 @@ async def main():
                 'tools_used': len(tools)
             },
             'importance': 3 if intencao in ['trading_automatico', 'gestao_risco'] else 2
-        }, "binance")
+        }, "binance", user_id)
         
         # Salvar métricas de performance
         memory_manager.save_performance_metric("binance", user_id, "response_time", response_time)
         memory_manager.save_performance_metric("binance", user_id, "response_length", len(response_content))
+        memory_manager.save_performance_metric("binance", user_id, "context_tokens_saved", bloco_contexto.tokens_saved)
         
         print("-" * 50)
 
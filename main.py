@@ -7,14 +7,14 @@ from langgraph.prebuilt import create_react_agent
 from langchain_mcp_adapters.client import MultiServerMCPClient
 from prompts_agents import agent_integration_ml
 from mcp_servers import MCP_SERVERS_CONFIG
-from utils.memory_manager import PersistentMemoryManager
+from utils.memory_router import create_memory_manager
 
 async def main():
     print("🚀 Agente Principal de Integração ML com Memória Persistente")
     print("=" * 60)
     
     # Inicializar gerenciador de memória
-    memory_manager = PersistentMemoryManager()
+    memory_manager = create_memory_manager()
     
     # Gerar IDs únicos
     user_id = hashlib.md5("main_user".encode()).hexdigest()[:16]
@@ -34,27 +34,17 @@ async def main():
         print(f"⚠️ Erro ao carregar MCP tools: {e}")
         tools = []
     
-    # Recuperar contexto anterior
-    contexto_anterior = memory_manager.get_conversation_context(thread_id, "main", limit=5)
-    user_preferences = memory_manager.get_user_preferences(user_id, "main")
-    
-    # Construir contexto enriquecido
-    contexto_enriquecido = ""
-    if contexto_anterior:
-        contexto_enriquecido += "\n\n[CONTEXTO ANTERIOR]:\n"
-        for ctx in contexto_anterior:
-            contexto_enriquecido += f"- {ctx['type']}: {str(ctx['content'])[:200]}...\n"
-    
-    if user_preferences:
-        contexto_enriquecido += "\n[PREFERÊNCIAS DO USUÁRIO]:\n"
-        for key, value in user_preferences.items():
-            contexto_enriquecido += f"- {key}: {value}\n"
+    # Contexto anterior + preferências, dentro do orçamento de tokens
+    bloco_contexto = memory_manager.build_context(thread_id, user_id, "main")
+    contexto_enriquecido = bloco_contexto.text
+    print(f"🧮 Contexto: {bloco_contexto.tokens} tokens ({bloco_contexto.tokens_saved} economizados)")
     
     execucao_agente = create_react_agent(
         model=llm,
         tools=tools,
         prompt=agent_integration_ml + contexto_enriquecido,
-        checkpointer=checkpointer
+        checkpointer=checkpointer,
+        pre_model_hook=memory_manager.history_window("main")
     )
 
     config = {'configurable': {'thread_id': thread_id}}
@@ -92,14 +82,18 @@ async def main():
             continue
         
         if user_input.lower() == 'metrics':
-            metrics = memory_manager.get_performance_metrics("main", user_id)
-            print(f"\n📊 Métricas dos últimos 30 dias: {len(metrics)} registros")
-            for metric in metrics[-5:]:  # Últimas 5
+            resumo = memory_manager.get_metrics_summary("main", days=30)
+            total = sum(m['count'] for m in resumo.values())
+            print(f"\n📊 Métricas dos últimos 30 dias: {total} registros")
+            for tipo, m in resumo.items():
+                print(f"  • {tipo}: média {m['avg']:.2f} | p50 {m['p50']:.2f} | p95 {m['p95']:.2f} | p99 {m['p99']:.2f}")
+            metrics = memory_manager.get_performance_metrics("main", user_id, limit=5)
+            for metric in metrics:  # Últimas 5
                 print(f"  • {metric['type']}: {metric['value']} ({metric['timestamp']})")
             continue
         
         # Atualizar atividade da sessão
-        memory_manager.update_session_activity(thread_id)
+        memory_manager.update_session_activity(thread_id, "main")
         
         mensagem = {'role': 'user', 'content': user_input}
         
@@ -131,11 +125,12 @@ async def main():
                 'tools_used': len(tools)
             },
             'importance': 2 if len(response_content) > 100 else 1
-        }, "main")
+        }, "main", user_id)
         
         # Salvar métricas de performance
         memory_manager.save_performance_metric("main", user_id, "response_time", response_time)
         memory_manager.save_performance_metric("main", user_id, "response_length", len(response_content))
+        memory_manager.save_performance_metric("main", user_id, "context_tokens_saved", bloco_contexto.tokens_saved)
         
         print("-" * 60)
 
@@ -1,15 +1,19 @@
 """Agente de programação para django e react native"""
 
 import uvicorn
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, Request, Form
 from fastapi.responses import HTMLResponse, JSONResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 from langchain_google_genai import ChatGoogleGenerativeAI
 from langgraph.prebuilt import create_react_agent
-from utils.intent_parser import detectar_intencao, carregar_tools_por_intencao, esta_em_fallback
-from utils.memory_manager import MemoryManager
+from utils.intent_parser import ranquear_intencoes, carregar_tools_por_intencao
+from utils.mcp_pool import mcp_pool
+from utils.async_memory_manager import AsyncMemoryManager
 from mcp_servers import MCP_DEV_CONFIG
+from utils.toolsets import union_servers
+import asyncio
 import os
 import hashlib
 from datetime import datetime
@@ -18,9 +22,24 @@ from dotenv import load_dotenv
 load_dotenv()
 
 # Inicializar gerenciador de memória
-memory_manager = MemoryManager()
+memory_manager = AsyncMemoryManager()
 
-app = FastAPI()
+# Todos os servidores de todas as intenções, um por endpoint
+MCP_DEV_SERVERS = union_servers(MCP_DEV_CONFIG.values())
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Agenda a retenção da memória, aquece as conexões MCP e fecha tudo ao encerrar o servidor"""
+    memory_manager.start_retention()
+    # Warmup em segundo plano: o servidor já atende, /ready diz quando as tools estão prontas
+    app.state.mcp_warmup = asyncio.create_task(mcp_pool.warmup(MCP_DEV_SERVERS))
+    mcp_pool.start_refresh(MCP_DEV_SERVERS)
+    yield
+    app.state.mcp_warmup.cancel()
+    await mcp_pool.aclose()
+    await memory_manager.close()
+
+app = FastAPI(lifespan=lifespan)
 app.mount("/static", StaticFiles(directory="static"), name="static")
 templates = Jinja2Templates(directory="templates")
 
@@ -55,27 +74,17 @@ async def process_prompt(request: Request, mensagem: str = Form(...)):
         print(f"📝 Prompt: {prompt[:100]}...")
         
         # Detectar intenção
-        intencao = detectar_intencao(prompt)
-        print(f"🎯 Intenção detectada: {intencao}")
-        
-        # Recuperar contexto anterior
-        contexto_anterior = memory_manager.get_conversation_context(thread_id, limit=5)
-        user_preferences = memory_manager.get_user_preferences(user_id)
+        ranking = ranquear_intencoes([prompt])[0]
+        intencao = ranking[0][0]
+        print(f"🎯 Intenções detectadas: {ranking}")
         
-        # Construir contexto enriquecido
-        contexto_enriquecido = ""
-        if contexto_anterior:
-            contexto_enriquecido += "\n\n[CONTEXTO ANTERIOR]:\n"
-            for ctx in contexto_anterior:
-                contexto_enriquecido += f"- {ctx['type']}: {str(ctx['content'])[:200]}...\n"
-        
-        if user_preferences:
-            contexto_enriquecido += "\n[PREFERÊNCIAS DO USUÁRIO]:\n"
-            for key, value in user_preferences.items():
-                contexto_enriquecido += f"- {key}: {value}\n"
+        # Contexto anterior + preferências, dentro do orçamento de tokens
+        bloco_contexto = await memory_manager.build_context(thread_id, user_id, query=prompt)
+        contexto_enriquecido = bloco_contexto.text
+        print(f"🧮 Contexto: {bloco_contexto.tokens} tokens ({bloco_contexto.tokens_saved} economizados)")
         
         # Carregar ferramentas
-        tools = await carregar_tools_por_intencao(intencao, MCP_DEV_CONFIG)
+        tools = await carregar_tools_por_intencao(ranking, MCP_DEV_CONFIG)
         
         # Configurar modelo
         modelo = ChatGoogleGenerativeAI(
@@ -88,9 +97,13 @@ async def process_prompt(request: Request, mensagem: str = Form(...)):
         if thread_id not in agent_cache:
             checkpointer = memory_manager.get_sqlite_saver()
             if tools:
-                agent_cache[thread_id] = create_react_agent(modelo, tools, checkpointer=checkpointer)
+                agent_cache[thread_id] = create_react_agent(
+                    modelo, tools, checkpointer=checkpointer, pre_model_hook=memory_manager.history_window()
+                )
             else:
-                agent_cache[thread_id] = create_react_agent(modelo, [], checkpointer=checkpointer)
+                agent_cache[thread_id] = create_react_agent(
+                    modelo, [], checkpointer=checkpointer, pre_model_hook=memory_manager.history_window()
+                )
             print(f"🆕 Novo agente criado para thread {thread_id}")
         else:
             print(f"♻️ Reutilizando agente existente para thread {thread_id}")
@@ -104,7 +117,7 @@ async def process_prompt(request: Request, mensagem: str = Form(...)):
         # Prompt completo com contexto
         prompt_completo = f"{contexto_enriquecido}\n\n[PERGUNTA ATUAL]: {prompt}"
         
-        if esta_em_fallback():
+        if not tools:
             prompt_completo += "\n\n[MODO FALLBACK ATIVO: Funcionando sem ferramentas MCP externas]"
         
         print(f"🚀 Processando com contexto...")
@@ -129,7 +142,7 @@ async def process_prompt(request: Request, mensagem: str = Form(...)):
             resposta_final = "Desculpe, não consegui gerar uma resposta. Tente reformular a pergunta."
         
         # Salvar contexto importante
-        memory_manager.save_conversation_context(thread_id, {
+        await memory_manager.save_conversation_context(thread_id, {
             'type': intencao,
             'content': {
                 'prompt': prompt,
@@ -137,7 +150,8 @@ async def process_prompt(request: Request, mensagem: str = Form(...)):
                 'timestamp': datetime.now().isoformat()
             },
             'importance': 2 if len(resposta_final) > 100 else 1
-        })
+        }, user_id=user_id)
+        await memory_manager.save_performance_metric("default", user_id, "context_tokens_saved", bloco_contexto.tokens_saved)
         
         print(f"✅ Resposta gerada e contexto salvo: {len(resposta_final)} caracteres")
         return JSONResponse({"resposta": resposta_final})
@@ -168,7 +182,7 @@ async def save_preference(request: Request, key: str = Form(...), value: str = F
     """Salva preferência do usuário"""
     try:
         user_id = get_user_id(request)
-        memory_manager.save_user_preference(user_id, key, value)
+        await memory_manager.save_user_preference(user_id, key, value)
         return JSONResponse({"message": "Preferência salva com sucesso"})
     except Exception as e:
         return JSONResponse({"erro": str(e)}, status_code=500)
@@ -191,11 +205,18 @@ async def get_or_create_agent(user_id: str, agent_type: str = "default"):
     checkpointer = memory_manager.get_sqlite_saver(agent_type)
     
     # Criar agente
-    agente = create_react_agent(model, tools, checkpointer=checkpointer)
+    agente = create_react_agent(
+        model, tools, checkpointer=checkpointer, pre_model_hook=memory_manager.history_window(agent_type)
+    )
     agents[thread_id] = agente
     
     return agente, thread_id
 
+@app.get("/ready")
+async def readiness():
+    """200 quando o warmup das conexões MCP terminou (mesmo com servidores fora), 503 antes"""
+    return JSONResponse(mcp_pool.warmup_state, status_code=200 if mcp_pool.warmup_state["ready"] else 503)
+
 @app.get("/memory_status")
 async def memory_status(request: Request):
     """Retorna o status da memória"""
@@ -203,12 +224,17 @@ async def memory_status(request: Request):
     thread_id = get_thread_id(user_id)
     
     # Obter estatísticas básicas
-    context_count = len(memory_manager.get_conversation_context(thread_id, "default"))
+    context_count = len(await memory_manager.get_conversation_context(thread_id, "default"))
     
     return JSONResponse({
         "status": "active",
         "thread_id": thread_id,
         "context_items": context_count,
+        "cache": memory_manager.cache_stats(),
+        "retention": memory_manager.retention_stats(),
+        "mcp": mcp_pool.stats(),
+        "compaction": await memory_manager.get_compaction_history(thread_id, "default", limit=5),
+        "quota": await memory_manager.get_quota_usage(user_id, thread_id, "default"),
         "last_updated": datetime.now().isoformat()
     })
 
@@ -218,22 +244,34 @@ async def get_context(request: Request):
     user_id = get_user_id(request)
     thread_id = get_thread_id(user_id)
     
-    context = memory_manager.get_conversation_context(thread_id, "default")
+    context = await memory_manager.get_conversation_context(thread_id, "default")
     
     return JSONResponse({
         "context": context,
         "thread_id": thread_id
     })
 
+@app.get("/search_context")
+async def search_context(request: Request, q: str, page: int = 1, page_size: int = 10):
+    """Busca textual no histórico da conversa (ranqueada, paginada e com trechos)"""
+    user_id = get_user_id(request)
+    thread_id = get_thread_id(user_id)
+    
+    resultado = await memory_manager.search_context(thread_id, q, "default", page, page_size)
+    
+    return JSONResponse({**resultado, "thread_id": thread_id})
+
 @app.get("/metrics")
 async def metrics(request: Request, agent_type: str = "default"):
     """Retorna métricas de performance"""
     user_id = get_user_id(request)
     
-    metrics = memory_manager.get_performance_metrics(agent_type, user_id)
+    metrics = await memory_manager.get_performance_metrics(agent_type, user_id, limit=50)
+    summary = await memory_manager.get_metrics_summary(agent_type, days=30)
     
     return JSONResponse({
         "metrics": metrics,
+        "summary": summary,
         "user_id": user_id,
         "agent_type": agent_type
     })
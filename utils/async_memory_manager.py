@@ -0,0 +1,169 @@
+"""API assíncrona da memória persistente para uso dentro dos handlers FastAPI"""
+
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Any, Dict, List, Optional
+
+from utils.context_builder import ContextBlock
+from utils.memory_manager import MemoryManager
+from utils.memory_router import create_memory_manager
+from utils.retention import RetentionService
+
+
+class AsyncMemoryManager:
+    """Mesma superfície do MemoryManager, mas sem bloquear o event loop.
+
+    Leituras rodam num executor dedicado de ``workers`` threads (ou
+    AGENT_MEMORY_WORKERS), dimensionado pelas requisições simultâneas e não
+    pelo lock de escrita: em WAL os leitores não esperam o escritor. O pool
+    de conexões ganha uma conexão por thread, mais a da fila write-behind.
+    Com write-behind, contexto, métricas e atividade de sessão só entram na
+    fila em memória e são enfileirados no próprio loop, sem pular de thread.
+    """
+
+    def __init__(self, db_path: str = "agent_memory.db", pool_size: int = 4,
+                 manager: Optional[MemoryManager] = None, write_behind: bool = True,
+                 sharding: Optional[str] = None, workers: Optional[int] = None):
+        self.workers = workers or int(os.getenv("AGENT_MEMORY_WORKERS", "8"))
+        # sharding (ou AGENT_MEMORY_SHARDING): off, agent ou user:N — ver utils/memory_router.py
+        self.sync = manager or create_memory_manager(db_path, sharding, pool_size=max(pool_size, self.workers + 1),
+                                                     write_behind=write_behind)
+        self.db_path = self.sync.db_path
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="memory")
+        self.retention = RetentionService(self.sync)
+
+    async def _run(self, fn, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, partial(fn, *args, **kwargs))
+
+    async def _enqueue(self, fn, *args):
+        # Só coloca na fila write-behind (microssegundos): mais barato que a ida e volta ao executor
+        if self.sync.queues_writes:
+            fn(*args)
+            return
+        await self._run(fn, *args)
+
+    def get_sqlite_saver(self, agent_type="default"):
+        """Retorna o checkpointer do tipo de agente (não faz I/O)"""
+        return self.sync.get_sqlite_saver(agent_type)
+
+    async def save_conversation_context(self, thread_id: str, context: Dict[str, Any], agent_type: str = "default",
+                                        user_id: Optional[str] = None):
+        """Salva contexto importante da conversa (user_id conta na cota do usuário)"""
+        await self._enqueue(self.sync.save_conversation_context, thread_id, context, agent_type, user_id)
+
+    async def get_conversation_context(self, thread_id: str, agent_type: str = "default", limit: int = 10) -> List[Dict]:
+        """Recupera contexto relevante da conversa"""
+        return await self._run(self.sync.get_conversation_context, thread_id, agent_type, limit)
+
+    async def search_conversation_context(self, thread_id: str, query: str, agent_type: str = "default",
+                                          limit: int = 5) -> List[Dict]:
+        """Recupera as entradas de contexto mais parecidas com a pergunta atual"""
+        return await self._run(self.sync.search_conversation_context, thread_id, query, agent_type, limit)
+
+    async def search_context(self, thread_id: str, query: str, agent_type: str = "default",
+                             page: int = 1, page_size: int = 10) -> Dict[str, Any]:
+        """Busca textual no histórico da thread: resultados ranqueados, paginados e com trechos"""
+        return await self._run(self.sync.search_context, thread_id, query, agent_type, page, page_size)
+
+    async def build_context(self, thread_id: str, user_id: str, agent_type: str = "default",
+                            query: Optional[str] = None, budget_tokens: Optional[int] = None) -> ContextBlock:
+        """Bloco de histórico + preferências para o prompt, dentro do orçamento de tokens"""
+        return await self._run(self.sync.build_context, thread_id, user_id, agent_type, query, budget_tokens)
+
+    async def save_user_preference(self, user_id: str, key: str, value: str, agent_type: str = "default"):
+        """Salva preferência do usuário"""
+        await self._run(self.sync.save_user_preference, user_id, key, value, agent_type)
+
+    async def get_user_preferences(self, user_id: str, agent_type: str = "default") -> Dict[str, str]:
+        """Recupera preferências do usuário"""
+        return await self._run(self.sync.get_user_preferences, user_id, agent_type)
+
+    async def create_session(self, user_id: str, agent_type: str) -> str:
+        """Cria uma nova sessão de agente"""
+        return await self._run(self.sync.create_session, user_id, agent_type)
+
+    async def update_session_activity(self, thread_id: str, agent_type: Optional[str] = None):
+        """Atualiza a última atividade da sessão"""
+        await self._enqueue(self.sync.update_session_activity, thread_id, agent_type)
+
+    async def save_performance_metric(self, agent_type: str, user_id: str, metric_type: str, value: float):
+        """Salva métricas de performance"""
+        await self._enqueue(self.sync.save_performance_metric, agent_type, user_id, metric_type, value)
+
+    async def get_performance_metrics(self, agent_type: str, user_id: str, days: Optional[float] = None,
+                                      limit: Optional[int] = None) -> List[Dict]:
+        """Recupera métricas de performance brutas (mais recentes primeiro, no máximo 2 dias)"""
+        return await self._run(self.sync.get_performance_metrics, agent_type, user_id, days, limit)
+
+    async def rollup_metrics(self) -> int:
+        """Consolida as métricas novas nos agregados por minuto/hora"""
+        return await self._run(self.sync.rollup_metrics)
+
+    async def get_metrics_summary(self, agent_type: str, days: float = 30,
+                                  metric_type: Optional[str] = None) -> Dict[str, Dict]:
+        """count/sum/avg/min/max/p50/p95/p99 por tipo de métrica na janela"""
+        return await self._run(self.sync.get_metrics_summary, agent_type, days, metric_type)
+
+    async def get_metrics_series(self, agent_type: str, metric_type: str, hours: float = 24,
+                                 granularity: Optional[str] = None) -> List[Dict]:
+        """Série por minuto ou por hora de um tipo de métrica"""
+        return await self._run(self.sync.get_metrics_series, agent_type, metric_type, hours, granularity)
+
+    async def compact_memory(self) -> Dict[str, int]:
+        """Resume os turnos antigos das threads longas"""
+        return await self._run(self.sync.compact_memory)
+
+    async def get_compaction_history(self, thread_id: str, agent_type: str = "default",
+                                     limit: int = 10) -> List[Dict]:
+        """Últimas compactações da thread (resumo do contexto e corte de mensagens)"""
+        return await self._run(self.sync.get_compaction_history, thread_id, agent_type, limit)
+
+    async def set_quotas(self, quotas: Dict[str, int]):
+        """Altera as cotas de linhas por usuário/thread (0 = sem limite)"""
+        await self._run(self.sync.set_quotas, quotas)
+
+    async def get_quota_usage(self, user_id: Optional[str] = None, thread_id: Optional[str] = None,
+                              agent_type: str = "default") -> Dict[str, Any]:
+        """Uso x limite das cotas e total de linhas despejadas"""
+        return await self._run(self.sync.get_quota_usage, user_id, thread_id, agent_type)
+
+    async def train_context_dictionary(self, samples: int = 5000, dict_size: int = 32 * 1024,
+                                       recompress: bool = False) -> Dict[str, Any]:
+        """Treina o dicionário zstd do contexto comprimido (AGENT_MEMORY_COMPRESSION=zstd)"""
+        return await self._run(self.sync.train_context_dictionary, samples, dict_size, recompress)
+
+    def history_window(self, agent_type: str = "default", max_messages: int = 30):
+        """pre_model_hook que limita o histórico de mensagens do agente (não faz I/O)"""
+        return self.sync.history_window(agent_type, max_messages)
+
+    async def cleanup_old_data(self, days: int = 90) -> Dict[str, Any]:
+        """Remove dados antigos para manter o banco otimizado"""
+        return await self._run(self.sync.cleanup_old_data, days)
+
+    def start_retention(self):
+        """Agenda a retenção/vacuum e a manutenção periódicas no event loop atual (lifespan)"""
+        self.retention.start()
+
+    def retention_stats(self) -> Dict[str, Any]:
+        """Linhas removidas por tabela e bytes recuperados desde o início"""
+        return self.retention.stats
+
+    def cache_stats(self) -> Dict[str, Any]:
+        """Contadores de hit/miss do cache de preferências e contexto"""
+        return self.sync.cache_stats()
+
+    async def flush(self):
+        """Força a gravação das escritas pendentes na fila write-behind"""
+        await self._run(self.sync.flush)
+
+    async def close(self):
+        """Aguarda as operações pendentes, grava a fila e fecha o pool"""
+        loop = asyncio.get_running_loop()
+        await self.retention.stop()
+        await loop.run_in_executor(None, self._executor.shutdown)
+        await self.sync.aclose_checkpointers()
+        # close() esvazia a fila write-behind: roda fora do loop
+        await loop.run_in_executor(None, self.sync.close)
@@ -1,53 +1,63 @@
 import re
+from typing import List, Tuple
 
-def detectar_intencao_bet365(mensagem: str) -> str:
-    """
-    Detecta a intenção específica para apostas na Bet365
-    """
-    if not mensagem:
-        return "geral"
-
-    mensagem = mensagem.lower()
+from utils.intent_classifier import load_classifier, rank_with_fallback
+from utils.intent_engine import IntentEngine
+from utils.toolsets import Intencoes, intent_names, union_servers
 
+# Intenções em ordem de prioridade; acentos são ignorados na comparação
+INTENT_RULES = [
     # Análise esportiva
-    if any(palavra in mensagem for palavra in ["análise", "analise", "estatística", "estatistica", "time", "jogador", "equipe", "histórico", "historico", "forma", "desempenho"]):
-        return "analise_esportiva"
-    
+    ("analise_esportiva", ["análise", "estatística", "time", "jogador", "equipe", "histórico", "forma", "desempenho"]),
     # Gestão de apostas
-    if any(palavra in mensagem for palavra in ["aposta", "apostar", "bet", "stake", "bankroll", "gestão", "gestao", "estratégia", "estrategia"]):
-        return "gestao_apostas"
-    
+    ("gestao_apostas", ["aposta", "apostar", "bet", "stake", "bankroll", "gestão", "estratégia"]),
     # Análise de odds
-    if any(palavra in mensagem for palavra in ["odds", "cotação", "cotacao", "probabilidade", "value", "arbitragem", "comparar"]):
-        return "analise_odds"
-    
+    ("analise_odds", ["odds", "cotação", "probabilidade", "value", "arbitragem", "comparar"]),
     # Esportes específicos
-    if any(palavra in mensagem for palavra in ["futebol", "football", "soccer", "copa", "campeonato", "liga"]):
-        return "futebol"
-    elif any(palavra in mensagem for palavra in ["basquete", "basketball", "nba", "euroliga"]):
-        return "basquete"
-    elif any(palavra in mensagem for palavra in ["tênis", "tennis", "atp", "wta", "grand slam"]):
-        return "tenis"
-    elif any(palavra in mensagem for palavra in ["e-sports", "esports", "cs:go", "lol", "dota"]):
-        return "esports"
-    
+    ("futebol", ["futebol", "football", "soccer", "copa", "campeonato", "liga"]),
+    ("basquete", ["basquete", "basketball", "nba", "euroliga"]),
+    ("tenis", ["tênis", "tennis", "atp", "wta", "grand slam"]),
+    ("esports", ["e-sports", "esports", "cs:go", "lol", "dota"]),
     # Relatórios e tracking
-    if any(palavra in mensagem for palavra in ["relatório", "relatorio", "roi", "lucro", "prejuízo", "prejuizo", "performance", "histórico", "historico"]):
-        return "relatorios"
-    
+    ("relatorios", ["relatório", "roi", "lucro", "prejuízo", "performance", "histórico"]),
     # Configuração
-    if any(palavra in mensagem for palavra in ["configurar", "setup", "conta", "login", "api", "conectar"]):
-        return "configuracao"
+    ("configuracao", ["configurar", "setup", "conta", "login", "api", "conectar"]),
+]
+
+_intent_engine = IntentEngine(INTENT_RULES)
+# Classificador treinado em data/intents/bet365.jsonl; abaixo da confiança
+# mínima (ou sem o arquivo de pesos) valem as palavras-chave
+_intent_classifier = load_classifier("bet365")
+MIN_CONFIDENCE = 0.5
+
+def detectar_intencao_bet365(mensagem: str) -> str:
+    """
+    Detecta a intenção específica para apostas na Bet365
+    """
+    return ranquear_intencoes_bet365([mensagem])[0][0][0]
+
 
-    return "geral"
+def detectar_intencoes_bet365(mensagens: List[str]) -> List[str]:
+    """
+    Versão em lote: o classificador pontua todas as mensagens de uma vez
+    """
+    return [ranking[0][0] for ranking in ranquear_intencoes_bet365(mensagens)]
+
+
+def ranquear_intencoes_bet365(mensagens: List[str]) -> List[List[Tuple[str, float]]]:
+    """
+    Todas as intenções relevantes de cada mensagem, [(intenção, escore), ...], a principal primeiro
+    """
+    return rank_with_fallback(_intent_classifier, _intent_engine, mensagens, MIN_CONFIDENCE)
 
 
-async def carregar_tools_bet365(intencao: str, mcp_config: dict):
+async def carregar_tools_bet365(intencao: Intencoes, mcp_config: dict):
     """
-    Carrega as tools específicas baseadas na intenção detectada para Bet365
+    Carrega as tools da intenção (ou do ranking de intenções) detectada para Bet365;
+    cada servidor MCP necessário é conectado uma única vez
     """
     try:
-        from langchain_mcp_adapters.client import MultiServerMCPClient
+        from utils.mcp_pool import mcp_pool
         
         # Mapeamento de intenções para configurações específicas
         config_mapping = {
@@ -63,15 +73,15 @@ async def carregar_tools_bet365(intencao: str, mcp_config: dict):
             "geral": ["passos_sequenciais", "buscas_relevantes", "analise_esportiva"]
         }
         
-        # Seleciona as configurações baseadas na intenção
-        selected_configs = config_mapping.get(intencao, config_mapping["geral"])
+        # Seleciona as configurações de todas as intenções
+        selected_configs = [key for nome in intent_names(intencao)
+                            for key in config_mapping.get(nome, config_mapping["geral"])]
         
         # Cria um sub-config apenas com as tools necessárias
-        sub_config = {key: mcp_config[key] for key in selected_configs if key in mcp_config}
+        sub_config = union_servers({key: mcp_config[key]} for key in selected_configs if key in mcp_config)
         
-        mcp_client = MultiServerMCPClient(sub_config)
-        tools = await mcp_client.get_tools()
-        return tools
+        # Sessões compartilhadas pelo processo: só conecta o que ainda não está aberto
+        return await mcp_pool.acquire_tools(sub_config)
         
     except ImportError:
         print("⚠️  Módulo langchain_mcp_adapters não encontrado.")
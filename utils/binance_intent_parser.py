@@ -1,41 +1,56 @@
 import re
-from langchain_mcp_adapters.client import MultiServerMCPClient
+from typing import List, Tuple
 
-def detectar_intencao_binance(mensagem: str) -> str:
-    """
-    Detecta a intenção específica para operações na Binance
-    """
-    if not mensagem:
-        return "geral"
-
-    mensagem = mensagem.lower()
+from utils.intent_classifier import load_classifier, rank_with_fallback
+from utils.intent_engine import IntentEngine
+from utils.mcp_pool import mcp_pool
+from utils.toolsets import Intencoes, intent_names, union_servers
 
+# Intenções em ordem de prioridade; acentos são ignorados na comparação
+INTENT_RULES = [
     # Análise de mercado
-    if any(palavra in mensagem for palavra in ["análise", "analise", "preço", "precos", "gráfico", "grafico", "tendência", "tendencia", "indicador", "rsi", "macd", "bollinger"]):
-        return "analise_mercado"
-    
+    ("analise_mercado", ["análise", "preço", "precos", "gráfico", "tendência", "indicador", "rsi", "macd", "bollinger"]),
     # Trading automático
-    if any(palavra in mensagem for palavra in ["comprar", "vender", "ordem", "trade", "trading", "bot", "automatico", "automático", "estratégia", "estrategia"]):
-        return "trading_automatico"
-    
+    ("trading_automatico", ["comprar", "vender", "ordem", "trade", "trading", "bot", "automático", "estratégia"]),
     # Gestão de risco
-    if any(palavra in mensagem for palavra in ["risco", "stop", "loss", "profit", "posição", "posicao", "portfolio", "diversificação", "diversificacao"]):
-        return "gestao_risco"
-    
+    ("gestao_risco", ["risco", "stop", "loss", "profit", "posição", "portfolio", "diversificação"]),
     # Monitoramento e relatórios
-    if any(palavra in mensagem for palavra in ["relatório", "relatorio", "performance", "lucro", "prejuízo", "prejuizo", "histórico", "historico", "monitorar"]):
-        return "monitoramento"
-    
+    ("monitoramento", ["relatório", "performance", "lucro", "prejuízo", "histórico", "monitorar"]),
     # Configuração e setup
-    if any(palavra in mensagem for palavra in ["configurar", "setup", "api", "chave", "conectar", "autenticação", "autenticacao"]):
-        return "configuracao"
+    ("configuracao", ["configurar", "setup", "api", "chave", "conectar", "autenticação"]),
+]
+
+_intent_engine = IntentEngine(INTENT_RULES)
+# Classificador treinado em data/intents/binance.jsonl; abaixo da confiança
+# mínima (ou sem o arquivo de pesos) valem as palavras-chave
+_intent_classifier = load_classifier("binance")
+MIN_CONFIDENCE = 0.5
+
+def detectar_intencao_binance(mensagem: str) -> str:
+    """
+    Detecta a intenção específica para operações na Binance
+    """
+    return ranquear_intencoes_binance([mensagem])[0][0][0]
+
 
-    return "geral"
+def detectar_intencoes_binance(mensagens: List[str]) -> List[str]:
+    """
+    Versão em lote: o classificador pontua todas as mensagens de uma vez
+    """
+    return [ranking[0][0] for ranking in ranquear_intencoes_binance(mensagens)]
+
+
+def ranquear_intencoes_binance(mensagens: List[str]) -> List[List[Tuple[str, float]]]:
+    """
+    Todas as intenções relevantes de cada mensagem, [(intenção, escore), ...], a principal primeiro
+    """
+    return rank_with_fallback(_intent_classifier, _intent_engine, mensagens, MIN_CONFIDENCE)
 
 
-async def carregar_tools_binance(intencao: str, mcp_config: dict):
+async def carregar_tools_binance(intencao: Intencoes, mcp_config: dict):
     """
-    Carrega as tools específicas baseadas na intenção detectada para Binance
+    Carrega as tools da intenção (ou do ranking de intenções) detectada para Binance;
+    cada servidor MCP necessário é conectado uma única vez
     """
     # Mapeamento de intenções para configurações específicas
     config_mapping = {
@@ -47,12 +62,12 @@ async def carregar_tools_binance(intencao: str, mcp_config: dict):
         "geral": ["passos_sequenciais", "buscas_relevantes", "automacao"]
     }
     
-    # Seleciona as configurações baseadas na intenção
-    selected_configs = config_mapping.get(intencao, config_mapping["geral"])
+    # Seleciona as configurações de todas as intenções
+    selected_configs = [key for nome in intent_names(intencao)
+                        for key in config_mapping.get(nome, config_mapping["geral"])]
     
     # Cria um sub-config apenas com as tools necessárias
-    sub_config = {key: mcp_config[key] for key in selected_configs if key in mcp_config}
+    sub_config = union_servers({key: mcp_config[key]} for key in selected_configs if key in mcp_config)
     
-    mcp_client = MultiServerMCPClient(sub_config)
-    tools = await mcp_client.get_tools()
-    return tools
\ No newline at end of file
+    # Sessões compartilhadas pelo processo: só conecta o que ainda não está aberto
+    return await mcp_pool.acquire_tools(sub_config)
\ No newline at end of file
@@ -0,0 +1,109 @@
+"""Checkpointer LangGraph em disco que mantém só os checkpoints mais recentes"""
+
+from typing import Any, Dict, Optional
+
+import aiosqlite
+from langgraph.checkpoint.sqlite.aio import AsyncSqliteSaver
+
+# Pragmas da conexão de checkpoints: WAL para leituras concorrentes e um page
+# cache pequeno, que é tudo o que o processo mantém residente por thread.
+CHECKPOINT_PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "cache_size": -4000,       # ~4 MB
+    "temp_store": "MEMORY",
+    "busy_timeout": 5000,
+}
+
+
+class CompactingSqliteSaver(AsyncSqliteSaver):
+    """AsyncSqliteSaver que descarta checkpoints antigos de cada thread.
+
+    Cada checkpoint do LangGraph já carrega o estado completo da thread
+    (incluindo o histórico de mensagens), então os anteriores aos
+    ``keep_last`` mais recentes só servem para time-travel e podem ser
+    removidos. A compactação roda a cada ``compact_every`` gravações da thread.
+    """
+
+    def __init__(self, conn: aiosqlite.Connection, *, keep_last: int = 5,
+                 compact_every: int = 10, serde: Optional[Any] = None):
+        super().__init__(conn, serde=serde)
+        self.keep_last = max(1, keep_last)
+        self.compact_every = max(1, compact_every)
+        self._puts_since_compact: Dict[tuple, int] = {}
+
+    @classmethod
+    def from_path(cls, db_path: str, **kwargs) -> "CompactingSqliteSaver":
+        """Cria o saver para um arquivo; a conexão abre no primeiro uso (setup)"""
+        return cls(aiosqlite.connect(db_path, check_same_thread=False), **kwargs)
+
+    async def setup(self) -> None:
+        first_setup = not self.is_setup
+        await super().setup()
+        if first_setup:
+            async with self.lock:
+                for name, value in CHECKPOINT_PRAGMAS.items():
+                    await self.conn.execute(f"PRAGMA {name}={value}")
+
+    async def aput(self, config, checkpoint, metadata, new_versions):
+        next_config = await super().aput(config, checkpoint, metadata, new_versions)
+
+        configurable = config["configurable"]
+        key = (configurable["thread_id"], configurable.get("checkpoint_ns", ""))
+        count = self._puts_since_compact.get(key, 0) + 1
+        if count >= self.compact_every:
+            await self.compact_thread(*key)
+            count = 0
+        self._puts_since_compact[key] = count
+        return next_config
+
+    async def compact_thread(self, thread_id: str, checkpoint_ns: str = "") -> int:
+        """Remove checkpoints (e writes pendentes) além dos keep_last mais recentes"""
+        await self.setup()
+        async with self.lock:
+            async with self.conn.execute(
+                """
+                SELECT checkpoint_id FROM checkpoints
+                WHERE thread_id = ? AND checkpoint_ns = ?
+                ORDER BY checkpoint_id DESC
+                LIMIT 1 OFFSET ?
+                """,
+                (thread_id, checkpoint_ns, self.keep_last - 1),
+            ) as cursor:
+                row = await cursor.fetchone()
+            if row is None:
+                return 0
+
+            oldest_kept = row[0]
+            cursor = await self.conn.execute(
+                "DELETE FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id < ?",
+                (thread_id, checkpoint_ns, oldest_kept),
+            )
+            removed = cursor.rowcount
+            await self.conn.execute(
+                "DELETE FROM writes WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id < ?",
+                (thread_id, checkpoint_ns, oldest_kept),
+            )
+            await self.conn.commit()
+        return removed
+
+    async def compact_all(self) -> int:
+        """Compacta todas as threads conhecidas no arquivo (ex.: após restart)"""
+        await self.setup()
+        async with self.lock:
+            async with self.conn.execute(
+                "SELECT DISTINCT thread_id, checkpoint_ns FROM checkpoints"
+            ) as cursor:
+                keys = await cursor.fetchall()
+        removed = 0
+        for thread_id, checkpoint_ns in keys:
+            removed += await self.compact_thread(thread_id, checkpoint_ns)
+        return removed
+
+    async def list_threads(self):
+        """Threads com estado salvo, recuperáveis após reiniciar o processo"""
+        await self.setup()
+        async with self.lock, self.conn.execute(
+            "SELECT DISTINCT thread_id FROM checkpoints"
+        ) as cursor:
+            return [row[0] for row in await cursor.fetchall()]
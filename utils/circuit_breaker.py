@@ -0,0 +1,89 @@
+"""Circuit breaker por servidor: fechado → aberto (com backoff exponencial) → meio-aberto"""
+
+import random
+import time
+from typing import Any, Dict, Optional
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(ConnectionError):
+    """O servidor está com o circuito aberto; a chamada nem foi tentada"""
+
+
+class CircuitBreaker:
+    """Estado de saúde de um servidor.
+
+    ``failure_threshold`` falhas seguidas abrem o circuito: as chamadas
+    falham na hora até ``retry_at``. Vencido o prazo, o circuito fica
+    meio-aberto e deixa passar uma única tentativa (a sonda); sucesso fecha,
+    falha reabre com o dobro do backoff (até ``max_backoff``, com jitter
+    para os workers não sondarem juntos).
+    """
+
+    def __init__(self, failure_threshold: int = 2, base_backoff: float = 5.0, max_backoff: float = 300.0):
+        self.failure_threshold = max(1, failure_threshold)
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.state = CLOSED
+        self.failures = 0
+        self.opens = 0
+        self.backoff = 0.0
+        self.retry_at = 0.0
+        self.last_error: Optional[str] = None
+        self._probing = False
+
+    def allow(self) -> bool:
+        """True se a chamada pode ser feita agora (fechado, ou a vez da sonda)"""
+        if self.state == CLOSED:
+            return True
+        if self.state == OPEN and time.monotonic() >= self.retry_at:
+            self.state = HALF_OPEN
+        if self.state == HALF_OPEN and not self._probing:
+            self._probing = True
+            return True
+        return False
+
+    def record_success(self):
+        self.state = CLOSED
+        self.failures = 0
+        self.backoff = 0.0
+        self._probing = False
+
+    def record_failure(self, error: BaseException):
+        self.failures += 1
+        self.last_error = repr(error)
+        self._probing = False
+        if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+            self.backoff = min(self.max_backoff, self.backoff * 2 if self.backoff else self.base_backoff)
+            self.retry_at = time.monotonic() + self.backoff * random.uniform(0.8, 1.2)
+            self.state = OPEN
+            self.opens += 1
+
+    def abandon(self):
+        """A tentativa foi interrompida sem resultado; outra sonda pode ser feita"""
+        self._probing = False
+
+    def probe_due(self) -> bool:
+        """True se uma sonda pode sair agora: prazo vencido ou meio-aberto sem sonda em andamento"""
+        if self.state == OPEN:
+            return time.monotonic() >= self.retry_at
+        return self.state == HALF_OPEN and not self._probing
+
+    def reset(self):
+        self.record_success()
+        self.last_error = None
+
+    def seconds_to_retry(self) -> float:
+        return max(0.0, self.retry_at - time.monotonic()) if self.state == OPEN else 0.0
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "state": self.state,
+            "failures": self.failures,
+            "opens": self.opens,
+            "retry_in_s": round(self.seconds_to_retry(), 1),
+            "last_error": self.last_error,
+        }
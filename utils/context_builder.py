@@ -0,0 +1,155 @@
+"""Montagem do bloco de contexto (histórico + preferências) com orçamento de tokens"""
+
+import json
+import math
+import re
+from typing import Any, Dict, List, NamedTuple, Optional
+
+from utils.context_index import context_text
+
+# Cabeçalhos usados por cada agente: (histórico, preferências)
+SECTION_LABELS = {
+    "default": ("[CONTEXTO ANTERIOR]:", "[PREFERÊNCIAS DO USUÁRIO]:"),
+    "main": ("[CONTEXTO ANTERIOR]:", "[PREFERÊNCIAS DO USUÁRIO]:"),
+    "binance": ("[CONTEXTO TRADING ANTERIOR]:", "[PREFERÊNCIAS DE TRADING]:"),
+    "bet365": ("[CONTEXTO APOSTAS ANTERIOR]:", "[PREFERÊNCIAS DE APOSTAS]:"),
+}
+
+_TOKEN_RE = re.compile(r"\w+|[^\w\s]", re.UNICODE)
+
+# Formato usado antes do orçamento de tokens (base de tokens_saved): as 5
+# primeiras entradas de get_conversation_context, conteúdo cortado em 200 caracteres
+LEGACY_ENTRIES = 5
+LEGACY_CHARS = 200
+
+
+def estimate_tokens(text: str) -> int:
+    """Estimativa local de tokens, sem tokenizer do modelo.
+
+    Usa o maior entre o número de palavras/pontuações e ~4 caracteres por
+    token; erra para cima em texto comum, o que mantém o bloco dentro do
+    orçamento.
+    """
+    if not text:
+        return 0
+    return max(len(_TOKEN_RE.findall(text)), math.ceil(len(text) / 4))
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """Corta o texto em fronteira de palavra para caber em ``max_tokens``"""
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    limit = max_tokens * 4
+    while limit > 0:
+        cut = text[:limit].rsplit(" ", 1)[0] + "..."
+        if estimate_tokens(cut) <= max_tokens:
+            return cut
+        limit = int(limit * 0.8)
+    return ""
+
+
+def entry_text(entry: Dict[str, Any]) -> str:
+    """Texto de uma entrada de long_term_context (pergunta e resposta)"""
+    content = entry.get("content")
+    if isinstance(content, dict) and "summary" in content:
+        return str(content["summary"])
+    if isinstance(content, dict) and ("prompt" in content or "response" in content):
+        return f"{content.get('prompt', '')} → {content.get('response', '')}".strip(" →")
+    return context_text(content)
+
+
+def legacy_context_text(entries: List[Dict[str, Any]], preferences: Dict[str, Any],
+                        agent_type: str = "default") -> str:
+    """Bloco no formato antigo dos servidores, só para medir a economia"""
+    context_label, preference_label = SECTION_LABELS.get(agent_type, SECTION_LABELS["default"])
+    text = ""
+    if entries:
+        text += f"\n\n{context_label}\n"
+        for entry in entries[:LEGACY_ENTRIES]:
+            text += f"- {entry.get('type')}: {str(entry.get('content'))[:LEGACY_CHARS]}...\n"
+    if preferences:
+        text += f"\n{preference_label}\n"
+        for key, value in preferences.items():
+            text += f"- {key}: {value}\n"
+    return text
+
+
+class ContextBlock(NamedTuple):
+    text: str
+    tokens: int
+    baseline_tokens: int   # tokens do mesmo histórico no formato antigo (legacy_context_text)
+    entries: int
+    dropped: int
+
+    @property
+    def tokens_saved(self) -> int:
+        return max(0, self.baseline_tokens - self.tokens)
+
+
+class ContextBuilder:
+    """Empacota histórico e preferências num orçamento de tokens.
+
+    Preferências entram primeiro (são curtas e valem para toda a conversa),
+    limitadas a ``preference_share`` do orçamento. O restante vai para o
+    histórico, na ordem: entradas mais parecidas com a pergunta atual
+    (``relevant``), depois importância/recência. Cada entrada recebe no
+    máximo ``entry_tokens``; entradas que não cabem são descartadas.
+    """
+
+    def __init__(self, budget_tokens: int = 600, entry_tokens: int = 150,
+                 preference_share: float = 0.25, candidates: int = 20, relevant: int = 5):
+        self.budget_tokens = budget_tokens
+        self.entry_tokens = entry_tokens
+        self.preference_share = preference_share
+        self.candidates = candidates
+        self.relevant = relevant
+
+    def build(self, entries: List[Dict[str, Any]], preferences: Dict[str, Any],
+              agent_type: str = "default", relevant: Optional[List[Dict[str, Any]]] = None,
+              budget_tokens: Optional[int] = None) -> ContextBlock:
+        budget = self.budget_tokens if budget_tokens is None else budget_tokens
+        context_label, preference_label = SECTION_LABELS.get(agent_type, SECTION_LABELS["default"])
+
+        # Relevantes primeiro, sem repetir a mesma entrada vinda da lista por importância
+        ranked, seen = [], set()
+        for entry in (relevant or []) + entries:
+            key = (entry.get("created_at"), entry.get("type"), json.dumps(entry.get("content"), sort_keys=True))
+            if key not in seen:
+                seen.add(key)
+                ranked.append(entry)
+
+        pref_lines: List[str] = []
+        pref_budget = int(budget * self.preference_share)
+        if preferences:
+            used = estimate_tokens(preference_label)
+            for key, value in preferences.items():
+                line = f"- {key}: {value}"
+                cost = estimate_tokens(line)
+                if used + cost <= pref_budget:
+                    pref_lines.append(line)
+                    used += cost
+
+        remaining = budget - sum(estimate_tokens(line) for line in pref_lines)
+        remaining -= estimate_tokens(preference_label) if pref_lines else 0
+        remaining -= estimate_tokens(context_label)
+
+        ctx_lines: List[str] = []
+        for entry in ranked:
+            prefix = f"- {entry.get('type')}: "
+            text = entry_text(entry)
+            room = min(self.entry_tokens, remaining) - estimate_tokens(prefix)
+            if room < 8:
+                continue
+            line = prefix + truncate_to_tokens(text, room)
+            ctx_lines.append(line)
+            remaining -= estimate_tokens(line)
+
+        parts = []
+        if ctx_lines:
+            parts.append(f"\n\n{context_label}\n" + "\n".join(ctx_lines) + "\n")
+        if pref_lines:
+            parts.append(f"\n{preference_label}\n" + "\n".join(pref_lines) + "\n")
+        text = "".join(parts)
+        baseline = estimate_tokens(legacy_context_text(entries, preferences, agent_type))
+        return ContextBlock(text, estimate_tokens(text), baseline, len(ctx_lines),
+                            len(ranked) - len(ctx_lines))
@@ -0,0 +1,203 @@
+"""Formato compacto de long_term_context.content: JSON comprimido com zstd + dicionário"""
+
+import json
+import sqlite3
+import threading
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+try:
+    import zstandard
+except ImportError:  # a compressão é opcional; sem o pacote tudo continua em JSON
+    zstandard = None
+
+SQL_SELECT_DICTIONARY = '''
+    SELECT data FROM context_dictionaries WHERE dict_id = ?
+'''
+SQL_SELECT_LATEST_DICTIONARY = '''
+    SELECT dict_id, data FROM context_dictionaries ORDER BY created_at DESC, rowid DESC LIMIT 1
+'''
+SQL_INSERT_DICTIONARY = '''
+    INSERT OR REPLACE INTO context_dictionaries (dict_id, data, samples) VALUES (?, ?, ?)
+'''
+SQL_SELECT_SAMPLES = '''
+    SELECT content FROM long_term_context ORDER BY id DESC LIMIT ?
+'''
+SQL_SELECT_UNPACKED = '''
+    SELECT id, content FROM long_term_context
+    WHERE id > ? AND typeof(content) = 'text'
+    ORDER BY id
+    LIMIT ?
+'''
+SQL_UPDATE_PACKED = '''
+    UPDATE long_term_context SET content = ? WHERE id = ?
+'''
+
+
+def search_text(content: Any) -> str:
+    """Texto pesquisável de um conteúdo, igual ao que os triggers do FTS5 extraem do JSON"""
+    if isinstance(content, dict):
+        if content.get("summary") is not None:
+            return str(content["summary"])
+        text = f"{content.get('prompt') or ''} {content.get('response') or ''}".strip()
+        if text:
+            return text
+    return json.dumps(content)
+
+
+class ContextCodec:
+    """Codifica/decodifica o conteúdo salvo em long_term_context.
+
+    Linhas em TEXT são JSON (formato original) e continuam legíveis sempre.
+    Com ``enabled``, linhas novas são gravadas como BLOB: o mesmo JSON
+    comprimido com zstd usando um dicionário treinado sobre as próprias
+    linhas (perguntas e respostas se repetem muito, e o dicionário comprime
+    bem até textos de poucas centenas de bytes). O id do dicionário vai no
+    cabeçalho do frame zstd; os dicionários ficam em context_dictionaries e
+    nunca são apagados, então qualquer BLOB antigo continua decodificável.
+    """
+
+    def __init__(self, pool=None, enabled: bool = False, level: int = 3):
+        if enabled and zstandard is None:
+            print("⚠️ zstandard não instalado: contexto continua em JSON (pip install zstandard)")
+            enabled = False
+        self.pool = pool
+        self.enabled = enabled
+        self.level = level
+        self._lock = threading.Lock()
+        self._decompressors: Dict[int, Any] = {}
+        self.dict_id: Optional[int] = None
+        self._compressor = None
+        # Carregado já aqui: encode() roda dentro de transações (compactação),
+        # quando pedir outra conexão ao pool poderia esgotá-lo
+        if self.enabled:
+            self.reload()
+
+    def _connection(self, conn: Optional[sqlite3.Connection]):
+        if conn is not None:
+            return _Borrowed(conn)
+        return self.pool.connection()
+
+    def reload(self):
+        """Passa a comprimir com o dicionário mais recente (pode ter sido treinado por outro worker)"""
+        with self.pool.connection() as conn:
+            row = conn.execute(SQL_SELECT_LATEST_DICTIONARY).fetchone()
+        with self._lock:
+            self._use_dictionary(*(row or (None, None)))
+
+    def _use_dictionary(self, dict_id: Optional[int], data: Optional[bytes]):
+        if data is None:
+            self._compressor = zstandard.ZstdCompressor(level=self.level)
+            self.dict_id = None
+            return
+        dictionary = zstandard.ZstdCompressionDict(data)
+        self._compressor = zstandard.ZstdCompressor(level=self.level, dict_data=dictionary)
+        self._decompressors[dict_id] = zstandard.ZstdDecompressor(dict_data=dictionary)
+        self.dict_id = dict_id
+
+    def encode(self, content: Any) -> Union[str, bytes]:
+        """JSON (TEXT) ou, com compressão ligada, BLOB zstd"""
+        data = json.dumps(content)
+        if not self.enabled:
+            return data
+        return self._compressor.compress(data.encode("utf-8"))
+
+    def decode(self, value: Union[str, bytes, None], conn: Optional[sqlite3.Connection] = None) -> Any:
+        """Conteúdo original, qualquer que seja o formato gravado"""
+        return json.loads(self.decode_text(value, conn))
+
+    def decode_text(self, value: Union[str, bytes, None], conn: Optional[sqlite3.Connection] = None) -> str:
+        """JSON em texto: linhas antigas saem como estão, BLOBs são descomprimidos"""
+        if value is None:
+            return "null"
+        if isinstance(value, str):
+            return value
+        if zstandard is None:
+            raise RuntimeError("Contexto comprimido com zstd: instale o pacote zstandard para ler")
+        dict_id = zstandard.get_frame_parameters(value).dict_id
+        decompressor = self._decompressors.get(dict_id)
+        if decompressor is None:
+            decompressor = self._load_decompressor(dict_id, conn)
+        return decompressor.decompress(value).decode("utf-8")
+
+    def _load_decompressor(self, dict_id: int, conn: Optional[sqlite3.Connection]):
+        if dict_id == 0:
+            decompressor = zstandard.ZstdDecompressor()
+        else:
+            with self._connection(conn) as c:
+                row = c.execute(SQL_SELECT_DICTIONARY, (dict_id,)).fetchone()
+            if row is None:
+                raise LookupError(f"Dicionário zstd {dict_id} não encontrado em context_dictionaries")
+            decompressor = zstandard.ZstdDecompressor(dict_data=zstandard.ZstdCompressionDict(row[0]))
+        with self._lock:
+            self._decompressors[dict_id] = decompressor
+        return decompressor
+
+    def needs_dictionary(self) -> bool:
+        """Compressão ligada, mas ainda comprimindo sem dicionário"""
+        if not self.enabled:
+            return False
+        if self.dict_id is None:
+            self.reload()
+        return self.dict_id is None
+
+    def train(self, samples: int = 5000, dict_size: int = 32 * 1024) -> Optional[int]:
+        """Treina um dicionário com as linhas mais recentes e passa a usá-lo.
+
+        Retorna o dict_id, ou None se ainda não há linhas suficientes.
+        """
+        if zstandard is None:
+            raise RuntimeError("Treinar o dicionário requer o pacote zstandard")
+        with self.pool.connection() as conn:
+            rows = conn.execute(SQL_SELECT_SAMPLES, (samples,)).fetchall()
+            data = [self.decode_text(row[0], conn).encode("utf-8") for row in rows]
+        if len(data) < 100:
+            return None
+        try:
+            dictionary = zstandard.train_dictionary(dict_size, data, level=self.level)
+        except zstandard.ZstdError as e:
+            print(f"⚠️ Dicionário de contexto não treinado: {e}")
+            return None
+        dict_id = dictionary.dict_id()
+        with self.pool.transaction() as conn:
+            conn.execute(SQL_INSERT_DICTIONARY, (dict_id, dictionary.as_bytes(), len(data)))
+        with self._lock:
+            self._use_dictionary(dict_id, dictionary.as_bytes())
+        print(f"🗜️ Dicionário de contexto {dict_id} treinado com {len(data)} linhas ({dict_size} bytes)")
+        return dict_id
+
+    def recompress(self, batch_size: int = 1000, max_rows: Optional[int] = None) -> int:
+        """Regrava em BLOB as linhas ainda em JSON, em transações curtas; retorna quantas"""
+        if not self.enabled:
+            return 0
+        converted, last_id = 0, 0
+        while max_rows is None or converted < max_rows:
+            with self.pool.connection() as conn:
+                rows: List[Tuple[int, str]] = conn.execute(SQL_SELECT_UNPACKED, (last_id, batch_size)).fetchall()
+            if not rows:
+                break
+            packed = [(self._compressor.compress(content.encode("utf-8")), row_id) for row_id, content in rows]
+            with self.pool.transaction() as conn:
+                conn.executemany(SQL_UPDATE_PACKED, packed)
+            converted += len(rows)
+            last_id = rows[-1][0]
+        return converted
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "dict_id": self.dict_id,
+            "dictionaries_loaded": len(self._decompressors),
+        }
+
+
+class _Borrowed:
+    """Conexão recebida de fora usada no mesmo ``with`` de uma conexão do pool"""
+
+    def __init__(self, conn: sqlite3.Connection):
+        self.conn = conn
+
+    def __enter__(self) -> sqlite3.Connection:
+        return self.conn
+
+    def __exit__(self, *exc):
+        return False
@@ -0,0 +1,273 @@
+"""Índice de recuperação local (TF-IDF com hashing) sobre long_term_context"""
+
+import json
+import math
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from utils.sqlite_pool import SQLitePool
+from utils.text_features import term_counts
+
+SQL_SELECT_NEW_CONTEXT = '''
+    SELECT id, thread_id, agent_type, content
+    FROM long_term_context
+    WHERE id > ?
+    ORDER BY id
+    LIMIT ?
+'''
+SQL_SELECT_MAX_CONTEXT_ID = 'SELECT MAX(id) FROM long_term_context'
+
+
+def context_text(content: Any) -> str:
+    """Texto indexável do JSON salvo em long_term_context.content"""
+    if isinstance(content, str):
+        try:
+            content = json.loads(content)
+        except ValueError:
+            return content
+    if isinstance(content, dict):
+        return " ".join(context_text(v) for v in content.values())
+    if isinstance(content, (list, tuple)):
+        return " ".join(context_text(v) for v in content)
+    return "" if content is None else str(content)
+
+
+class _Block:
+    """Linhas de um (thread_id, agent_type) como listas invertidas: termos em ordem, com a linha e o tf.
+
+    Uma busca só lê as fatias dos termos da query (``searchsorted``), sem
+    passar pelas linhas inteiras; as normas dependem do idf e são
+    recalculadas só quando ele ou o bloco mudam.
+    """
+
+    __slots__ = ("ids", "terms", "rows", "tf", "norms", "_norms_idf", "_pending")
+
+    def __init__(self):
+        self.ids = np.zeros(0, dtype=np.int64)
+        self.terms = np.zeros(0, dtype=np.int32)
+        self.rows = np.zeros(0, dtype=np.int32)
+        self.tf = np.zeros(0, dtype=np.float32)
+        self.norms = np.zeros(0, dtype=np.float32)
+        self._norms_idf = -1
+        self._pending: List[Tuple[int, np.ndarray, np.ndarray]] = []
+
+    @property
+    def size(self) -> int:
+        return len(self.ids) + len(self._pending)
+
+    def append(self, row_id: int, indices: np.ndarray, tf: np.ndarray):
+        # Junção adiada para a próxima leitura: a carga inicial ordena tudo de uma vez
+        self._pending.append((row_id, indices.astype(np.int32), tf))
+
+    def _merge(self):
+        pending, self._pending = self._pending, []
+        start = len(self.ids)
+        lengths = [len(indices) for _, indices, _ in pending]
+        terms = np.concatenate([self.terms] + [indices for _, indices, _ in pending])
+        rows = np.concatenate([self.rows, np.repeat(np.arange(start, start + len(pending), dtype=np.int32), lengths)])
+        tf = np.concatenate([self.tf] + [tf for _, _, tf in pending])
+        # Estável: as linhas de cada termo continuam em ordem de inserção
+        order = np.argsort(terms, kind="stable")
+        self.ids = np.concatenate([self.ids, np.array([row_id for row_id, _, _ in pending], dtype=np.int64)])
+        self.terms, self.rows, self.tf = terms[order], rows[order], tf[order]
+        self._norms_idf = -1
+
+    def row_ids(self) -> np.ndarray:
+        if self._pending:
+            self._merge()
+        return self.ids
+
+    def arrays(self, idf: np.ndarray, idf_version: int):
+        """(ids, terms, rows, tf, norms); arrays novos a cada mudança, seguros para ler fora do lock"""
+        ids = self.row_ids()
+        if self._norms_idf != idf_version:
+            weights = self.tf * idf[self.terms]
+            self.norms = np.sqrt(np.bincount(self.rows, weights=weights * weights,
+                                             minlength=len(ids))).astype(np.float32)
+            self._norms_idf = idf_version
+        return ids, self.terms, self.rows, self.tf, self.norms
+
+    def remove(self, positions: np.ndarray) -> np.ndarray:
+        """Tira as linhas das posições dadas; retorna os termos que saíram (para o df)"""
+        keep_rows = np.ones(len(self.row_ids()), dtype=bool)
+        keep_rows[positions] = False
+        keep = keep_rows[self.rows]
+        removed = self.terms[~keep]
+        renumber = (np.cumsum(keep_rows) - 1).astype(np.int32)
+        self.ids = self.ids[keep_rows]
+        self.terms, self.rows, self.tf = self.terms[keep], renumber[self.rows[keep]], self.tf[keep]
+        self._norms_idf = -1
+        return removed
+
+
+class ContextIndex:
+    """Vetores TF-IDF de n-gramas hasheados, guardados esparsos em arrays NumPy.
+
+    Cada linha de long_term_context guarda só os termos que tem (índice do
+    hash e tf sublinear), agrupada por (thread_id, agent_type); o idf entra
+    na hora da busca, que lê apenas as listas dos termos da query. ``sync``
+    só vetoriza as linhas com id novo, inclusive as gravadas por outros
+    workers. O idf é recalculado quando o número de documentos cresce mais
+    que ``reweight_growth``; as normas de cada bloco acompanham sob demanda.
+
+    A carga inicial da tabela roda numa thread (``start_build``): o pedido
+    que a dispara segue sem esperar e as buscas só valem quando ``ready``.
+    Depois disso ``refresh`` indexa as linhas novas do mesmo jeito, então
+    nenhuma busca espera a vetorização de linhas recém-gravadas.
+
+    Memória: 12 bytes por termo distinto de cada linha (cerca de 1 KB numa
+    troca típica), em vez de ``4 * n_features`` por linha densa.
+    """
+
+    def __init__(self, pool: SQLitePool, n_features: int = 1024,
+                 reweight_growth: float = 0.1, batch_size: int = 2000,
+                 decode: Optional[Callable[[Any], Any]] = None):
+        self.pool = pool
+        # Linhas comprimidas (BLOB) precisam do ContextCodec para virar texto
+        self.decode = decode
+        self.n_features = n_features
+        self.reweight_growth = reweight_growth
+        self.batch_size = batch_size
+        self._blocks: Dict[Tuple[str, str], _Block] = {}
+        self._df = np.zeros(n_features, dtype=np.float32)
+        self._docs = 0
+        self._idf = np.ones(n_features, dtype=np.float32)
+        self._idf_docs = 0
+        self._idf_version = 0
+        self._last_id = 0
+        self._lock = threading.RLock()
+        self._sync_lock = threading.Lock()
+        self._ready = threading.Event()
+        self._builder: Optional[threading.Thread] = None
+
+    def __len__(self):
+        return self._docs
+
+    @property
+    def ready(self) -> bool:
+        """A carga inicial terminou: ``search`` enxerga todo o histórico"""
+        return self._ready.is_set()
+
+    def start_build(self) -> bool:
+        """True se o índice está pronto; senão dispara a carga inicial em segundo plano"""
+        if self._ready.is_set():
+            return True
+        self._spawn(self._build, "context-index-build")
+        return False
+
+    def refresh(self):
+        """Indexa em segundo plano as linhas novas (de qualquer worker), sem esperar por elas"""
+        if self._builder is not None and self._builder.is_alive():
+            return
+        with self.pool.connection() as conn:
+            last_id = conn.execute(SQL_SELECT_MAX_CONTEXT_ID).fetchone()[0] or 0
+        if last_id > self._last_id:
+            self._spawn(self._sync_quietly, "context-index-sync")
+
+    def _spawn(self, target, name: str):
+        # Uma thread por vez: carga inicial ou sincronização incremental
+        with self._lock:
+            if self._builder is None or not self._builder.is_alive():
+                self._builder = threading.Thread(target=target, name=name, daemon=True)
+                self._builder.start()
+
+    def _sync_quietly(self):
+        try:
+            self.sync()
+        except Exception as e:
+            print(f"⚠️ Índice de contexto não sincronizado: {e}")
+
+    def wait_ready(self, timeout: Optional[float] = None) -> bool:
+        return self._ready.wait(timeout)
+
+    def _build(self):
+        started = time.perf_counter()
+        try:
+            added = self.sync()
+        except Exception as e:
+            # O próximo start_build tenta de novo
+            print(f"⚠️ Índice de contexto não carregado: {e}")
+            return
+        self._ready.set()
+        print(f"🔎 Índice de contexto carregado: {added} entradas em {time.perf_counter() - started:.1f}s")
+
+    def _maybe_reweight(self):
+        if self._docs > math.ceil(self._idf_docs * (1 + self.reweight_growth)):
+            self._idf = (np.log((1 + self._docs) / (1 + self._df)) + 1).astype(np.float32)
+            self._idf_docs = self._docs
+            self._idf_version += 1
+
+    def add(self, row_id: int, thread_id: str, agent_type: str, text: str, reweight: bool = True):
+        """Indexa uma linha; o custo é o de vetorizar o próprio texto"""
+        counts = term_counts(text, self.n_features)
+        indices = np.flatnonzero(counts)
+        tf = (1 + np.log(counts[indices])).astype(np.float32)
+        with self._lock:
+            self._df[indices] += 1
+            self._docs += 1
+            block = self._blocks.get((thread_id, agent_type))
+            if block is None:
+                block = self._blocks[(thread_id, agent_type)] = _Block()
+            block.append(row_id, indices, tf)
+            self._last_id = max(self._last_id, row_id)
+            if reweight:
+                self._maybe_reweight()
+
+    def sync(self) -> int:
+        """Indexa as linhas com id maior que o último visto; retorna quantas"""
+        added = 0
+        with self._sync_lock:
+            while True:
+                with self.pool.connection() as conn:
+                    rows = conn.execute(SQL_SELECT_NEW_CONTEXT, (self._last_id, self.batch_size)).fetchall()
+                for row_id, thread_id, agent_type, content in rows:
+                    if isinstance(content, bytes) and self.decode:
+                        content = self.decode(content)
+                    self.add(row_id, thread_id, agent_type, context_text(content), reweight=False)
+                added += len(rows)
+                with self._lock:
+                    self._maybe_reweight()
+                if len(rows) < self.batch_size:
+                    return added
+
+    def search(self, query: str, thread_id: str, agent_type: str, k: int = 5) -> List[Tuple[int, float]]:
+        """(id, similaridade de cosseno) das k linhas mais parecidas com a query"""
+        counts = term_counts(query, self.n_features)
+        indices = np.flatnonzero(counts)
+        with self._lock:
+            block = self._blocks.get((thread_id, agent_type))
+            if block is None or not block.size or not len(indices):
+                return []
+            idf = self._idf
+            ids, terms, rows, tf, norms = block.arrays(idf, self._idf_version)
+        q = (1 + np.log(counts[indices])) * idf[indices]
+        q /= np.linalg.norm(q)
+        # Fatia de cada termo da query nas listas invertidas, concatenadas sem laço Python
+        lo = np.searchsorted(terms, indices, "left")
+        lengths = np.searchsorted(terms, indices, "right") - lo
+        starts = np.cumsum(lengths) - lengths
+        postings = np.arange(lengths.sum()) - np.repeat(starts - lo, lengths)
+        if not len(postings):
+            # Nenhum termo da query aparece na thread (bincount vazio sairia inteiro)
+            return []
+        dots = np.bincount(rows[postings], weights=tf[postings] * np.repeat(q * idf[indices], lengths),
+                           minlength=len(ids))
+        scores = np.divide(dots, norms, out=np.zeros_like(dots), where=norms > 0)
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(int(ids[i]), float(scores[i])) for i in top if scores[i] > 0]
+
+    def discard(self, row_ids: List[int]):
+        """Remove ids que não existem mais na tabela (ex.: apagados pela retenção)"""
+        wanted = np.fromiter(row_ids, dtype=np.int64)
+        with self._lock:
+            for block in self._blocks.values():
+                positions = np.flatnonzero(np.isin(block.row_ids(), wanted))
+                if not len(positions):
+                    continue
+                np.subtract.at(self._df, block.remove(positions), 1)
+                self._docs -= len(positions)
@@ -0,0 +1,154 @@
+"""Busca textual (FTS5) no histórico salvo em long_term_context"""
+
+import json
+import math
+import re
+import time
+from collections import Counter
+from typing import Any, Callable, Dict, List, Optional
+
+from utils.sqlite_pool import SQLitePool
+from utils.text_features import normalize_text, tokenize
+
+SQL_MATCH_CONTEXT = '''
+    SELECT rowid, text FROM context_fts WHERE context_fts MATCH ?
+'''
+SQL_COUNT_MATCHES = '''
+    SELECT COUNT(*) FROM context_fts WHERE context_fts MATCH ?
+'''
+SQL_SNIPPET = '''
+    SELECT snippet(context_fts, 0, ?, ?, '…', ?)
+    FROM context_fts
+    WHERE context_fts MATCH ? AND rowid = ?
+'''
+SQL_SELECT_SEARCH_ROWS = '''
+    SELECT id, context_type, content, importance_score, created_at
+    FROM long_term_context
+    WHERE id IN ({placeholders})
+'''
+
+_TERM_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def query_terms(query: str) -> List[str]:
+    """Palavras da pergunta, normalizadas como no índice, sem repetição.
+
+    Não há busca por prefixo: um termo com ``*`` obriga o FTS5 a mesclar as
+    listas de todos os termos com aquele prefixo na tabela inteira.
+    """
+    return list(dict.fromkeys(normalize_text(word) for word in _TERM_RE.findall(query)))
+
+
+def thread_filter(thread_id: str, agent_type: str) -> str:
+    """Filtro FTS5 da thread: ``<thread_id>_<agent_type>`` é um único termo da coluna thread"""
+    scope = f"{thread_id or ''}_{agent_type or ''}".replace('"', '""')
+    return f'thread : "{scope}"'
+
+
+def match_expression(terms: List[str], thread_id: str, agent_type: str) -> str:
+    """Expressão MATCH segura: termos da pergunta (E lógico) restritos à thread.
+
+    Cada termo vira uma string entre aspas, então aspas, hífens e operadores
+    digitados pelo usuário nunca quebram a sintaxe do FTS5.
+    """
+    quoted = [f'"{term}"' for term in terms]
+    return f'text : ({" AND ".join(quoted)}) AND {thread_filter(thread_id, agent_type)}'
+
+
+class ContextSearch:
+    """Busca ranqueada (BM25), paginada e com trechos destacados.
+
+    O índice ``context_fts`` é mantido pelos triggers da migração v7; aqui
+    só há leitura. O MATCH já vem restrito à thread, então o custo depende
+    do tamanho da thread (limitado pela cota) e não da tabela inteira. O
+    BM25 é calculado aqui com as estatísticas da própria thread: o bm25()
+    do FTS5 percorreria a lista inteira de cada termo na tabela para obter
+    o IDF, o que custa dezenas de ms com milhões de linhas. Trechos e
+    linhas de long_term_context são lidos só para a página pedida.
+    """
+
+    def __init__(self, pool: SQLitePool, highlight=("<mark>", "</mark>"), snippet_tokens: int = 16,
+                 max_page_size: int = 50, k1: float = 1.2, b: float = 0.75,
+                 decode: Optional[Callable[[Any], Any]] = None):
+        self.pool = pool
+        # Conteúdo gravado (JSON ou BLOB comprimido) → objeto; ver ContextCodec.decode
+        self.decode = decode or json.loads
+        self.highlight = highlight
+        self.snippet_tokens = snippet_tokens
+        self.max_page_size = max_page_size
+        self.k1 = k1
+        self.b = b
+
+    def _rank(self, conn, hits: List[tuple], terms: List[str], thread_id: str, agent_type: str) -> List[tuple]:
+        scope = thread_filter(thread_id, agent_type)
+        total = conn.execute(SQL_COUNT_MATCHES, (scope,)).fetchone()[0] or 1
+        docs = [(row_id, Counter(tokenize(text or ""))) for row_id, text in hits]
+        avg_len = sum(sum(c.values()) for _, c in docs) / max(len(docs), 1) or 1.0
+
+        idf = {}
+        for term in terms:
+            df = conn.execute(SQL_COUNT_MATCHES, (f'text : "{term}" AND {scope}',)).fetchone()[0]
+            idf[term] = math.log(1 + (total - df + 0.5) / (df + 0.5))
+
+        scored = []
+        for row_id, counts in docs:
+            length = sum(counts.values())
+            score = 0.0
+            for term, weight in idf.items():
+                tf = counts.get(term, 0)
+                score += weight * tf * (self.k1 + 1) / (tf + self.k1 * (1 - self.b + self.b * length / avg_len))
+            scored.append((row_id, score))
+        # Empate: mais recente primeiro
+        scored.sort(key=lambda item: (-item[1], -item[0]))
+        return scored
+
+    def search(self, query: str, thread_id: str, agent_type: str = "default",
+               page: int = 1, page_size: int = 10) -> Dict[str, Any]:
+        started = time.perf_counter()
+        page = max(1, page)
+        page_size = max(1, min(page_size, self.max_page_size))
+        terms = query_terms(query)
+        results: List[Dict[str, Any]] = []
+        total = 0
+
+        if terms:
+            expression = match_expression(terms, thread_id, agent_type)
+            with self.pool.connection() as conn:
+                conn.execute("BEGIN")
+                hits = conn.execute(SQL_MATCH_CONTEXT, (expression,)).fetchall()
+                total = len(hits)
+                ranked = self._rank(conn, hits, terms, thread_id, agent_type)
+                current = ranked[(page - 1) * page_size:page * page_size]
+                snippets = {
+                    row_id: conn.execute(SQL_SNIPPET, (*self.highlight, self.snippet_tokens,
+                                                       expression, row_id)).fetchone()[0]
+                    for row_id, _ in current
+                }
+                rows = {}
+                if current:
+                    ids = [row_id for row_id, _ in current]
+                    sql = SQL_SELECT_SEARCH_ROWS.format(placeholders=",".join("?" * len(ids)))
+                    rows = {row[0]: row for row in conn.execute(sql, ids).fetchall()}
+            for row_id, score in current:
+                row = rows.get(row_id)
+                if row is None:
+                    continue
+                results.append({
+                    'id': row_id,
+                    'type': row[1],
+                    'content': self.decode(row[2]),
+                    'importance': row[3],
+                    'created_at': row[4],
+                    'snippet': snippets.get(row_id),
+                    'score': round(score, 4)
+                })
+
+        return {
+            "query": query,
+            "page": page,
+            "page_size": page_size,
+            "total": total,
+            "has_more": page * page_size < total,
+            "results": results,
+            "took_ms": round((time.perf_counter() - started) * 1000, 2),
+        }
@@ -0,0 +1,224 @@
+"""Classificador de intenções offline: naive Bayes multinomial sobre n-gramas hasheados
+
+Uso:
+    python -m utils.intent_classifier train data/intents/binance.jsonl data/intents/binance.npz
+    python -m utils.intent_classifier eval data/intents/binance.npz "análise de risco da posição"
+"""
+
+import argparse
+import json
+import os
+import time
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from utils.text_features import hash_features, ngram_features
+
+# Arquivos de treino (<nome>.jsonl) e pesos (<nome>.npz) de cada parser
+INTENTS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "intents")
+MODEL_VERSION = 1
+
+
+def load_examples(path: str) -> Tuple[List[str], List[str]]:
+    """Textos e rótulos de um JSONL com ``{"text": ..., "intent": ...}`` por linha"""
+    texts, labels = [], []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                record = json.loads(line)
+                texts.append(record["text"])
+                labels.append(record["intent"])
+    return texts, labels
+
+
+def _features(texts: Sequence[str], n_features: int) -> Tuple[np.ndarray, np.ndarray]:
+    """(linha, feature) de cada feature presente: presença, não contagem"""
+    rows, cols = [], []
+    for i, text in enumerate(texts):
+        indices = np.unique(hash_features(ngram_features(text or ""), n_features))
+        rows.append(np.full(len(indices), i, dtype=np.int64))
+        cols.append(indices)
+    if not rows:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    return np.concatenate(rows), np.concatenate(cols)
+
+
+def _softmax(logits: np.ndarray) -> np.ndarray:
+    shifted = np.exp(logits - logits.max(axis=1, keepdims=True))
+    return shifted / shifted.sum(axis=1, keepdims=True)
+
+
+class IntentClassifier:
+    """Naive Bayes multinomial sobre a presença das features, com escores calibrados.
+
+    Features são palavras, bigramas e trigramas de caracteres de
+    utils/text_features, hasheados em ``n_features`` posições; o modelo é
+    só uma matriz ``n_features x intenções`` de log-probabilidades. Os
+    logits do naive Bayes são confiantes demais, então ``fit`` ajusta uma
+    temperatura por validação cruzada (menor log-loss fora da amostra) e os
+    escores saem de ``softmax(logits / T)``.
+
+    ``classify_batch`` vetoriza milhares de mensagens: as features de todas
+    viram um único vetor de índices e os logits saem de um ``np.add.at``.
+    """
+
+    def __init__(self, classes: Sequence[str], log_prob: np.ndarray, log_prior: np.ndarray,
+                 temperature: float = 1.0, n_features: int = 1 << 13):
+        self.classes = list(classes)
+        self.log_prob = np.asarray(log_prob, dtype=np.float32)
+        self.log_prior = np.asarray(log_prior, dtype=np.float32)
+        self.temperature = float(temperature)
+        self.n_features = n_features
+
+    @classmethod
+    def _train(cls, rows: np.ndarray, cols: np.ndarray, y: np.ndarray, docs: np.ndarray, n_classes: int,
+               n_features: int, alpha: float) -> Tuple[np.ndarray, np.ndarray]:
+        keep = docs[rows]
+        counts = np.zeros((n_features, n_classes), dtype=np.float64)
+        np.add.at(counts, (cols[keep], y[rows[keep]]), 1.0)
+        counts += alpha
+        log_prob = np.log(counts / counts.sum(axis=0, keepdims=True))
+        prior = np.bincount(y[docs], minlength=n_classes) + 1.0
+        return log_prob, np.log(prior / prior.sum())
+
+    @classmethod
+    def fit(cls, texts: Sequence[str], labels: Sequence[str], n_features: int = 1 << 13,
+            alpha: float = 0.1, folds: int = 5, seed: int = 0) -> "IntentClassifier":
+        classes = sorted(set(labels))
+        index = {c: i for i, c in enumerate(classes)}
+        y = np.array([index[label] for label in labels], dtype=np.int64)
+        rows, cols = _features(texts, n_features)
+
+        # Logits fora da amostra de cada exemplo, para calibrar a temperatura
+        fold_of = np.random.default_rng(seed).permutation(len(texts)) % folds
+        held_out = np.zeros((len(texts), len(classes)))
+        for k in range(folds):
+            log_prob, log_prior = cls._train(rows, cols, y, fold_of != k, len(classes), n_features, alpha)
+            logits = np.tile(log_prior, (len(texts), 1))
+            np.add.at(logits, rows, log_prob[cols])
+            held_out[fold_of == k] = logits[fold_of == k]
+        temperatures = np.logspace(-1, 2.5, 60)
+        losses = [-np.log(_softmax(held_out / t)[np.arange(len(y)), y] + 1e-12).mean() for t in temperatures]
+        temperature = float(temperatures[int(np.argmin(losses))])
+
+        log_prob, log_prior = cls._train(rows, cols, y, np.ones(len(y), dtype=bool), len(classes),
+                                         n_features, alpha)
+        return cls(classes, log_prob, log_prior, temperature, n_features)
+
+    def predict_proba(self, texts: Sequence[str]) -> np.ndarray:
+        """Matriz ``len(texts) x intenções`` de probabilidades calibradas"""
+        rows, cols = _features(texts, self.n_features)
+        logits = np.tile(self.log_prior, (len(texts), 1))
+        np.add.at(logits, rows, self.log_prob[cols])
+        return _softmax(logits / self.temperature)
+
+    def classify_batch(self, texts: Sequence[str]) -> List[Tuple[str, float]]:
+        """(intenção, confiança) de cada mensagem"""
+        if not texts:
+            return []
+        proba = self.predict_proba(texts)
+        best = proba.argmax(axis=1)
+        return [(self.classes[i], float(proba[row, i])) for row, i in enumerate(best)]
+
+    def classify(self, text: str) -> Tuple[str, float]:
+        return self.classify_batch([text])[0]
+
+    def scores(self, text: str) -> Dict[str, float]:
+        """Probabilidade de cada intenção para uma mensagem"""
+        return {c: round(float(p), 4) for c, p in zip(self.classes, self.predict_proba([text])[0])}
+
+    def save(self, path: str):
+        # np.savez sem compressão: o load é um memcpy (poucos ms)
+        with open(path, "wb") as f:
+            np.savez(f, version=MODEL_VERSION, classes=np.array(self.classes), log_prob=self.log_prob,
+                     log_prior=self.log_prior, temperature=self.temperature, n_features=self.n_features)
+
+    @classmethod
+    def load(cls, path: str) -> "IntentClassifier":
+        with np.load(path, allow_pickle=False) as data:
+            if int(data["version"]) != MODEL_VERSION:
+                raise ValueError(f"Pesos de intenção {path} na versão {int(data['version'])}; "
+                                 f"esperado {MODEL_VERSION} (treine de novo)")
+            return cls([str(c) for c in data["classes"]], data["log_prob"], data["log_prior"],
+                       float(data["temperature"]), int(data["n_features"]))
+
+
+def load_classifier(name: str, directory: str = INTENTS_DIR) -> Optional[IntentClassifier]:
+    """Pesos pré-calculados ``<directory>/<name>.npz``; None se não houver (só palavras-chave)"""
+    if os.getenv("AGENT_INTENT_CLASSIFIER", "on") == "off":
+        return None
+    path = os.path.join(directory, f"{name}.npz")
+    if not os.path.exists(path):
+        return None
+    try:
+        return IntentClassifier.load(path)
+    except Exception as e:
+        print(f"⚠️ Classificador de intenções {name} indisponível: {e}")
+        return None
+
+
+def rank_with_fallback(classifier: Optional[IntentClassifier], engine, mensagens: Sequence[str],
+                       min_confidence: float, min_score: float = 0.2,
+                       max_intents: int = 3) -> List[List[Tuple[str, float]]]:
+    """Ranking ``[(intenção, escore), ...]`` de cada mensagem, a principal primeiro.
+
+    Com o classificador confiante (maior escore >= ``min_confidence``)
+    entram as intenções com escore >= ``min_score``, completadas (até
+    ``max_intents``) pelas palavras-chave do ``engine`` (IntentEngine)
+    presentes na mensagem; senão valem só as palavras-chave, em ordem de
+    prioridade.
+    """
+    if classifier is None:
+        return [engine.rank(m)[:max_intents] for m in mensagens]
+    proba = classifier.predict_proba([m or "" for m in mensagens])
+    order = np.argsort(-proba, axis=1)[:, :max_intents]
+    ranked = []
+    for m, scores, top in zip(mensagens, proba, order):
+        if not m or scores[top[0]] < min_confidence:
+            ranked.append(engine.rank(m)[:max_intents])
+            continue
+        ranking = [(classifier.classes[i], round(float(scores[i]), 4))
+                   for i in top if i == top[0] or scores[i] >= min_score]
+        # Softmax concentra a massa numa intenção só: pedidos mistos perderiam a segunda.
+        # As palavras-chave encontradas entram depois, com o escore que o classificador deu
+        seen = {intent for intent, _ in ranking}
+        for intent in (engine.intents[p] for p in sorted(engine.matches(m))):
+            if len(ranking) >= max_intents:
+                break
+            if intent not in seen:
+                seen.add(intent)
+                score = scores[classifier.classes.index(intent)] if intent in classifier.classes else 0.0
+                ranking.append((intent, round(float(score), 4)))
+        ranked.append(ranking)
+    return ranked
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Treina/avalia o classificador de intenções")
+    sub = parser.add_subparsers(dest="command", required=True)
+    train = sub.add_parser("train", help="JSONL rotulado → pesos .npz")
+    train.add_argument("examples")
+    train.add_argument("weights")
+    train.add_argument("--n-features", type=int, default=1 << 13)
+    train.add_argument("--alpha", type=float, default=0.1)
+    evaluate = sub.add_parser("eval", help="escores de uma ou mais mensagens")
+    evaluate.add_argument("weights")
+    evaluate.add_argument("mensagens", nargs="+")
+    args = parser.parse_args()
+
+    if args.command == "train":
+        texts, labels = load_examples(args.examples)
+        started = time.perf_counter()
+        model = IntentClassifier.fit(texts, labels, args.n_features, args.alpha)
+        model.save(args.weights)
+        print(f"🧠 {len(texts)} exemplos, {len(model.classes)} intenções, T={model.temperature:.2f} "
+              f"em {time.perf_counter() - started:.2f}s → {args.weights}")
+    else:
+        model = IntentClassifier.load(args.weights)
+        for mensagem in args.mensagens:
+            print(mensagem, "→", model.scores(mensagem))
+
+
+if __name__ == "__main__":
+    main()
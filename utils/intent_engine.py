@@ -0,0 +1,145 @@
+"""Motor de intenções: tabela de palavras-chave compilada numa única regex"""
+
+import re
+import unicodedata
+from typing import Dict, FrozenSet, Iterable, List, Optional, Sequence, Tuple
+
+# (intenção, palavras-chave), em ordem de prioridade: a primeira intenção
+# com alguma palavra presente na mensagem vence
+IntentRules = Sequence[Tuple[str, Sequence[str]]]
+
+# Tabelas com até essa quantidade de palavras são varridas com ``in``, uma
+# palavra por vez: abaixo disso a regex custa mais do que economiza
+SCAN_MAX_KEYWORDS = 100
+
+
+def fold_accents(text: str) -> str:
+    """Minúsculas e sem acentos ('Análise' → 'analise'), em código C.
+
+    Mensagens só com ASCII, a maioria, saem direto do lower(); nas demais o
+    NFKD separa os acentos e o encode descarta o que não é ASCII.
+    """
+    text = text.lower()
+    if text.isascii():
+        return text
+    return unicodedata.normalize("NFKD", text).encode("ascii", "ignore").decode("ascii")
+
+
+def _trie_pattern(words: Iterable[str]) -> str:
+    """Alternância fatorada por prefixo ('apost(?:ar|a)'): cada posição é
+    testada descendo uma árvore, não comparando palavra por palavra, e os
+    ramos mais longos vêm primeiro, então a regex casa a maior palavra
+    que começa ali."""
+    trie: Dict[str, dict] = {}
+    for word in words:
+        node = trie
+        for ch in word:
+            node = node.setdefault(ch, {})
+        node[""] = {}
+
+    def build(node: Dict[str, dict]) -> str:
+        ends_here = "" in node
+        branches = [re.escape(ch) + build(child) for ch, child in sorted(node.items()) if ch]
+        if not branches:
+            return ""
+        body = branches[0] if len(branches) == 1 else f"(?:{'|'.join(branches)})"
+        if ends_here:
+            return f"(?:{body})?" if len(branches) == 1 else f"{body}?"
+        return body
+
+    return build(trie)
+
+
+def _rewind(word: str, words: Iterable[str]) -> int:
+    """Tamanho do maior sufixo próprio de ``word`` que começa outra palavra mais longa.
+
+    Depois de casar ``word`` a busca recua isso: uma palavra que começa
+    dentro dela e termina depois ('apost[a]' + '[a]nalise') ainda é vista.
+    """
+    for k in range(len(word) - 1, 0, -1):
+        suffix = word[-k:]
+        if any(len(other) > k and other.startswith(suffix) for other in words):
+            return k
+    return 0
+
+
+class IntentEngine:
+    """Classifica uma mensagem numa única passada, com prioridade vinda dos dados.
+
+    Todas as palavras das regras (sem acento) viram uma regex só, fatorada
+    por prefixo: cada busca desce uma árvore em vez de testar palavra por
+    palavra e casa a maior palavra que começa na posição. Cada palavra
+    carrega as intenções das palavras contidas nela e, quando uma palavra
+    pode continuar em outra, a busca seguinte recua até o ponto da
+    sobreposição, então o resultado é exatamente o do ``palavra in
+    mensagem``. O custo é proporcional ao tamanho da mensagem, não ao número
+    de regras. Tabelas pequenas (até ``scan_max_keywords`` palavras) não
+    compensam a regex e são varridas com ``in``, em ordem de prioridade.
+    """
+
+    def __init__(self, rules: IntentRules, default: str = "geral",
+                 scan_max_keywords: int = SCAN_MAX_KEYWORDS):
+        self.default = default
+        self.intents: List[str] = []
+        owners: Dict[str, set] = {}
+        # (palavra, prioridade) na ordem das regras: na varredura, a primeira presente decide
+        pairs: List[Tuple[str, int]] = []
+        for priority, (intent, keywords) in enumerate(rules):
+            self.intents.append(intent)
+            for keyword in keywords:
+                word = fold_accents(keyword)
+                pairs.append((word, priority))
+                owners.setdefault(word, set()).add(priority)
+        self._scan: Optional[List[Tuple[str, int]]] = None
+        if len(owners) <= scan_max_keywords:
+            self._scan = pairs
+        else:
+            # Prioridades de cada palavra, somando as palavras que ela contém
+            self._priorities: Dict[str, FrozenSet[int]] = {
+                word: frozenset(p for other, ps in owners.items() if other in word for p in ps)
+                for word in owners
+            }
+            self._best: Dict[str, int] = {word: min(ps) for word, ps in self._priorities.items()}
+            self._rewind: Dict[str, int] = {word: _rewind(word, owners) for word in owners}
+            self._search = re.compile(_trie_pattern(owners)).search
+
+    def _words(self, text: str) -> List[str]:
+        found = []
+        match = self._search(text)
+        while match:
+            word = match.group()
+            found.append(word)
+            match = self._search(text, match.end() - self._rewind[word])
+        return found
+
+    def matches(self, mensagem: Optional[str]) -> FrozenSet[int]:
+        """Prioridades (índices das regras) com alguma palavra na mensagem"""
+        if not mensagem:
+            return frozenset()
+        text = fold_accents(mensagem)
+        if self._scan is not None:
+            return frozenset(p for word, p in self._scan if word in text)
+        return frozenset(p for word in self._words(text) for p in self._priorities[word])
+
+    def rank(self, mensagem: Optional[str]) -> List[Tuple[str, float]]:
+        """Todas as intenções presentes, em ordem de prioridade (escore 1.0: palavra encontrada)"""
+        found = self.matches(mensagem)
+        if not found:
+            return [(self.default, 1.0)]
+        return [(self.intents[p], 1.0) for p in sorted(found)]
+
+    def classify(self, mensagem: Optional[str]) -> str:
+        """Intenção de maior prioridade presente na mensagem, ou ``default``"""
+        if not mensagem:
+            return self.default
+        text = fold_accents(mensagem)
+        if self._scan is not None:
+            for word, priority in self._scan:
+                if word in text:
+                    return self.intents[priority]
+            return self.default
+        found = self._words(text)
+        if not found:
+            return self.default
+        best = self._best
+        return self.intents[min(best[word] for word in found)]
@@ -1,105 +1,81 @@
 import re
-import asyncio
-from langchain_mcp_adapters.client import MultiServerMCPClient
+from typing import List, Tuple
+
+from utils.intent_classifier import load_classifier, rank_with_fallback
+from utils.intent_engine import IntentEngine
+from utils.mcp_pool import mcp_pool
+from utils.toolsets import Intencoes, intent_names, union_servers
+
+# Sessões MCP (e o circuit breaker de cada servidor) ficam no pool do processo (utils/mcp_pool)
+
+# Intenções em ordem de prioridade; acentos são ignorados na comparação
+INTENT_RULES = [
+    ("backend", ["serializer", "model", "view", "drf", "django"]),
+    ("frontend", ["react native", "component", "hook", "context", "tela"]),
+    ("refatoracao", ["refatore", "melhore", "otimize"]),
+    ("explicacao", ["explique", "o que faz", "entenda esse código"]),
+    ("debug", ["erro", "stacktrace", "exception"]),
+    ("snippet", ["snippet", "exemplo", "como faço"]),
+]
+
+_intent_engine = IntentEngine(INTENT_RULES)
+# Classificador treinado em data/intents/intencao.jsonl; abaixo da confiança
+# mínima (ou sem o arquivo de pesos) valem as palavras-chave
+_intent_classifier = load_classifier("intencao")
+MIN_CONFIDENCE = 0.5
 
-# Cache global para clientes MCP com controle de sessão
-_mcp_clients_cache = {}
-_session_locks = {}
-_fallback_mode = False
 
 def detectar_intencao(mensagem: str) -> str:
-    if not mensagem:
-        return "geral"
-
-    mensagem = mensagem.lower()
-
-    if "serializer" in mensagem or "model" in mensagem or "view" in mensagem or "drf" in mensagem or "django" in mensagem:
-        return "backend"
-    if "react native" in mensagem or "component" in mensagem or "hook" in mensagem or "context" or "tela" in mensagem:
-        return "frontend"
-    if "refatore" in mensagem or "melhore" in mensagem or "otimize" in mensagem:
-        return "refatoracao"
-    if "explique" in mensagem or "o que faz" in mensagem or "entenda esse código" in mensagem:
-        return "explicacao"
-    if "erro" in mensagem or "stacktrace" in mensagem or "exception" in mensagem:
-        return "debug"
-    if "snippet" in mensagem or "exemplo" in mensagem or "como faço" in mensagem:
-        return "snippet"
-
-    return "geral"
-
-
-async def carregar_tools_por_intencao(intencao: str, mcp_config: dict):
-    global _fallback_mode
-    
-    # Se já estamos em modo fallback, retornar lista vazia
-    if _fallback_mode:
-        print(f"🔄 Modo fallback ativo - agente funcionará sem ferramentas MCP")
-        return []
-    
-    # Tentar carregar ferramentas MCP com timeout reduzido
+    return ranquear_intencoes([mensagem])[0][0][0]
+
+
+def detectar_intencoes(mensagens: List[str]) -> List[str]:
+    """Versão em lote: o classificador pontua todas as mensagens de uma vez"""
+    return [ranking[0][0] for ranking in ranquear_intencoes(mensagens)]
+
+
+def ranquear_intencoes(mensagens: List[str]) -> List[List[Tuple[str, float]]]:
+    """Todas as intenções relevantes de cada mensagem, [(intenção, escore), ...], a principal primeiro"""
+    return rank_with_fallback(_intent_classifier, _intent_engine, mensagens, MIN_CONFIDENCE)
+
+
+async def carregar_tools_por_intencao(intencao: Intencoes, mcp_config: dict):
+    """Tools da intenção (ou do ranking de intenções); cada servidor MCP é conectado uma única vez"""
+    # Servidores com circuito aberto ficam de fora sem custo; os demais seguem normalmente
     try:
-        cache_key = f"{intencao}_{hash(str(mcp_config.get(intencao, mcp_config['geral'])))}"
+        nomes = intent_names(intencao)
+        # União dos servidores das intenções; mesmo endpoint com outro nome entra uma vez
+        sub_config = union_servers(mcp_config.get(nome, mcp_config["geral"]) for nome in nomes)
         
-        # Criar lock se não existir
-        if cache_key not in _session_locks:
-            _session_locks[cache_key] = asyncio.Lock()
-        
-        async with _session_locks[cache_key]:
-            # Verificar cache primeiro
-            if cache_key in _mcp_clients_cache:
-                try:
-                    tools = await asyncio.wait_for(_mcp_clients_cache[cache_key].get_tools(), timeout=5.0)
-                    print(f"✅ Ferramentas MCP carregadas do cache para {intencao}")
-                    return tools
-                except Exception:
-                    del _mcp_clients_cache[cache_key]
-            
-            # Tentar criar nova conexão com timeout muito baixo
-            sub_config = mcp_config.get(intencao, mcp_config["geral"])
-            mcp_client = MultiServerMCPClient(sub_config)
-            
-            # Timeout agressivo de apenas 8 segundos
-            tools = await asyncio.wait_for(mcp_client.get_tools(), timeout=8.0)
-            _mcp_clients_cache[cache_key] = mcp_client
-            print(f"✅ Nova conexão MCP estabelecida para {intencao}")
-            return tools
+        # Sessões já abertas são reaproveitadas; timeout agressivo de 8 segundos por servidor
+        tools = await mcp_pool.acquire_tools(sub_config, timeout=8.0)
+        print(f"✅ Ferramentas MCP prontas para {'+'.join(nomes)} ({len(sub_config)} servidores)")
+        return tools
             
     except Exception as e:
         print(f"⚠️ Falha nas ferramentas MCP: {e}")
-        print(f"🔄 Ativando modo fallback - agente continuará sem ferramentas MCP")
-        _fallback_mode = True
+        print(f"🔄 Agente continuará sem ferramentas MCP nesta resposta")
         return []
 
 
-# Função para tentar reativar MCP
+# Função para tentar reativar MCP já (as sondas do circuit breaker fazem isso sozinhas com o tempo)
 async def tentar_reativar_mcp():
-    global _fallback_mode
-    _fallback_mode = False
+    mcp_pool.reset_breakers()
     limpar_cache_mcp()
     print("🔄 Tentando reativar conexões MCP...")
 
 
 # Função para limpar cache
 def limpar_cache_mcp():
-    global _mcp_clients_cache, _session_locks
-    _mcp_clients_cache.clear()
-    _session_locks.clear()
+    mcp_pool.invalidate()
     print("🧹 Cache MCP limpo")
 
 
-# Função para verificar se está em modo fallback
+# Função para verificar se algum servidor MCP está em fallback (circuito aberto)
 def esta_em_fallback():
-    return _fallback_mode
+    return bool(mcp_pool.open_circuits())
 
 
 # Função para verificar status das conexões
 async def verificar_status_conexoes():
-    status = {}
-    for cache_key, client in _mcp_clients_cache.items():
-        try:
-            await asyncio.wait_for(client.get_tools(), timeout=5.0)
-            status[cache_key] = "OK"
-        except Exception as e:
-            status[cache_key] = f"ERRO: {e}"
-    return status
\ No newline at end of file
+    return mcp_pool.stats()
\ No newline at end of file
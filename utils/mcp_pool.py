@@ -0,0 +1,499 @@
+"""Pool de servidores MCP do processo: uma sessão (e um jogo de tools) por endpoint"""
+
+import asyncio
+import os
+import time
+from typing import Any, Dict, Iterable, List, Mapping, Optional, Tuple, Union
+
+from langchain_core.tools import BaseTool, StructuredTool, ToolException
+from langchain_mcp_adapters.sessions import create_session
+from langchain_mcp_adapters.tools import convert_mcp_tool_to_langchain_tool
+from mcp.types import Tool as MCPTool
+
+from utils.circuit_breaker import CLOSED, OPEN, CircuitBreaker, CircuitOpenError
+from utils.tool_result_cache import ToolResultCache, result_cache_from_env
+from utils.tool_schema_cache import ToolSchemaCache, schema_cache_from_env
+from utils.toolsets import server_identity
+
+# Sessão substituída pelo TTL ainda atende chamadas em andamento por este tempo
+RETIRE_GRACE = 60.0
+
+# Nomes registrados ou uma sub-config {nome: config} do MultiServerMCPClient
+Servidores = Union[Iterable[str], Mapping[str, dict]]
+
+
+def _root_cause(error: BaseException) -> BaseException:
+    """Primeira exceção real dentro dos ExceptionGroup do anyio/httpx"""
+    while getattr(error, "exceptions", None):
+        error = error.exceptions[0]
+    return error
+
+
+async def _list_tools(session) -> List[MCPTool]:
+    """tools/list com paginação"""
+    tools, cursor = [], None
+    while True:
+        page = await session.list_tools(cursor=cursor)
+        tools.extend(page.tools or [])
+        cursor = page.nextCursor
+        if not cursor:
+            return tools
+
+
+class _Endpoint:
+    """Sessão aberta num endpoint: as tools ficam ligadas a ela até o TTL vencer"""
+
+    __slots__ = ("name", "tools", "schemas", "opened_at", "stop", "task")
+
+    def __init__(self, name: str, tools: list, schemas: List[MCPTool], stop: asyncio.Event, task: asyncio.Task):
+        self.name = name
+        self.tools = tools
+        self.schemas = schemas
+        self.opened_at = time.monotonic()
+        self.stop = stop
+        self.task = task
+
+
+class MCPPool:
+    """Sessões MCP compartilhadas por todos os parsers e agentes do processo.
+
+    O ``MultiServerMCPClient`` sem sessão faz handshake e baixa os schemas
+    das tools a cada ``get_tools`` (e abre outra sessão a cada chamada de
+    tool). Aqui cada endpoint, identificado por URL + transporte
+    (``toolsets.server_identity``), tem uma sessão mantida aberta por uma
+    task dedicada; todos os nomes lógicos que apontam para ele (ex.:
+    ``automacao`` e ``analise_esportiva`` no context7) recebem as mesmas
+    tools. Depois de ``ttl`` segundos a sessão é reaberta no próximo uso,
+    em segundo plano: a antiga segue servindo até a nova entrar no lugar, e
+    se a reabertura falhar ela continua registrada.
+
+    Cada endpoint tem um CircuitBreaker: com o circuito aberto a conexão
+    falha na hora (sem pagar o timeout) e ``acquire_tools`` segue com os
+    demais servidores; uma task de sondas reconecta em segundo plano quando
+    o backoff vence, então o servidor volta sem intervenção manual.
+
+    Os servidores da API chamam ``warmup`` no startup (conexões e schemas
+    prontos antes do primeiro pedido) e ``start_refresh``, que renova cada
+    sessão em segundo plano antes do TTL vencer.
+
+    Com ``schema_cache``, um endpoint ainda sem sessão responde na hora com
+    as tools salvas em disco na última conexão: são proxies que, ao serem
+    chamadas, esperam a sessão de verdade (aberta em segundo plano) e
+    delegam para a tool viva de mesmo nome. O agente é montado sem esperar
+    a rede; só a primeira chamada de tool paga a conexão, se ainda faltar.
+
+    Com ``result_cache``, as tools idempotentes de cada sessão são
+    envolvidas pelo ToolResultCache (mesma tool + mesmos argumentos no
+    mesmo endpoint = resultado guardado, para todos os agentes do processo).
+    """
+
+    def __init__(self, ttl: float = 600.0, timeout: float = 8.0, failure_threshold: int = 2,
+                 base_backoff: float = 5.0, max_backoff: float = 300.0,
+                 schema_cache: Optional[ToolSchemaCache] = None, result_cache: Optional[ToolResultCache] = None):
+        self.ttl = ttl
+        self.schema_cache = schema_cache
+        self.result_cache = result_cache
+        self.timeout = timeout
+        self.failure_threshold = failure_threshold
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self._names: Dict[str, dict] = {}
+        self._endpoints: Dict[tuple, _Endpoint] = {}
+        # Abertura em andamento de cada endpoint (a sessão anterior segue servindo até ela terminar)
+        self._opening: Dict[tuple, asyncio.Task] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._aliases: Dict[tuple, set] = {}
+        self._retiring: List[_Endpoint] = []
+        self._breakers: Dict[tuple, CircuitBreaker] = {}
+        # Último (nome, config) de cada endpoint, para as sondas reconectarem
+        self._targets: Dict[tuple, Tuple[str, dict]] = {}
+        self._probe_task: Optional[asyncio.Task] = None
+        # Acorda o laço de sondas quando uma abertura termina (sucesso, falha ou abandono)
+        self._probe_wakeup = asyncio.Event()
+        self._refresh_targets: Dict[tuple, Tuple[str, dict]] = {}
+        self._refresh_task: Optional[asyncio.Task] = None
+        self.warmup_state: Dict[str, Any] = {"ready": False}
+        self._cached_tools: Dict[tuple, List[BaseTool]] = {}
+        self._connecting: Dict[tuple, asyncio.Task] = {}
+        self._stats = {"acquired": 0, "reused": 0, "opened": 0, "refreshed": 0, "errors": 0,
+                       "rejected": 0, "probes": 0, "from_disk": 0, "load_ms_total": 0.0, "load_ms_max": 0.0}
+
+    def register(self, config: Mapping[str, dict]):
+        """Torna os nomes de ``config`` utilizáveis em ``acquire_tools([nome, ...])``"""
+        self._names.update(config)
+
+    def _resolve(self, servers: Servidores) -> Dict[tuple, Tuple[str, dict]]:
+        """Endpoints distintos pedidos: identidade → (primeiro nome visto, config)"""
+        if isinstance(servers, Mapping):
+            items = list(servers.items())
+        else:
+            servers = list(servers)
+            missing = [name for name in servers if name not in self._names]
+            if missing:
+                raise KeyError(f"Servidores MCP não registrados: {missing}")
+            items = [(name, self._names[name]) for name in servers]
+        resolved: Dict[tuple, Tuple[str, dict]] = {}
+        for name, config in items:
+            identity = server_identity(config)
+            self._aliases.setdefault(identity, set()).add(name)
+            resolved.setdefault(identity, (name, config))
+        return resolved
+
+    def _check_loop(self):
+        # Sessões pertencem ao event loop que as abriu (asyncio.run novo = sessões novas)
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop = loop
+            self._endpoints.clear()
+            self._opening.clear()
+            self._retiring.clear()
+            self._probe_task = None
+            self._probe_wakeup = asyncio.Event()
+            self._refresh_task = None
+            self._connecting.clear()
+
+    async def acquire_tools(self, servers: Servidores, timeout: Optional[float] = None) -> List[Any]:
+        """Tools dos servidores pedidos, abrindo só as sessões que faltam (em paralelo).
+
+        Servidores que falham (ou com circuito aberto) ficam de fora; só
+        levanta a exceção se nenhum dos pedidos respondeu.
+        """
+        self._check_loop()
+        resolved = self._resolve(servers)
+        results = await asyncio.gather(*(self._acquire(identity, name, config, timeout)
+                                         for identity, (name, config) in resolved.items()),
+                                       return_exceptions=True)
+        tools, errors = [], []
+        for (name, _), result in zip(resolved.values(), results):
+            if isinstance(result, BaseException):
+                errors.append(result)
+                print(f"⚠️ Servidor MCP {name} indisponível: {result}")
+            else:
+                tools.extend(result)
+        if errors and len(errors) == len(results):
+            raise errors[0]
+        return tools
+
+    async def acquire_server(self, name: str, config: dict, timeout: Optional[float] = None) -> List[Any]:
+        """Tools de um único servidor (para quem trata falhas servidor a servidor)"""
+        self._check_loop()
+        identity = server_identity(config)
+        self._aliases.setdefault(identity, set()).add(name)
+        return await self._acquire(identity, name, config, timeout)
+
+    async def _acquire(self, identity: tuple, name: str, config: dict, timeout: Optional[float],
+                       max_age: Optional[float] = None, background: bool = False) -> List[Any]:
+        # Aquisições de fundo (warmup, renovação, sondas) não entram na taxa de reuso
+        if not background:
+            self._stats["acquired"] += 1
+        endpoint = self._fresh(identity, max_age)
+        if endpoint is not None:
+            self._stats["reused"] += not background
+            return endpoint.tools
+        self._targets[identity] = (name, config)
+        # Sessão vencida mas viva: continua servindo até a nova entrar no lugar
+        current = self._endpoints.get(identity)
+        if current is not None and current.task.done():
+            current = None
+        if not background and current is None:
+            cached = self._from_disk(identity, name, config, timeout)
+            if cached is not None:
+                self._stats["from_disk"] += 1
+                return cached
+        # Uma abertura por endpoint, compartilhada por todos que chegam enquanto ela corre
+        opening = self._opening.get(identity)
+        if opening is None:
+            breaker = self._breaker(identity)
+            if not breaker.allow():
+                self._stats["rejected"] += 1
+                if current is not None:
+                    return current.tools
+                raise CircuitOpenError(f"circuito aberto, nova tentativa em {breaker.seconds_to_retry():.0f}s")
+            opening = self._opening[identity] = asyncio.get_running_loop().create_task(
+                self._reopen(identity, name, config, timeout), name=f"mcp-open-{name}")
+            # A falha já foi contada no breaker; só evita o aviso de exceção não lida
+            opening.add_done_callback(lambda t: t.cancelled() or t.exception())
+        # Só a renovação (max_age explícito) espera a sessão nova; os demais seguem com a atual
+        if current is not None and max_age is None:
+            self._stats["reused"] += not background
+            return current.tools
+        # shield: quem desiste da espera não cancela a abertura que outros aguardam
+        return await asyncio.shield(opening)
+
+    async def _reopen(self, identity: tuple, name: str, config: dict, timeout: Optional[float]) -> List[Any]:
+        """Abre a sessão fora de ``_endpoints`` e só então a troca pela antiga; falha deixa a antiga intacta"""
+        breaker = self._breaker(identity)
+        started = time.perf_counter()
+        try:
+            endpoint = await self._open(name, config, self.timeout if timeout is None else timeout)
+        except asyncio.CancelledError:
+            # Abertura interrompida (aclose): não diz nada sobre a saúde do servidor
+            breaker.abandon()
+            raise
+        except BaseException as e:
+            self._stats["errors"] += 1
+            breaker.record_failure(e)
+            if breaker.state == OPEN:
+                print(f"🚫 Circuito MCP de {name} aberto por {breaker.backoff:.0f}s: {e!r}")
+                self._schedule_probes()
+            raise
+        finally:
+            self._opening.pop(identity, None)
+            self._probe_wakeup.set()
+        breaker.record_success()
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        stale = self._endpoints.get(identity)
+        self._endpoints[identity] = endpoint
+        self._stats["opened"] += 1
+        self._stats["refreshed"] += stale is not None
+        self._stats["load_ms_total"] += elapsed_ms
+        self._stats["load_ms_max"] = max(self._stats["load_ms_max"], elapsed_ms)
+        if stale is not None:
+            self._retire(stale)
+        if self.schema_cache is not None:
+            schemas = [s.model_dump(mode="json", exclude_none=True) for s in endpoint.schemas]
+            try:
+                if await asyncio.to_thread(self.schema_cache.save, identity, schemas):
+                    self._cached_tools.pop(identity, None)
+            except OSError as e:
+                print(f"⚠️ Cache de schemas MCP não gravado: {e}")
+        print(f"🔌 Sessão MCP {name} aberta em {elapsed_ms:.0f}ms ({len(endpoint.tools)} tools)")
+        return endpoint.tools
+
+    def _from_disk(self, identity: tuple, name: str, config: dict, timeout: Optional[float]) -> Optional[List[BaseTool]]:
+        """Proxies das tools salvas em disco, disparando a conexão de verdade em segundo plano"""
+        if self.schema_cache is None or self._breaker(identity).state != CLOSED:
+            return None
+        tools = self._cached_tools.get(identity)
+        if tools is None:
+            schemas = self.schema_cache.load(identity)
+            if schemas is None:
+                return None
+            tools = self._cached_tools[identity] = [self._proxy_tool(identity, name, config, MCPTool.model_validate(s))
+                                                    for s in schemas]
+        task = self._connecting.get(identity)
+        if task is None or task.done():
+            task = asyncio.get_running_loop().create_task(
+                self._acquire(identity, name, config, timeout, background=True), name=f"mcp-connect-{name}")
+            # A falha já foi contada no breaker; só evita o aviso de exceção não lida
+            task.add_done_callback(lambda t: t.cancelled() or t.exception())
+            self._connecting[identity] = task
+        return tools
+
+    def _proxy_tool(self, identity: tuple, name: str, config: dict, schema: MCPTool) -> BaseTool:
+        # Mesmo nome, descrição e args da tool real (convertida sem sessão), mas a execução
+        # espera a sessão compartilhada e delega para a tool viva
+        template = convert_mcp_tool_to_langchain_tool(None, schema, connection=config)
+
+        async def call_tool(**arguments):
+            try:
+                live = await self._acquire(identity, name, config, None, background=True)
+            except Exception as e:
+                raise ToolException(f"Servidor MCP {name} indisponível: {_root_cause(e)}") from e
+            for tool in live:
+                if tool.name == schema.name:
+                    return await tool.coroutine(**arguments)
+            raise ToolException(f"Tool {schema.name} não existe mais no servidor MCP {name}")
+
+        return StructuredTool(name=template.name, description=template.description, args_schema=template.args_schema,
+                              coroutine=call_tool, response_format=template.response_format,
+                              metadata=template.metadata)
+
+    def _breaker(self, identity: tuple) -> CircuitBreaker:
+        breaker = self._breakers.get(identity)
+        if breaker is None:
+            breaker = self._breakers[identity] = CircuitBreaker(self.failure_threshold, self.base_backoff,
+                                                                self.max_backoff)
+        return breaker
+
+    def _schedule_probes(self):
+        if self._probe_task is None or self._probe_task.done():
+            self._probe_task = asyncio.get_running_loop().create_task(self._probe_loop(), name="mcp-circuit-probes")
+
+    async def _probe_loop(self):
+        """Sonda meio-aberta de cada circuito vencido, até todos fecharem.
+
+        Dorme até o prazo mais próximo. Circuitos meio-abertos sem sonda em
+        andamento (tentativa abandonada) são sondados na hora; os que têm uma
+        sonda em andamento acordam o laço quando ela termina.
+        """
+        while True:
+            self._probe_wakeup.clear()
+            broken = {identity: b for identity, b in self._breakers.items() if b.state != CLOSED}
+            if not broken:
+                return
+            waits = [b.seconds_to_retry() for b in broken.values() if b.state == OPEN or b.probe_due()]
+            try:
+                await asyncio.wait_for(self._probe_wakeup.wait(), min(waits) if waits else None)
+            except asyncio.TimeoutError:
+                pass
+            for identity, breaker in broken.items():
+                if not breaker.probe_due():
+                    continue
+                name, config = self._targets[identity]
+                self._stats["probes"] += 1
+                try:
+                    # max_age=0: a sonda espera uma sessão nova, não a antiga que ainda serve
+                    await self._acquire(identity, name, config, None, 0.0, background=True)
+                    print(f"✅ Servidor MCP {name} respondeu à sonda; circuito fechado")
+                except Exception:
+                    pass
+
+    def open_circuits(self) -> List[str]:
+        """Nomes dos servidores com circuito aberto ou em sondagem"""
+        return [self._targets[identity][0] for identity, b in self._breakers.items() if b.state != CLOSED]
+
+    def reset_breakers(self):
+        for breaker in self._breakers.values():
+            breaker.reset()
+
+    def _retire(self, endpoint: _Endpoint):
+        def close():
+            endpoint.stop.set()
+            if endpoint in self._retiring:
+                self._retiring.remove(endpoint)
+        self._retiring.append(endpoint)
+        asyncio.get_running_loop().call_later(RETIRE_GRACE, close)
+
+    def _fresh(self, identity: tuple, max_age: Optional[float] = None) -> Optional[_Endpoint]:
+        endpoint = self._endpoints.get(identity)
+        if endpoint is None or endpoint.task.done():
+            return None
+        max_age = self.ttl if max_age is None else max_age
+        if max_age is not None and time.monotonic() - endpoint.opened_at > max_age:
+            return None
+        return endpoint
+
+    async def warmup(self, servers: Servidores) -> Dict[str, Any]:
+        """Conecta e carrega os schemas de todos os servidores; nunca levanta exceção"""
+        self._check_loop()
+        self.warmup_state = {"ready": False, "started_at": time.time()}
+        started = time.perf_counter()
+        resolved = self._resolve(servers)
+        results = await asyncio.gather(*(self._acquire(identity, name, config, None, background=True)
+                                         for identity, (name, config) in resolved.items()),
+                                       return_exceptions=True)
+        ok = [name for (name, _), r in zip(resolved.values(), results) if not isinstance(r, BaseException)]
+        failed = {name: repr(r) for (name, _), r in zip(resolved.values(), results) if isinstance(r, BaseException)}
+        self.warmup_state = {
+            "ready": True,
+            "servers": ok,
+            "failed": failed,
+            "tools": sum(len(r) for r in results if not isinstance(r, BaseException)),
+            "warmup_ms": round((time.perf_counter() - started) * 1000, 1),
+        }
+        print(f"🔥 Warmup MCP: {len(ok)}/{len(resolved)} servidores em {self.warmup_state['warmup_ms']:.0f}ms")
+        return self.warmup_state
+
+    def start_refresh(self, servers: Servidores, interval: Optional[float] = None):
+        """Renova em segundo plano as sessões (e os schemas) antes do TTL vencer"""
+        self._check_loop()
+        self._refresh_targets.update(self._resolve(servers))
+        if self._refresh_task is None or self._refresh_task.done():
+            interval = interval or (self.ttl / 2 if self.ttl else 300.0)
+            self._refresh_task = asyncio.get_running_loop().create_task(self._refresh_loop(interval),
+                                                                        name="mcp-schema-refresh")
+
+    async def _refresh_loop(self, interval: float):
+        # Sessão com mais de ttl - interval segundos não chegaria viva à próxima volta
+        max_age = max(0.0, self.ttl - interval) if self.ttl else None
+        while True:
+            await asyncio.sleep(interval)
+            await asyncio.gather(*(self._acquire(identity, name, config, None, max_age, background=True)
+                                   for identity, (name, config) in list(self._refresh_targets.items())),
+                                 return_exceptions=True)
+
+    async def _open(self, name: str, config: dict, timeout: float) -> _Endpoint:
+        """Abre a sessão numa task que a mantém viva até ``stop`` ser sinalizado"""
+        ready = asyncio.get_running_loop().create_future()
+        stop = asyncio.Event()
+
+        async def keep_alive():
+            try:
+                async with create_session(config) as session:
+                    await session.initialize()
+                    schemas = await _list_tools(session)
+                    tools = [convert_mcp_tool_to_langchain_tool(session, s) for s in schemas]
+                    if self.result_cache is not None:
+                        namespace = repr(server_identity(config))
+                        tools = [self.result_cache.wrap(tool, namespace) for tool in tools]
+                    if not ready.done():
+                        ready.set_result((tools, schemas))
+                    await stop.wait()
+            except BaseException as e:
+                if not ready.done():
+                    cause = _root_cause(e)
+                    ready.set_exception(cause if isinstance(cause, Exception) else ConnectionError(repr(cause)))
+                elif not stop.is_set():
+                    print(f"⚠️ Sessão MCP {name} encerrada: {e!r}")
+                if isinstance(e, asyncio.CancelledError):
+                    raise
+
+        task = asyncio.create_task(keep_alive(), name=f"mcp-session-{name}")
+        try:
+            tools, schemas = await asyncio.wait_for(asyncio.shield(ready), timeout)
+        except BaseException:
+            stop.set()
+            ready.cancel()
+            task.cancel()
+            raise
+        return _Endpoint(name, tools, schemas, stop, task)
+
+    def invalidate(self, servers: Optional[Servidores] = None):
+        """Fecha as sessões dos servidores (ou todas); o próximo uso reconecta"""
+        identities = list(self._endpoints) if servers is None else list(self._resolve(servers))
+        for identity in identities:
+            endpoint = self._endpoints.pop(identity, None)
+            if endpoint is not None:
+                endpoint.stop.set()
+
+    async def aclose(self):
+        # Conexões de fundo disparadas pelo cache de schemas também param aqui: esperadas
+        # antes de fechar as sessões, nenhuma termina depois registrando um endpoint órfão
+        tasks = [t for t in (self._probe_task, self._refresh_task, *self._connecting.values(), *self._opening.values())
+                 if t is not None]
+        self._connecting.clear()
+        self._opening.clear()
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        endpoints = list(self._endpoints.values()) + self._retiring
+        self._retiring = []
+        for endpoint in endpoints:
+            endpoint.stop.set()
+        self.invalidate()
+        await asyncio.gather(*(e.task for e in endpoints), return_exceptions=True)
+
+    def stats(self) -> Dict[str, Any]:
+        acquired = self._stats["acquired"]
+        opened = self._stats["opened"]
+        aliases = sum(len(names) for names in self._aliases.values())
+        return {
+            "endpoints": len(self._endpoints),
+            "aliases": aliases,
+            # Conexões poupadas por compartilhar endpoints entre nomes lógicos
+            "connections_saved": aliases - len(self._aliases),
+            "acquired": acquired,
+            "reused": self._stats["reused"],
+            "reuse_rate": round(self._stats["reused"] / acquired, 4) if acquired else 0.0,
+            "opened": opened,
+            "refreshed": self._stats["refreshed"],
+            "errors": self._stats["errors"],
+            "rejected_by_circuit": self._stats["rejected"],
+            "probes": self._stats["probes"],
+            "load_ms_avg": round(self._stats["load_ms_total"] / opened, 1) if opened else 0.0,
+            "load_ms_max": round(self._stats["load_ms_max"], 1),
+            "sessions": {e.name: {"tools": len(e.tools), "age_s": round(time.monotonic() - e.opened_at, 1)}
+                         for e in self._endpoints.values()},
+            "schema_cache": dict(self.schema_cache.stats(), served=self._stats["from_disk"])
+            if self.schema_cache is not None else None,
+            "results": self.result_cache.stats() if self.result_cache is not None else None,
+            "circuits": {self._targets[identity][0]: b.stats() for identity, b in self._breakers.items()},
+        }
+
+
+# Pool único do processo, compartilhado pelos parsers de intenção e pelos agentes
+mcp_pool = MCPPool(ttl=float(os.getenv("AGENT_MCP_TTL", "600")),
+                   timeout=float(os.getenv("AGENT_MCP_TIMEOUT", "8")),
+                   schema_cache=schema_cache_from_env(),
+                   result_cache=result_cache_from_env())
@@ -0,0 +1,168 @@
+"""Compactação da memória: resumos contínuos do histórico e janela de mensagens"""
+
+import re
+from typing import Any, Callable, Dict, List, Optional
+
+from utils.context_builder import entry_text, estimate_tokens, truncate_to_tokens
+
+SUMMARY_TYPE = "summary"
+# Acima do que qualquer agente grava (1-3): o resumo sempre entra primeiro no
+# contexto e nunca expira pela política de retenção (importance_score < 3)
+SUMMARY_IMPORTANCE = 5
+
+SQL_SELECT_THREADS_TO_COMPACT = '''
+    SELECT thread_id, agent_type, COUNT(*)
+    FROM long_term_context
+    WHERE context_type != ?
+    GROUP BY thread_id, agent_type
+    HAVING COUNT(*) > ?
+'''
+SQL_SELECT_THREAD_ROWS = '''
+    SELECT id, context_type, content, importance_score, created_at, user_id
+    FROM long_term_context
+    WHERE thread_id = ? AND agent_type = ?
+    ORDER BY id
+'''
+SQL_INSERT_COMPACTION = '''
+    INSERT INTO context_compactions
+    (thread_id, agent_type, kind, tokens_before, tokens_after, items_folded)
+    VALUES (?, ?, ?, ?, ?, ?)
+'''
+
+_SENTENCE_RE = re.compile(r"(?<=[.!?])\s+")
+
+
+def extractive_summary(previous: Optional[str], entries: List[Dict[str, Any]], max_tokens: int) -> str:
+    """Resumo local, sem LLM: uma linha por turno (pergunta → 1ª frase da resposta).
+
+    As linhas do resumo anterior vêm antes das novas; se o total passar de
+    ``max_tokens``, as linhas mais antigas saem primeiro.
+    """
+    lines = [line for line in (previous or "").splitlines() if line.strip()]
+    for entry in entries:
+        content = entry.get("content")
+        if isinstance(content, dict) and ("prompt" in content or "response" in content):
+            answer = _SENTENCE_RE.split(str(content.get("response", "")).strip(), 1)[0]
+            line = f"- [{entry.get('type')}] {str(content.get('prompt', '')).strip()} → {answer}"
+        else:
+            line = f"- [{entry.get('type')}] {entry_text(entry)}"
+        lines.append(truncate_to_tokens(line, 60))
+
+    while len(lines) > 1 and estimate_tokens("\n".join(lines)) > max_tokens:
+        lines.pop(0)
+    return truncate_to_tokens("\n".join(lines), max_tokens)
+
+
+class MemoryCompactor:
+    """Dobra os turnos antigos de cada thread num resumo contínuo.
+
+    Threads com mais de ``keep_last + min_fold`` turnos têm tudo, exceto os
+    ``keep_last`` mais recentes, substituído por uma única linha
+    ``context_type='summary'`` (importância alta) que acumula o resumo
+    anterior. ``summarize(previous, entries, max_tokens)`` pode ser trocado
+    por um resumo feito por LLM; o padrão é extrativo e não faz chamadas
+    externas. Cada compactação grava os tokens antes/depois em
+    context_compactions.
+    """
+
+    def __init__(self, memory_manager, keep_last: int = 20, min_fold: int = 10,
+                 summary_tokens: int = 300, summarize: Optional[Callable[..., str]] = None):
+        self.memory_manager = memory_manager
+        self.pool = memory_manager.pool
+        self.codec = memory_manager.codec
+        self.keep_last = keep_last
+        self.min_fold = min_fold
+        self.summary_tokens = summary_tokens
+        self.summarize = summarize or extractive_summary
+
+    def compact_all(self) -> Dict[str, int]:
+        """Compacta todas as threads que passaram do limite"""
+        with self.pool.connection() as conn:
+            threads = conn.execute(
+                SQL_SELECT_THREADS_TO_COMPACT, (SUMMARY_TYPE, self.keep_last + self.min_fold)
+            ).fetchall()
+        folded = {}
+        for thread_id, agent_type, _ in threads:
+            folded[f"{agent_type}:{thread_id}"] = self.compact_thread(thread_id, agent_type)
+        return folded
+
+    def compact_thread(self, thread_id: str, agent_type: str) -> int:
+        """Compacta uma thread; retorna quantos turnos foram dobrados no resumo"""
+        with self.pool.connection() as conn:
+            rows = conn.execute(SQL_SELECT_THREAD_ROWS, (thread_id, agent_type)).fetchall()
+        entries = [{
+            "id": row[0],
+            "type": row[1],
+            "content": self.codec.decode(row[2]),
+            "importance": row[3],
+            "created_at": row[4],
+            "user_id": row[5],
+        } for row in rows]
+        summaries = [e for e in entries if e["type"] == SUMMARY_TYPE]
+        turns = [e for e in entries if e["type"] != SUMMARY_TYPE]
+        old = turns[:-self.keep_last] if self.keep_last else turns
+        if len(old) < self.min_fold:
+            return 0
+
+        previous = summaries[-1]["content"].get("summary") if summaries else None
+        folded_before = summaries[-1]["content"].get("turns", 0) if summaries else 0
+        # O resumo (possivelmente via LLM) é gerado fora da transação de escrita
+        summary = self.summarize(previous, old, self.summary_tokens)
+        tokens_before = sum(estimate_tokens(entry_text(e)) for e in entries)
+        tokens_after = estimate_tokens(summary) + sum(estimate_tokens(entry_text(e)) for e in turns[len(old):])
+
+        remove = [e["id"] for e in summaries + old]
+        placeholders = ",".join("?" * len(remove))
+        with self.pool.transaction() as conn:
+            # Outro worker pode ter compactado a mesma thread nesse meio-tempo
+            present = conn.execute(
+                f"SELECT COUNT(*) FROM long_term_context WHERE id IN ({placeholders})", remove
+            ).fetchone()[0]
+            if present != len(remove):
+                return 0
+            conn.execute(f"DELETE FROM long_term_context WHERE id IN ({placeholders})", remove)
+            conn.execute(*self.memory_manager.context_insert(
+                thread_id, agent_type, SUMMARY_TYPE, {
+                    "summary": summary,
+                    "turns": folded_before + len(old),
+                    "until": old[-1]["created_at"],
+                }, SUMMARY_IMPORTANCE, old[-1]["user_id"],
+            ))
+            conn.execute(SQL_INSERT_COMPACTION, (thread_id, agent_type, "context", tokens_before,
+                                                 tokens_after, len(old)))
+        self.memory_manager.context_index.discard(remove)
+        print(f"🗜️ Memória {agent_type}:{thread_id}: {len(old)} turnos resumidos, "
+              f"{tokens_before} → {tokens_after} tokens")
+        return len(old)
+
+
+def message_window(max_messages: int = 30,
+                   on_trim: Optional[Callable[[str, int, int, int], None]] = None):
+    """pre_model_hook do create_react_agent que mantém só as últimas mensagens.
+
+    Quando o histórico passa de ``max_messages``, ele é cortado para cerca de
+    dois terços disso (folga para não cortar a cada turno); as mensagens
+    antigas saem do próprio estado (e portanto do checkpoint), começando sempre
+    numa mensagem do usuário para não separar uma chamada de ferramenta da
+    sua resposta. ``on_trim(thread_id, tokens_antes, tokens_depois, removidas)``
+    é chamado a cada corte.
+    """
+    from langchain_core.messages import RemoveMessage, trim_messages
+    from langgraph.config import get_config
+    from langgraph.graph.message import REMOVE_ALL_MESSAGES
+
+    def _tokens(messages) -> int:
+        return sum(estimate_tokens(str(m.content)) for m in messages)
+
+    def hook(state):
+        messages = state["messages"]
+        if len(messages) <= max_messages:
+            return {"llm_input_messages": messages}
+        kept = trim_messages(messages, max_tokens=max_messages - max_messages // 3, token_counter=len,
+                             strategy="last", start_on="human", include_system=True, allow_partial=False)
+        if on_trim is not None:
+            thread_id = get_config().get("configurable", {}).get("thread_id", "")
+            on_trim(thread_id, _tokens(messages), _tokens(kept), len(messages) - len(kept))
+        return {"messages": [RemoveMessage(id=REMOVE_ALL_MESSAGES), *kept]}
+
+    return hook
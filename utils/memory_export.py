@@ -0,0 +1,259 @@
+"""Exportação/importação em streaming da memória persistente (JSONL comprimido)
+
+Uso:
+    python -m utils.memory_export export agent_memory.db backup.jsonl.gz
+    python -m utils.memory_export import backup.jsonl.gz novo_memory.db
+"""
+
+import argparse
+import gzip
+import json
+import os
+import sqlite3
+import time
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from utils.context_codec import ContextCodec
+
+# (tabela, colunas da chave de ordenação). memory_versions e memory_usage
+# ficam de fora: os triggers recriam carimbos e contadores durante a
+# importação. As cotas vêm primeiro para valerem já nos inserts seguintes.
+# Conteúdo comprimido sai como JSON (context_dictionaries também fica de
+# fora): o arquivo não depende do zstd e o destino decide se comprime.
+EXPORT_TABLES: List[Tuple[str, Tuple[str, ...]]] = [
+    ("memory_quotas", ("name",)),
+    ("conversations", ("id",)),
+    ("long_term_context", ("id",)),
+    ("user_preferences", ("id",)),
+    ("agent_sessions", ("id",)),
+    ("performance_metrics", ("id",)),
+    ("metric_rollups", ("granularity", "agent_type", "bucket_start", "metric_type")),
+    ("metric_rollup_state", ("id",)),
+    ("context_compactions", ("id",)),
+]
+
+
+def _columns(conn: sqlite3.Connection, table: str) -> List[str]:
+    return [row[1] for row in conn.execute(f"PRAGMA table_info({table})")]
+
+
+def _load_checkpoint(path: str) -> Dict[str, Any]:
+    if os.path.exists(path):
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    return {}
+
+
+def _save_checkpoint(path: str, state: Dict[str, Any]):
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(state, f)
+    os.replace(tmp, path)
+
+
+def iter_table(conn: sqlite3.Connection, table: str, key: Sequence[str], columns: List[str],
+               after: Optional[list] = None, batch_size: int = 5000) -> Iterator[List[tuple]]:
+    """Lotes de linhas em ordem de chave, a partir de ``after`` (exclusive)"""
+    order = ", ".join(key)
+    where = ""
+    params: list = []
+    if after is not None:
+        where = f"WHERE ({order}) > ({', '.join('?' * len(key))})"
+        params = list(after)
+    cursor = conn.execute(f"SELECT {', '.join(columns)} FROM {table} {where} ORDER BY {order}", params)
+    while True:
+        rows = cursor.fetchmany(batch_size)
+        if not rows:
+            return
+        yield rows
+
+
+def export_memory(db_path: str, out_path: str, tables: Optional[List[str]] = None,
+                  batch_size: int = 5000, resume: bool = True) -> Dict[str, int]:
+    """Exporta as tabelas da memória para JSONL gzip, em memória constante.
+
+    Cada lote vira um membro gzip independente; depois de gravado e
+    sincronizado, ``<out>.checkpoint`` registra a tabela, a última chave e o
+    tamanho do arquivo. Uma exportação interrompida recomeça do checkpoint
+    (o arquivo é truncado no último lote completo). A leitura acontece numa
+    única transação de leitura: em WAL isso dá um snapshot consistente sem
+    bloquear os servidores.
+    """
+    checkpoint_path = f"{out_path}.checkpoint"
+    state = _load_checkpoint(checkpoint_path) if resume else {}
+    done: Dict[str, int] = state.get("rows", {})
+    wanted = [(t, k) for t, k in EXPORT_TABLES if tables is None or t in tables]
+
+    conn = sqlite3.connect(db_path, isolation_level=None)
+    existing = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    mode = "r+b" if state and os.path.exists(out_path) else "wb"
+    codec = ContextCodec()
+    started = time.perf_counter()
+    try:
+        conn.execute("BEGIN")
+        with open(out_path, mode) as raw:
+            if mode == "r+b":
+                raw.truncate(state["offset"])
+                raw.seek(state["offset"])
+            for table, key in wanted:
+                if table not in existing or table in state.get("finished", []):
+                    continue
+                columns = _columns(conn, table)
+                key_index = [columns.index(k) for k in key]
+                packed = columns.index("content") if table == "long_term_context" else None
+                after = state.get("last_key") if state.get("table") == table else None
+                if after is None:
+                    _write_member(raw, [{"table": table, "columns": columns}])
+                for rows in iter_table(conn, table, key, columns, after, batch_size):
+                    if packed is not None:
+                        rows = [_unpack(row, packed, codec, conn) for row in rows]
+                    _write_member(raw, [{"t": table, "r": list(row)} for row in rows])
+                    done[table] = done.get(table, 0) + len(rows)
+                    state.update(table=table, last_key=[rows[-1][i] for i in key_index],
+                                 offset=raw.tell(), rows=done)
+                    _save_checkpoint(checkpoint_path, state)
+                state.setdefault("finished", []).append(table)
+                state.update(table=None, last_key=None, offset=raw.tell(), rows=done)
+                _save_checkpoint(checkpoint_path, state)
+        conn.execute("COMMIT")
+    finally:
+        conn.close()
+
+    os.remove(checkpoint_path)
+    total = sum(done.values())
+    print(f"📦 Memória exportada: {total} linhas em {time.perf_counter() - started:.1f}s → {out_path}")
+    return done
+
+
+def _unpack(row: tuple, index: int, codec: ContextCodec, conn: sqlite3.Connection) -> tuple:
+    if not isinstance(row[index], bytes):
+        return row
+    return row[:index] + (codec.decode_text(row[index], conn),) + row[index + 1:]
+
+
+def _write_member(raw, records: List[Dict[str, Any]]):
+    data = "".join(json.dumps(r, ensure_ascii=False, separators=(",", ":")) + "\n" for r in records)
+    raw.write(gzip.compress(data.encode("utf-8"), compresslevel=6))
+    raw.flush()
+    os.fsync(raw.fileno())
+
+
+def iter_records(path: str) -> Iterator[Dict[str, Any]]:
+    """Registros do arquivo exportado, um por vez"""
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def import_memory(in_path: str, db_path: str, batch_size: int = 50000,
+                  on_conflict: str = "REPLACE") -> Dict[str, int]:
+    """Importa um arquivo exportado com inserts em lote e transações grandes.
+
+    O progresso (linhas já aplicadas do arquivo) é gravado em
+    ``_memory_import_progress`` na mesma transação de cada lote, então uma
+    importação interrompida retoma exatamente de onde parou. Colunas que não
+    existem no banco de destino são ignoradas. ``on_conflict`` (REPLACE ou
+    IGNORE) decide o que fazer com ids já existentes; com REPLACE a conexão
+    liga ``recursive_triggers`` para a linha substituída sair das cotas e do FTS.
+    """
+    from utils.memory_manager import MemoryManager
+    from utils.memory_schema import analyze
+
+    # Garante schema e migrações no destino
+    MemoryManager(db_path, pool_size=1).close()
+
+    conn = sqlite3.connect(db_path, isolation_level=None)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA cache_size=-64000")
+    # INSERT OR REPLACE apaga a linha em conflito; sem recursive_triggers esse DELETE
+    # não dispara os triggers de cota/FTS e os contadores de memory_usage inflam
+    conn.execute("PRAGMA recursive_triggers=ON")
+    conn.execute("CREATE TABLE IF NOT EXISTS _memory_import_progress (source TEXT PRIMARY KEY, lines INTEGER)")
+    source = os.path.abspath(in_path)
+    row = conn.execute("SELECT lines FROM _memory_import_progress WHERE source = ?", (source,)).fetchone()
+    skip = row[0] if row else 0
+
+    counts: Dict[str, int] = {}
+    headers: Dict[str, Tuple[str, List[int]]] = {}
+    pending: Dict[str, List[list]] = {}
+    pending_rows = 0
+    line_no = 0
+    started = time.perf_counter()
+
+    def flush():
+        nonlocal pending_rows
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            for table, rows in pending.items():
+                sql, positions = headers[table]
+                conn.executemany(sql, ([r[i] for i in positions] for r in rows))
+                counts[table] = counts.get(table, 0) + len(rows)
+            conn.execute(
+                "INSERT INTO _memory_import_progress (source, lines) VALUES (?, ?) "
+                "ON CONFLICT (source) DO UPDATE SET lines = excluded.lines", (source, line_no))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        pending.clear()
+        pending_rows = 0
+
+    try:
+        for record in iter_records(in_path):
+            line_no += 1
+            if "columns" in record:
+                # Cabeçalhos são relidos mesmo ao retomar
+                table = record["table"]
+                target = set(_columns(conn, table))
+                positions = [i for i, c in enumerate(record["columns"]) if c in target]
+                names = [record["columns"][i] for i in positions]
+                headers[table] = (
+                    f"INSERT OR {on_conflict} INTO {table} ({', '.join(names)}) "
+                    f"VALUES ({', '.join('?' * len(names))})",
+                    positions,
+                )
+                continue
+            if line_no <= skip:
+                continue
+            pending.setdefault(record["t"], []).append(record["r"])
+            pending_rows += 1
+            if pending_rows >= batch_size:
+                flush()
+        flush()
+        conn.execute("DELETE FROM _memory_import_progress WHERE source = ?", (source,))
+        analyze(conn)
+    finally:
+        conn.close()
+
+    total = sum(counts.values())
+    elapsed = time.perf_counter() - started
+    print(f"📥 Memória importada: {total} linhas em {elapsed:.1f}s ({total / max(elapsed, 1e-9):.0f} linhas/s)")
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Exporta/importa a memória persistente dos agentes")
+    sub = parser.add_subparsers(dest="command", required=True)
+    exp = sub.add_parser("export", help="banco SQLite → JSONL gzip")
+    exp.add_argument("db_path")
+    exp.add_argument("out_path")
+    exp.add_argument("--tables", nargs="+")
+    exp.add_argument("--batch-size", type=int, default=5000)
+    exp.add_argument("--restart", action="store_true", help="ignora o checkpoint e recomeça")
+    imp = sub.add_parser("import", help="JSONL gzip → banco SQLite")
+    imp.add_argument("in_path")
+    imp.add_argument("db_path")
+    imp.add_argument("--batch-size", type=int, default=50000)
+    imp.add_argument("--on-conflict", choices=["REPLACE", "IGNORE"], default="REPLACE")
+    args = parser.parse_args()
+
+    if args.command == "export":
+        export_memory(args.db_path, args.out_path, args.tables, args.batch_size, resume=not args.restart)
+    else:
+        import_memory(args.in_path, args.db_path, args.batch_size, args.on_conflict)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,96 +1,233 @@
-from langgraph.checkpoint.sqlite.aio import AsyncSqliteSaver
-import sqlite3
-import json
+import asyncio
+import hashlib
 from datetime import datetime, timedelta
 import os
-import aiosqlite
 from typing import Dict, Any, Optional, List
 
+from utils.sqlite_pool import SQLitePool
+from utils.memory_schema import DEFAULT_QUOTAS, create_tables, apply_migrations, version_scope
+from utils.context_builder import ContextBlock, ContextBuilder
+from utils.context_codec import ContextCodec, search_text
+from utils.context_index import ContextIndex
+from utils.context_search import ContextSearch
+from utils.lru_cache import LRUTTLCache
+from utils.memory_compaction import SQL_INSERT_COMPACTION, MemoryCompactor, message_window
+from utils.metrics_rollup import MetricsRollup
+from utils.retention import DEFAULT_RETENTION_POLICIES, RetentionService
+from utils.write_behind import WriteBehindQueue
+
+# Statements fixos: reutilizados pelo cache de statements de cada conexão do pool
+SQL_INSERT_CONTEXT = '''
+    INSERT INTO long_term_context 
+    (thread_id, agent_type, context_type, content, importance_score, user_id)
+    VALUES (?, ?, ?, ?, ?, ?)
+'''
+# Conteúdo comprimido: a view grava a linha e o texto pesquisável (migração v8)
+SQL_INSERT_PACKED_CONTEXT = '''
+    INSERT INTO long_term_context_packed
+    (thread_id, agent_type, context_type, content, importance_score, user_id, search_text)
+    VALUES (?, ?, ?, ?, ?, ?, ?)
+'''
+SQL_SELECT_CONTEXT = '''
+    SELECT context_type, content, importance_score, created_at
+    FROM long_term_context
+    WHERE thread_id = ? AND agent_type = ?
+    ORDER BY importance_score DESC, created_at DESC
+    LIMIT ?
+'''
+SQL_SELECT_CONTEXT_BY_IDS = '''
+    SELECT id, context_type, content, importance_score, created_at
+    FROM long_term_context
+    WHERE id IN ({placeholders})
+'''
+SQL_UPSERT_PREFERENCE = '''
+    INSERT INTO user_preferences 
+    (user_id, agent_type, preference_key, preference_value, updated_at)
+    VALUES (?, ?, ?, ?, ?)
+    ON CONFLICT (user_id, agent_type, preference_key)
+    DO UPDATE SET preference_value = excluded.preference_value, updated_at = excluded.updated_at
+'''
+SQL_SELECT_PREFERENCES = '''
+    SELECT preference_key, preference_value
+    FROM user_preferences
+    WHERE user_id = ? AND agent_type = ?
+'''
+SQL_INSERT_SESSION = '''
+    INSERT INTO agent_sessions 
+    (session_id, agent_type, user_id, thread_id)
+    VALUES (?, ?, ?, ?)
+'''
+SQL_TOUCH_SESSION = '''
+    UPDATE agent_sessions 
+    SET last_activity = ?
+    WHERE thread_id = ?
+'''
+SQL_INSERT_METRIC = '''
+    INSERT INTO performance_metrics 
+    (agent_type, user_id, metric_type, metric_value)
+    VALUES (?, ?, ?, ?)
+'''
+SQL_SELECT_VERSION = '''
+    SELECT version FROM memory_versions WHERE scope = ?
+'''
+SQL_UPSERT_QUOTA = '''
+    INSERT INTO memory_quotas (name, max_rows) VALUES (?, ?)
+    ON CONFLICT (name) DO UPDATE SET max_rows = excluded.max_rows
+'''
+SQL_SELECT_USAGE = '''
+    SELECT rows FROM memory_usage WHERE scope = ?
+'''
+SQL_SELECT_METRICS = '''
+    SELECT metric_type, metric_value, timestamp
+    FROM performance_metrics
+    WHERE agent_type = ? AND user_id = ? AND timestamp >= ?
+    ORDER BY timestamp DESC
+    LIMIT ?
+'''
+
+
+def new_session_ids(user_id: str, agent_type: str):
+    """(session_id, thread_id) de uma nova sessão"""
+    session_id = hashlib.md5(f"{user_id}_{agent_type}_{datetime.now()}".encode()).hexdigest()
+    return session_id, f"{agent_type}_{session_id[:8]}"
+
+
 class MemoryManager:
-    def __init__(self, db_path="agent_memory.db"):
+    def __init__(self, db_path="agent_memory.db", pool_size: int = 4,
+                 checkpointer: Optional[str] = None, checkpoint_keep_last: int = 5,
+                 write_behind: bool = False, flush_interval: float = 0.5, max_batch: int = 200,
+                 cache_size: int = 1024, cache_ttl: Optional[float] = 300.0,
+                 context_budget_tokens: int = 600, quotas: Optional[Dict[str, int]] = None,
+                 context_compression: Optional[str] = None):
         self.db_path = db_path
+        self.pool = SQLitePool(db_path, size=pool_size)
+        # "sqlite" (padrão): checkpoints em disco, compactados; "memory": MemorySaver
+        self.checkpointer_mode = checkpointer or os.getenv("AGENT_CHECKPOINTER", "sqlite")
+        self.checkpoint_keep_last = checkpoint_keep_last
+        self._savers = {}
         self.init_database()  # Corrigido de init_db() para init_database()
+        if quotas:
+            self.set_quotas(quotas)
+        # "zstd": contexto novo gravado como BLOB comprimido; "off" (padrão): JSON
+        compression = context_compression or os.getenv("AGENT_MEMORY_COMPRESSION", "off")
+        self.codec = ContextCodec(self.pool, enabled=compression == "zstd")
+        # Contexto, métricas e atividade de sessão podem ser gravados em lote,
+        # fora do caminho da resposta
+        self.writer = WriteBehindQueue(self.pool, max_batch, flush_interval,
+                                       on_flush=self._after_flush) if write_behind else None
+        # Preferências e contexto recente, validados pelo carimbo em memory_versions
+        self.cache = LRUTTLCache(cache_size, cache_ttl) if cache_size else None
+        # Métricas brutas ficam poucos dias; consultas de painel usam os agregados
+        self.metrics = MetricsRollup(self.pool)
+        # Busca por similaridade no histórico; carregado em segundo plano na primeira consulta
+        self.context_index = ContextIndex(self.pool, decode=self.codec.decode)
+        self.context_builder = ContextBuilder(context_budget_tokens)
+        # Busca textual (FTS5) exposta em /search_context
+        self.context_search = ContextSearch(self.pool, decode=self.codec.decode)
+        # Turnos antigos viram um resumo contínuo (rodado pelo RetentionService)
+        self.compactor = MemoryCompactor(self)
+    
+    def close(self):
+        """Grava o que estiver pendente e fecha as conexões mantidas pelo pool"""
+        if self.writer:
+            self.writer.close()
+        self.pool.close()
+    
+    def flush(self):
+        """Força a gravação das escritas pendentes na fila write-behind"""
+        if self.writer:
+            self.writer.flush()
+    
+    def shards(self) -> List["MemoryManager"]:
+        """Bancos físicos por trás desta memória (um só; ver ShardedMemoryManager)"""
+        return [self]
+    
+    @property
+    def concurrency(self) -> int:
+        """Operações SQLite que podem rodar em paralelo sem esperar conexão"""
+        return self.pool.size
+    
+    @property
+    def queues_writes(self) -> bool:
+        """Contexto, métricas e atividade de sessão só entram na fila write-behind (sem I/O)"""
+        return self.writer is not None
+    
+    def _write(self, table: str, sql: str, params: tuple, scope: Optional[str] = None):
+        if self.writer:
+            self.writer.submit(table, sql, params, scope)
+            return
+        with self.pool.transaction() as conn:
+            conn.execute(sql, params)
+    
+    def _after_flush(self, tables):
+        # Contexto novo entra no índice logo após o commit, não na próxima busca
+        if 'long_term_context' in tables and self.context_index.ready:
+            self.context_index.refresh()
+    
+    def _before_read(self, table: str, scope: Optional[str] = None):
+        # Read-your-writes: grava o lote pendente antes de ler a mesma tabela; com
+        # escopo (thread_id), só se houver gravação pendente daquela thread
+        if self.writer:
+            self.writer.flush_if_pending(table, scope)
+    
+    def _read_through(self, scope: str, key: tuple, load, accept=None):
+        """Lê do cache se o carimbo de versão do escopo não mudou; senão carrega.
+        
+        Versão e dados são lidos no mesmo snapshot (uma transação de leitura),
+        então uma escrita concorrente nunca fica associada a dados antigos.
+        """
+        with self.pool.connection() as conn:
+            conn.execute("BEGIN")
+            row = conn.execute(SQL_SELECT_VERSION, (scope,)).fetchone()
+            version = row[0] if row else 0
+            if self.cache is not None:
+                cached = self.cache.get(key, version, accept=accept)
+                if cached is not None:
+                    return cached
+            value = load(conn)
+        if self.cache is not None:
+            self.cache.put(key, value, version)
+        return value
+    
+    def cache_stats(self) -> Dict[str, Any]:
+        """Contadores de hit/miss do cache de preferências e contexto"""
+        return self.cache.stats() if self.cache is not None else {"enabled": False}
+    
+    async def aclose_checkpointers(self):
+        """Fecha as conexões dos checkpointers em disco"""
+        for saver in self._savers.values():
+            await saver.conn.close()
+        self._savers.clear()
     
     def init_database(self):
         """Inicializa o banco de dados para memória persistente"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        # Tabela para conversas
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS conversations (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                thread_id TEXT UNIQUE,
-                user_id TEXT,
-                agent_type TEXT,
-                title TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                metadata TEXT
-            )
-        ''')
-        
-        # Tabela para contexto de longo prazo
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS long_term_context (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                thread_id TEXT,
-                agent_type TEXT,
-                context_type TEXT,
-                content TEXT,
-                importance_score INTEGER DEFAULT 1,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (thread_id) REFERENCES conversations (thread_id)
-            )
-        ''')
-        
-        # Tabela para preferências do usuário
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS user_preferences (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id TEXT,
-                agent_type TEXT,
-                preference_key TEXT,
-                preference_value TEXT,
-                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-        
-        # Tabela para sessões de agentes
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS agent_sessions (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                session_id TEXT UNIQUE,
-                agent_type TEXT,
-                user_id TEXT,
-                thread_id TEXT,
-                status TEXT DEFAULT 'active',
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                last_activity TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-        
-        # Tabela para performance tracking
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS performance_metrics (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                agent_type TEXT,
-                user_id TEXT,
-                metric_type TEXT,
-                metric_value REAL,
-                timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-        
-        conn.commit()
-        conn.close()
+        with self.pool.transaction() as conn:
+            create_tables(conn)
+            apply_migrations(conn)
+    
+    def checkpoint_path(self, agent_type: str = "default") -> str:
+        """Arquivo de checkpoints LangGraph do tipo de agente"""
+        base, _ = os.path.splitext(self.db_path)
+        return f"{base}_checkpoints_{agent_type}.db"
     
     def get_sqlite_saver(self, agent_type="default"):
         """Retorna uma instância de checkpointer para o tipo de agente especificado"""
         try:
-            # Usar MemorySaver como solução temporária mais estável
-            from langgraph.checkpoint.memory import MemorySaver
-            return MemorySaver()
+            if self.checkpointer_mode == "memory":
+                from langgraph.checkpoint.memory import MemorySaver
+                return MemorySaver()
+            
+            # Um saver por tipo de agente e event loop: as threads retomam o
+            # estado salvo em disco mesmo após reiniciar o processo
+            loop = asyncio.get_running_loop()
+            saver = self._savers.get(agent_type)
+            if saver is None or saver.loop is not loop:
+                from utils.checkpointer import CompactingSqliteSaver
+                saver = CompactingSqliteSaver.from_path(
+                    self.checkpoint_path(agent_type), keep_last=self.checkpoint_keep_last
+                )
+                self._savers[agent_type] = saver
+            return saver
             
         except Exception as e:
             print(f"⚠️ Erro ao criar checkpointer: {e}")
@@ -98,169 +235,319 @@ class MemoryManager:
             from langgraph.checkpoint.memory import MemorySaver
             return MemorySaver()
     
-    def save_conversation_context(self, thread_id: str, context: Dict[str, Any], agent_type: str = "default"):
-        """Salva contexto importante da conversa"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            INSERT OR REPLACE INTO long_term_context 
-            (thread_id, agent_type, context_type, content, importance_score)
-            VALUES (?, ?, ?, ?, ?)
-        ''', (
+    def save_conversation_context(self, thread_id: str, context: Dict[str, Any], agent_type: str = "default",
+                                  user_id: Optional[str] = None):
+        """Salva contexto importante da conversa (user_id conta na cota do usuário)"""
+        self._write('long_term_context', *self.context_insert(
             thread_id,
             agent_type,
             context.get('type', 'general'),
-            json.dumps(context.get('content', {})),
-            context.get('importance', 1)
-        ))
-        
-        conn.commit()
-        conn.close()
+            context.get('content', {}),
+            context.get('importance', 1),
+            user_id
+        ), scope=thread_id)
+        if self.cache is not None:
+            self.cache.invalidate(('ctx', thread_id, agent_type))
+        if not self.writer and self.context_index.ready:
+            # Gravação síncrona: já vetoriza a linha nova fora do caminho de leitura
+            self.context_index.sync()
+    
+    def context_insert(self, thread_id: str, agent_type: str, context_type: str, content: Any,
+                       importance: int, user_id: Optional[str]) -> tuple:
+        """(sql, params) do INSERT em long_term_context no formato configurado"""
+        value = self.codec.encode(content)
+        if isinstance(value, str):
+            return SQL_INSERT_CONTEXT, (thread_id, agent_type, context_type, value, importance, user_id)
+        return SQL_INSERT_PACKED_CONTEXT, (thread_id, agent_type, context_type, value, importance, user_id,
+                                           search_text(content))
+    
+    def train_context_dictionary(self, samples: int = 5000, dict_size: int = 32 * 1024,
+                                 recompress: bool = False) -> Dict[str, Any]:
+        """Treina o dicionário zstd com o histórico e, opcionalmente, comprime as linhas em JSON"""
+        dict_id = self.codec.train(samples, dict_size)
+        converted = self.codec.recompress() if recompress and dict_id is not None else 0
+        return {"dict_id": dict_id, "recompressed": converted}
     
     def get_conversation_context(self, thread_id: str, agent_type: str = "default", limit: int = 10) -> List[Dict]:
         """Recupera contexto relevante da conversa"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+        self._before_read('long_term_context', thread_id)
+        
+        def load(conn):
+            rows = conn.execute(SQL_SELECT_CONTEXT, (thread_id, agent_type, limit)).fetchall()
+            results = []
+            for row in rows:
+                results.append({
+                    'type': row[0],
+                    'content': self.codec.decode(row[1], conn),
+                    'importance': row[2],
+                    'created_at': row[3]
+                })
+            return (limit, results)
         
-        cursor.execute('''
-            SELECT context_type, content, importance_score, created_at
-            FROM long_term_context
-            WHERE thread_id = ? AND agent_type = ?
-            ORDER BY importance_score DESC, created_at DESC
-            LIMIT ?
-        ''', (thread_id, agent_type, limit))
+        # Uma entrada com limite maior (ou com menos linhas que o limite) já
+        # contém a resposta: a ordenação é a mesma, basta fatiar
+        cached_limit, results = self._read_through(
+            version_scope('ctx', thread_id, agent_type),
+            ('ctx', thread_id, agent_type),
+            load,
+            accept=lambda entry: entry[0] >= limit or len(entry[1]) < entry[0],
+        )
+        return results[:limit]
+    
+    def search_conversation_context(self, thread_id: str, query: str, agent_type: str = "default",
+                                    limit: int = 5) -> List[Dict]:
+        """Recupera as entradas de contexto mais parecidas com a pergunta atual"""
+        self._before_read('long_term_context', thread_id)
+        # A primeira busca dispara a carga do índice numa thread; até ela terminar
+        # não há resultados por similaridade e o bloco de contexto usa só a recência
+        if not self.context_index.start_build():
+            return []
+        # Linhas novas entram no índice em segundo plano; a busca usa o que já está indexado
+        self.context_index.refresh()
+        hits = self.context_index.search(query, thread_id, agent_type, limit)
+        if not hits:
+            return []
+        
+        ids = [row_id for row_id, _ in hits]
+        sql = SQL_SELECT_CONTEXT_BY_IDS.format(placeholders=",".join("?" * len(ids)))
+        with self.pool.connection() as conn:
+            rows = {row[0]: row for row in conn.execute(sql, ids).fetchall()}
+        # Ids que sumiram da tabela (retenção) saem do índice
+        missing = [row_id for row_id in ids if row_id not in rows]
+        if missing:
+            self.context_index.discard(missing)
         
         results = []
-        for row in cursor.fetchall():
+        for row_id, score in hits:
+            row = rows.get(row_id)
+            if row is None:
+                continue
             results.append({
-                'type': row[0],
-                'content': json.loads(row[1]),
-                'importance': row[2],
-                'created_at': row[3]
+                'type': row[1],
+                'content': self.codec.decode(row[2]),
+                'importance': row[3],
+                'created_at': row[4],
+                'score': round(score, 4)
             })
-        
-        conn.close()
         return results
     
-    def save_user_preference(self, user_id: str, key: str, value: str, agent_type: str = "default"):
-        """Salva preferência do usuário"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+    def search_context(self, thread_id: str, query: str, agent_type: str = "default",
+                       page: int = 1, page_size: int = 10) -> Dict[str, Any]:
+        """Busca textual no histórico da thread: resultados ranqueados, paginados e com trechos"""
+        self._before_read('long_term_context', thread_id)
+        return self.context_search.search(query, thread_id, agent_type, page, page_size)
+    
+    def build_context(self, thread_id: str, user_id: str, agent_type: str = "default",
+                      query: Optional[str] = None, budget_tokens: Optional[int] = None) -> ContextBlock:
+        """Bloco de histórico + preferências para o prompt, dentro do orçamento de tokens
         
-        cursor.execute('''
-            INSERT OR REPLACE INTO user_preferences 
-            (user_id, agent_type, preference_key, preference_value, updated_at)
-            VALUES (?, ?, ?, ?, ?)
-        ''', (user_id, agent_type, key, value, datetime.now()))
+        O cache guarda só a parte que não depende da pergunta (entradas
+        recentes e preferências) até mudar o carimbo de versão do contexto
+        da thread ou das preferências do usuário; as entradas parecidas com
+        ``query`` são buscadas a cada chamada e reordenam o bloco depois.
+        """
+        builder = self.context_builder
+        budget = builder.budget_tokens if budget_tokens is None else budget_tokens
+        self._before_read('long_term_context', thread_id)
         
-        conn.commit()
-        conn.close()
+        # Carimbos lidos antes dos dados: no pior caso o bloco é remontado à toa
+        with self.pool.connection() as conn:
+            version = tuple(
+                row[0] if row else 0
+                for row in (conn.execute(SQL_SELECT_VERSION, (scope,)).fetchone() for scope in (
+                    version_scope('ctx', thread_id, agent_type),
+                    version_scope('prefs', user_id, agent_type),
+                ))
+            )
+        key = ('block', thread_id, user_id, agent_type)
+        cached = self.cache.get(key, version) if self.cache is not None else None
+        if cached is None:
+            entries = self.get_conversation_context(thread_id, agent_type, builder.candidates)
+            preferences = self.get_user_preferences(user_id, agent_type)
+            # Blocos sem entradas relevantes, por orçamento: iguais para qualquer pergunta
+            cached = (entries, preferences, {})
+            if self.cache is not None:
+                self.cache.put(key, cached, version)
+        entries, preferences, plain = cached
+        
+        relevant = self.search_conversation_context(thread_id, query, agent_type, builder.relevant) if query else []
+        if relevant:
+            return builder.build(entries, preferences, agent_type, relevant, budget)
+        block = plain.get(budget)
+        if block is None:
+            block = plain[budget] = builder.build(entries, preferences, agent_type, None, budget)
+        return block
+    
+    def save_user_preference(self, user_id: str, key: str, value: str, agent_type: str = "default"):
+        """Salva preferência do usuário"""
+        with self.pool.transaction() as conn:
+            conn.execute(SQL_UPSERT_PREFERENCE, (user_id, agent_type, key, value, datetime.now()))
+        if self.cache is not None:
+            self.cache.invalidate(('prefs', user_id, agent_type))
     
     def get_user_preferences(self, user_id: str, agent_type: str = "default") -> Dict[str, str]:
         """Recupera preferências do usuário"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+        def load(conn):
+            rows = conn.execute(SQL_SELECT_PREFERENCES, (user_id, agent_type)).fetchall()
+            return {row[0]: row[1] for row in rows}
         
-        cursor.execute('''
-            SELECT preference_key, preference_value
-            FROM user_preferences
-            WHERE user_id = ? AND agent_type = ?
-        ''', (user_id, agent_type))
-        
-        preferences = {row[0]: row[1] for row in cursor.fetchall()}
-        conn.close()
-        return preferences
+        preferences = self._read_through(
+            version_scope('prefs', user_id, agent_type), ('prefs', user_id, agent_type), load
+        )
+        return dict(preferences)
     
     def create_session(self, user_id: str, agent_type: str) -> str:
         """Cria uma nova sessão de agente"""
-        session_id = hashlib.md5(f"{user_id}_{agent_type}_{datetime.now()}".encode()).hexdigest()
-        thread_id = f"{agent_type}_{session_id[:8]}"
-        
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+        session_id, thread_id = new_session_ids(user_id, agent_type)
         
-        cursor.execute('''
-            INSERT INTO agent_sessions 
-            (session_id, agent_type, user_id, thread_id)
-            VALUES (?, ?, ?, ?)
-        ''', (session_id, agent_type, user_id, thread_id))
-        
-        conn.commit()
-        conn.close()
+        with self.pool.transaction() as conn:
+            conn.execute(SQL_INSERT_SESSION, (session_id, agent_type, user_id, thread_id))
         return thread_id
     
-    def update_session_activity(self, thread_id: str):
-        """Atualiza a última atividade da sessão"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            UPDATE agent_sessions 
-            SET last_activity = ?
-            WHERE thread_id = ?
-        ''', (datetime.now(), thread_id))
-        
-        conn.commit()
-        conn.close()
+    def update_session_activity(self, thread_id: str, agent_type: Optional[str] = None):
+        """Atualiza a última atividade da sessão (agent_type só roteia entre shards)"""
+        # UTC no formato de CURRENT_TIMESTAMP: o mesmo relógio do default da coluna e do corte da retenção
+        now = datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S")
+        self._write('agent_sessions', SQL_TOUCH_SESSION, (now, thread_id), scope=thread_id)
     
     def save_performance_metric(self, agent_type: str, user_id: str, metric_type: str, value: float):
         """Salva métricas de performance"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            INSERT INTO performance_metrics 
-            (agent_type, user_id, metric_type, metric_value)
-            VALUES (?, ?, ?, ?)
-        ''', (agent_type, user_id, metric_type, value))
-        
-        conn.commit()
-        conn.close()
+        self._write('performance_metrics', SQL_INSERT_METRIC, (agent_type, user_id, metric_type, value))
     
-    def get_performance_metrics(self, agent_type: str, user_id: str, days: int = 30) -> List[Dict]:
-        """Recupera métricas de performance"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+    def get_performance_metrics(self, agent_type: str, user_id: str, days: Optional[float] = None,
+                                limit: Optional[int] = None) -> List[Dict]:
+        """Recupera métricas de performance brutas (mais recentes primeiro).
         
-        since_date = datetime.now() - timedelta(days=days)
+        As linhas brutas só ficam ``metrics.raw_retention`` (2 dias): ``days``
+        é limitado a isso e, sem ``days``, vale a janela inteira. Para janelas
+        longas use get_metrics_summary/get_metrics_series, que leem os agregados.
+        """
+        window = self.metrics.raw_retention
+        if days is not None:
+            window = min(window, timedelta(days=days))
+        since_date = datetime.now() - window
         
-        cursor.execute('''
-            SELECT metric_type, metric_value, timestamp
-            FROM performance_metrics
-            WHERE agent_type = ? AND user_id = ? AND timestamp >= ?
-            ORDER BY timestamp DESC
-        ''', (agent_type, user_id, since_date))
+        self._before_read('performance_metrics')
+        with self.pool.connection() as conn:
+            rows = conn.execute(SQL_SELECT_METRICS, (agent_type, user_id, since_date, -1 if limit is None else limit)).fetchall()
         
         metrics = []
-        for row in cursor.fetchall():
+        for row in rows:
             metrics.append({
                 'type': row[0],
                 'value': row[1],
                 'timestamp': row[2]
             })
         
-        conn.close()
         return metrics
     
-    def cleanup_old_data(self, days: int = 90):
-        """Remove dados antigos para manter o banco otimizado"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        cutoff_date = datetime.now() - timedelta(days=days)
-        
-        # Remove contexto antigo de baixa importância
-        cursor.execute('''
-            DELETE FROM long_term_context 
-            WHERE created_at < ? AND importance_score < 3
-        ''', (cutoff_date,))
+    def set_quotas(self, quotas: Dict[str, int]):
+        """Altera as cotas (thread_context, user_context, user_sessions; 0 = sem limite)
         
-        # Remove métricas antigas
-        cursor.execute('''
-            DELETE FROM performance_metrics 
-            WHERE timestamp < ?
-        ''', (cutoff_date,))
+        Os limites ficam no banco e valem para todos os processos; o despejo
+        acontece no próximo INSERT do escopo que estiver acima da cota.
+        """
+        unknown = set(quotas) - set(DEFAULT_QUOTAS)
+        if unknown:
+            raise ValueError(f"Cotas desconhecidas: {sorted(unknown)} (use {sorted(DEFAULT_QUOTAS)})")
+        with self.pool.transaction() as conn:
+            conn.executemany(SQL_UPSERT_QUOTA, quotas.items())
+    
+    def get_quota_usage(self, user_id: Optional[str] = None, thread_id: Optional[str] = None,
+                        agent_type: str = "default") -> Dict[str, Any]:
+        """Uso x limite das cotas do usuário/thread e total de linhas despejadas
         
-        conn.commit()
-        conn.close()
\ No newline at end of file
+        Lê só os contadores mantidos pelos triggers (sem COUNT(*)).
+        """
+        self._before_read('long_term_context')
+        self._before_read('agent_sessions')
+        scopes = {
+            "thread_context": version_scope('thread', thread_id, agent_type) if thread_id else None,
+            "user_context": version_scope('user', user_id, agent_type) if user_id else None,
+            "user_sessions": version_scope('sessions', user_id, agent_type) if user_id else None,
+        }
+        with self.pool.connection() as conn:
+            conn.execute("BEGIN")
+            limits = dict(conn.execute("SELECT name, max_rows FROM memory_quotas").fetchall())
+            usage = {}
+            for name, scope in scopes.items():
+                item = {"limit": limits.get(name, 0) or None}
+                if scope is not None:
+                    row = conn.execute(SQL_SELECT_USAGE, (scope,)).fetchone()
+                    item["used"] = row[0] if row else 0
+                usage[name] = item
+            usage["evicted"] = {
+                name: (conn.execute(SQL_SELECT_USAGE, (f"evicted:{name}",)).fetchone() or (0,))[0]
+                for name in scopes
+            }
+        return usage
+    
+    def compact_memory(self) -> Dict[str, int]:
+        """Resume os turnos antigos das threads longas; retorna turnos dobrados por thread"""
+        self.flush()
+        return self.compactor.compact_all()
+    
+    def record_compaction(self, thread_id: str, agent_type: str, kind: str,
+                          tokens_before: int, tokens_after: int, items_folded: int):
+        """Registra os tokens antes/depois de uma compactação da thread"""
+        self._write('context_compactions', SQL_INSERT_COMPACTION,
+                    (thread_id, agent_type, kind, tokens_before, tokens_after, items_folded), scope=thread_id)
+    
+    def get_compaction_history(self, thread_id: str, agent_type: str = "default", limit: int = 10) -> List[Dict]:
+        """Últimas compactações da thread (resumo do contexto e corte de mensagens)"""
+        self._before_read('context_compactions', thread_id)
+        with self.pool.connection() as conn:
+            rows = conn.execute('''
+                SELECT kind, tokens_before, tokens_after, items_folded, created_at
+                FROM context_compactions
+                WHERE thread_id = ? AND agent_type = ?
+                ORDER BY created_at DESC
+                LIMIT ?
+            ''', (thread_id, agent_type, limit)).fetchall()
+        return [{
+            'kind': row[0],
+            'tokens_before': row[1],
+            'tokens_after': row[2],
+            'items_folded': row[3],
+            'created_at': row[4]
+        } for row in rows]
+    
+    def history_window(self, agent_type: str = "default", max_messages: int = 30):
+        """pre_model_hook que limita o histórico de mensagens do agente LangGraph"""
+        def on_trim(thread_id, tokens_before, tokens_after, removed):
+            self.record_compaction(thread_id, agent_type, "messages", tokens_before, tokens_after, removed)
+        return message_window(max_messages, on_trim)
+    
+    def rollup_metrics(self) -> int:
+        """Consolida as métricas novas nos agregados por minuto/hora"""
+        self.flush()
+        return self.metrics.roll_up()
+    
+    def get_metrics_summary(self, agent_type: str, days: float = 30, metric_type: Optional[str] = None) -> Dict[str, Dict]:
+        """count/sum/avg/min/max/p50/p95/p99 por tipo de métrica na janela (só leitura)"""
+        self._before_read('performance_metrics')
+        return self.metrics.summary(agent_type, timedelta(days=days), metric_type)
+    
+    def get_metrics_series(self, agent_type: str, metric_type: str, hours: float = 24,
+                           granularity: Optional[str] = None) -> List[Dict]:
+        """Série por minuto ou por hora de um tipo de métrica (só leitura)"""
+        self._before_read('performance_metrics')
+        return self.metrics.series(agent_type, metric_type, timedelta(hours=hours), granularity)
+    
+    def cleanup_old_data(self, days: int = 90) -> Dict[str, Any]:
+        """Remove dados antigos para manter o banco otimizado.
+
+        Apaga em lotes pequenos (ver RetentionService) em vez de um único
+        DELETE que seguraria o lock de escrita durante toda a limpeza.
+        """
+        self.flush()
+        policies = {
+            table: {**policy, "days": days}
+            for table, policy in DEFAULT_RETENTION_POLICIES.items()
+            if table in ("long_term_context", "performance_metrics")
+        }
+        return RetentionService(self, policies, max_pass_seconds=0).run_once()
+
+
+# Nome usado pelos servidores e agentes de terminal
+PersistentMemoryManager = MemoryManager
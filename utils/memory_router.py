@@ -0,0 +1,373 @@
+"""Memória particionada: um banco SQLite por agent_type (e, opcionalmente, por hash do usuário)"""
+
+import glob
+import os
+import re
+import sqlite3
+import threading
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from typing import Any, Dict, List, Optional
+
+from utils.context_builder import ContextBlock
+from utils.context_codec import ContextCodec
+from utils.memory_compaction import message_window
+from utils.memory_manager import SQL_INSERT_SESSION, MemoryManager, new_session_ids
+from utils.metrics_rollup import MetricAggregate, series_points
+
+_SAFE_NAME_RE = re.compile(r"[^\w-]")
+
+# Linhas do banco sem shards e a chave que escolhe o shard de cada uma
+# (None: o shard do agent_type sem chave). performance_metrics e
+# metric_rollups entram juntas pelo MetricsRollup.absorb.
+LEGACY_TABLES = [
+    ("conversations", "thread_id"),
+    ("long_term_context", "thread_id"),
+    ("agent_sessions", "thread_id"),
+    ("context_compactions", "thread_id"),
+    ("user_preferences", "user_id"),
+]
+SQL_SELECT_LEGACY_MARKER = '''
+    SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = '_memory_shard_migration'
+'''
+SQL_CREATE_LEGACY_MARKER = '''
+    CREATE TABLE _memory_shard_migration (
+        target TEXT PRIMARY KEY,
+        rows INTEGER,
+        migrated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+'''
+SQL_SELECT_LEGACY_RAW_METRICS = '''
+    SELECT agent_type, user_id, metric_type, metric_value, timestamp
+    FROM performance_metrics WHERE shard_route(agent_type, user_id) = ? ORDER BY id
+'''
+SQL_SELECT_LEGACY_ROLLUPS = '''
+    SELECT granularity, agent_type, bucket_start, metric_type, count, sum, min, max, sketch
+    FROM metric_rollups WHERE shard_route(agent_type, NULL) = ?
+'''
+
+
+class ShardedMemoryManager:
+    """Mesma superfície do MemoryManager, roteando cada chamada para um shard.
+
+    Cada agent_type tem o próprio arquivo (``<base>_<agent_type>.db``), então
+    Binance, Bet365 e os demais agentes não disputam o mesmo lock de escrita.
+    Com ``user_shards > 1`` cada agent_type é dividido em N arquivos
+    (``<base>_<agent_type>_<i>.db``) pelo crc32 da chave: ``thread_id`` para
+    contexto e sessões, ``user_id`` para preferências e métricas. Leituras que
+    cobrem vários shards (resumo de métricas, séries) rodam em paralelo e os
+    agregados são mesclados, inclusive os percentis.
+    """
+
+    def __init__(self, db_path: str = "agent_memory.db", user_shards: int = 1, **manager_kwargs):
+        self.db_path = db_path
+        self.base, _ = os.path.splitext(db_path)
+        self.user_shards = max(1, user_shards)
+        self.manager_kwargs = manager_kwargs
+        self._shards: Dict[str, MemoryManager] = {}
+        self._lock = threading.Lock()
+        self._fanout = ThreadPoolExecutor(max_workers=8, thread_name_prefix="memory-shard")
+        # Shards criados por execuções anteriores entram na retenção e nas leituras agregadas
+        for path in sorted(glob.glob(f"{glob.escape(self.base)}_*.db")):
+            if "_checkpoints_" not in path:
+                self._open(path)
+        if os.path.exists(db_path) and not _unsharded_migrated(db_path):
+            self.migrate_unsharded(db_path)
+
+    def _open(self, path: str) -> MemoryManager:
+        with self._lock:
+            shard = self._shards.get(path)
+            if shard is None:
+                shard = self._shards[path] = MemoryManager(path, **self.manager_kwargs)
+            return shard
+
+    def migrate_unsharded(self, legacy_path: str) -> int:
+        """Copia uma única vez as linhas do banco sem shards para os shards.
+
+        Cada linha vai para o shard que o roteamento escolheria para ela;
+        conteúdo comprimido é gravado de volta como JSON e as métricas entram
+        já consolidadas. O arquivo antigo fica intacto (serve de backup para
+        voltar a ``AGENT_MEMORY_SHARDING=off``), só ganha a tabela
+        ``_memory_shard_migration``, que marca a cópia como feita. Cada shard
+        registra a origem na mesma transação das suas linhas, então uma
+        migração interrompida recomeça sem duplicar nada. A cópia segura o
+        lock de escrita do arquivo antigo: outro worker iniciando junto
+        espera ou desiste e encontra a migração pronta na próxima vez.
+        """
+        legacy = MemoryManager(legacy_path, pool_size=1)
+        try:
+            # Métricas brutas ainda não consolidadas entram nos agregados antes da cópia
+            legacy.rollup_metrics()
+            with legacy.pool.transaction() as src:
+                if src.execute(SQL_SELECT_LEGACY_MARKER).fetchone():
+                    return 0
+                src.create_function("shard_route", 2, self.shard_path, deterministic=True)
+                targets = set()
+                for table, key in LEGACY_TABLES + [("performance_metrics", "user_id"),
+                                                   ("metric_rollups", None)]:
+                    targets.update(row[0] for row in src.execute(
+                        f"SELECT DISTINCT shard_route(agent_type, {key or 'NULL'}) FROM {table}"))
+                source = os.path.abspath(legacy_path)
+                copied = sum(self._copy_unsharded(src, source, path) for path in sorted(targets))
+                src.execute(SQL_CREATE_LEGACY_MARKER)
+                src.execute("INSERT INTO _memory_shard_migration (target, rows) VALUES (?, ?)",
+                            (self.base, copied))
+        except sqlite3.OperationalError as e:
+            print(f"⚠️ Migração de {legacy_path} para shards adiada: {e}")
+            return 0
+        finally:
+            legacy.close()
+        print(f"🗄️ Memória sem shards migrada: {copied} linhas de {legacy_path} em {len(targets)} shards")
+        return copied
+
+    def _copy_unsharded(self, src: sqlite3.Connection, source: str, path: str) -> int:
+        shard = self._open(path)
+        codec = ContextCodec()
+        copied = 0
+        with shard.pool.transaction() as dst:
+            dst.execute("CREATE TABLE IF NOT EXISTS _memory_legacy_import (source TEXT PRIMARY KEY, rows INTEGER)")
+            if dst.execute("SELECT 1 FROM _memory_legacy_import WHERE source = ?", (source,)).fetchone():
+                return 0
+            for table, key in LEGACY_TABLES:
+                target = {row[1] for row in dst.execute(f"PRAGMA table_info({table})")}
+                columns = [row[1] for row in src.execute(f"PRAGMA table_info({table})")
+                           if row[1] != "id" and row[1] in target]
+                rows = src.execute(f"SELECT {', '.join(columns)} FROM {table} "
+                                   f"WHERE shard_route(agent_type, {key}) = ? ORDER BY id", (path,))
+                if table == "long_term_context":
+                    packed = columns.index("content")
+                    rows = (row[:packed] + (codec.decode_text(row[packed], src),) + row[packed + 1:]
+                            if isinstance(row[packed], bytes) else row for row in rows)
+                # OR IGNORE: sessões, conversas e preferências já gravadas no shard prevalecem
+                copied += dst.executemany(
+                    f"INSERT OR IGNORE INTO {table} ({', '.join(columns)}) "
+                    f"VALUES ({', '.join('?' * len(columns))})", rows).rowcount
+            copied += shard.metrics.absorb(dst, src.execute(SQL_SELECT_LEGACY_RAW_METRICS, (path,)),
+                                           src.execute(SQL_SELECT_LEGACY_ROLLUPS, (path,)))
+            dst.execute("INSERT INTO _memory_legacy_import (source, rows) VALUES (?, ?)", (source, copied))
+        return copied
+
+    def shard_path(self, agent_type: str, key: Optional[str] = None) -> str:
+        name = _SAFE_NAME_RE.sub("_", agent_type or "default")
+        if self.user_shards == 1:
+            return f"{self.base}_{name}.db"
+        index = zlib.crc32((key or "").encode()) % self.user_shards
+        return f"{self.base}_{name}_{index}.db"
+
+    def shard(self, agent_type: str, key: Optional[str] = None) -> MemoryManager:
+        """Shard responsável pela chave (thread_id ou user_id) no agent_type"""
+        path = self.shard_path(agent_type, key)
+        return self._shards.get(path) or self._open(path)
+
+    def shards(self, agent_type: Optional[str] = None) -> List[MemoryManager]:
+        """Shards abertos; com agent_type, todos os N shards desse tipo"""
+        if agent_type is None:
+            return list(self._shards.values())
+        if self.user_shards == 1:
+            return [self.shard(agent_type)]
+        name = _SAFE_NAME_RE.sub("_", agent_type or "default")
+        return [self._open(f"{self.base}_{name}_{i}.db") for i in range(self.user_shards)]
+
+    def _map(self, fn, shards: List[MemoryManager]) -> List[Any]:
+        # SQLite libera o GIL durante as queries: as leituras rodam de fato em paralelo
+        if len(shards) == 1:
+            return [fn(shards[0])]
+        return list(self._fanout.map(fn, shards))
+
+    @property
+    def concurrency(self) -> int:
+        pool_size = self.manager_kwargs.get("pool_size", 4)
+        return pool_size * max(4, len(self._shards))
+
+    @property
+    def queues_writes(self) -> bool:
+        # O primeiro uso de um shard abre o arquivo e roda as migrações: nunca é só enfileirar
+        return False
+
+    def close(self):
+        for shard in self.shards():
+            shard.close()
+        self._fanout.shutdown()
+
+    def flush(self):
+        self._map(lambda shard: shard.flush(), self.shards())
+
+    async def aclose_checkpointers(self):
+        for shard in self.shards():
+            await shard.aclose_checkpointers()
+
+    def cache_stats(self) -> Dict[str, Any]:
+        totals = {"size": 0, "maxsize": 0, "hits": 0, "misses": 0, "evictions": 0}
+        for shard in self.shards():
+            stats = shard.cache_stats()
+            for key in totals:
+                totals[key] += stats.get(key, 0)
+        lookups = totals["hits"] + totals["misses"]
+        totals["hit_rate"] = round(totals["hits"] / lookups, 4) if lookups else 0.0
+        totals["shards"] = len(self._shards)
+        return totals
+
+    def get_sqlite_saver(self, agent_type="default"):
+        return self.shard(agent_type).get_sqlite_saver(agent_type)
+
+    # Contexto: roteado por thread_id
+    def save_conversation_context(self, thread_id: str, context: Dict[str, Any], agent_type: str = "default",
+                                  user_id: Optional[str] = None):
+        self.shard(agent_type, thread_id).save_conversation_context(thread_id, context, agent_type, user_id)
+
+    def get_conversation_context(self, thread_id: str, agent_type: str = "default", limit: int = 10) -> List[Dict]:
+        return self.shard(agent_type, thread_id).get_conversation_context(thread_id, agent_type, limit)
+
+    def search_conversation_context(self, thread_id: str, query: str, agent_type: str = "default",
+                                    limit: int = 5) -> List[Dict]:
+        return self.shard(agent_type, thread_id).search_conversation_context(thread_id, query, agent_type, limit)
+
+    def search_context(self, thread_id: str, query: str, agent_type: str = "default",
+                       page: int = 1, page_size: int = 10) -> Dict[str, Any]:
+        return self.shard(agent_type, thread_id).search_context(thread_id, query, agent_type, page, page_size)
+
+    def build_context(self, thread_id: str, user_id: str, agent_type: str = "default",
+                      query: Optional[str] = None, budget_tokens: Optional[int] = None) -> ContextBlock:
+        thread_shard = self.shard(agent_type, thread_id)
+        user_shard = self.shard(agent_type, user_id)
+        if thread_shard is user_shard:
+            return thread_shard.build_context(thread_id, user_id, agent_type, query, budget_tokens)
+        # Contexto e preferências em shards diferentes: monta sem o cache de bloco
+        builder = thread_shard.context_builder
+        entries = thread_shard.get_conversation_context(thread_id, agent_type, builder.candidates)
+        relevant = (thread_shard.search_conversation_context(thread_id, query, agent_type, builder.relevant)
+                    if query else [])
+        preferences = user_shard.get_user_preferences(user_id, agent_type)
+        return builder.build(entries, preferences, agent_type, relevant, budget_tokens)
+
+    def get_compaction_history(self, thread_id: str, agent_type: str = "default", limit: int = 10) -> List[Dict]:
+        return self.shard(agent_type, thread_id).get_compaction_history(thread_id, agent_type, limit)
+
+    def history_window(self, agent_type: str = "default", max_messages: int = 30):
+        def on_trim(thread_id, tokens_before, tokens_after, removed):
+            self.shard(agent_type, thread_id).record_compaction(
+                thread_id, agent_type, "messages", tokens_before, tokens_after, removed)
+        return message_window(max_messages, on_trim)
+
+    # Preferências e métricas: roteadas por user_id
+    def save_user_preference(self, user_id: str, key: str, value: str, agent_type: str = "default"):
+        self.shard(agent_type, user_id).save_user_preference(user_id, key, value, agent_type)
+
+    def get_user_preferences(self, user_id: str, agent_type: str = "default") -> Dict[str, str]:
+        return self.shard(agent_type, user_id).get_user_preferences(user_id, agent_type)
+
+    def save_performance_metric(self, agent_type: str, user_id: str, metric_type: str, value: float):
+        self.shard(agent_type, user_id).save_performance_metric(agent_type, user_id, metric_type, value)
+
+    def get_performance_metrics(self, agent_type: str, user_id: str, days: Optional[float] = None,
+                                limit: Optional[int] = None) -> List[Dict]:
+        return self.shard(agent_type, user_id).get_performance_metrics(agent_type, user_id, days, limit)
+
+    def get_metrics_summary(self, agent_type: str, days: float = 30, metric_type: Optional[str] = None) -> Dict[str, Dict]:
+        """Resumo do agent_type inteiro: consulta os N shards em paralelo e mescla"""
+        def load(shard):
+            shard.flush()
+            return shard.metrics.aggregates(agent_type, timedelta(days=days), metric_type)
+
+        totals: Dict[str, MetricAggregate] = {}
+        for aggregates in self._map(load, self.shards(agent_type)):
+            for m_type, aggregate in aggregates.items():
+                totals.setdefault(m_type, MetricAggregate()).merge(aggregate)
+        return {m_type: aggregate.as_dict() for m_type, aggregate in totals.items()}
+
+    def get_metrics_series(self, agent_type: str, metric_type: str, hours: float = 24,
+                           granularity: Optional[str] = None) -> List[Dict]:
+        def load(shard):
+            shard.flush()
+            return shard.metrics.bucket_aggregates(agent_type, metric_type, timedelta(hours=hours), granularity)
+
+        buckets: Dict[str, MetricAggregate] = {}
+        for partial in self._map(load, self.shards(agent_type)):
+            for bucket, aggregate in partial.items():
+                buckets.setdefault(bucket, MetricAggregate()).merge(aggregate)
+        return series_points(buckets)
+
+    # Sessões: roteadas por thread_id
+    def create_session(self, user_id: str, agent_type: str) -> str:
+        session_id, thread_id = new_session_ids(user_id, agent_type)
+        with self.shard(agent_type, thread_id).pool.transaction() as conn:
+            conn.execute(SQL_INSERT_SESSION, (session_id, agent_type, user_id, thread_id))
+        return thread_id
+
+    def update_session_activity(self, thread_id: str, agent_type: Optional[str] = None):
+        if agent_type is not None:
+            self.shard(agent_type, thread_id).update_session_activity(thread_id)
+            return
+        # Sem agent_type não há como saber o shard: atualiza onde a sessão existir
+        self._map(lambda shard: shard.update_session_activity(thread_id), self.shards())
+
+    # Cotas: contadores e despejo são locais a cada shard
+    def set_quotas(self, quotas: Dict[str, int]):
+        self.manager_kwargs["quotas"] = quotas
+        self._map(lambda shard: shard.set_quotas(quotas), self.shards())
+
+    def get_quota_usage(self, user_id: Optional[str] = None, thread_id: Optional[str] = None,
+                        agent_type: str = "default") -> Dict[str, Any]:
+        """Soma o uso nos N shards do agent_type.
+
+        Com ``user_shards > 1`` as threads de um usuário podem cair em shards
+        diferentes; cada shard aplica a cota do usuário à sua parte.
+        """
+        shards = self.shards(agent_type)
+        partials = self._map(lambda shard: shard.get_quota_usage(user_id, None, agent_type), shards)
+        usage = partials[0]
+        for partial in partials[1:]:
+            for name, item in partial.items():
+                for key, value in item.items():
+                    if key != "limit" and value is not None:
+                        usage[name][key] = usage[name].get(key, 0) + value
+        if thread_id:
+            thread_usage = self.shard(agent_type, thread_id).get_quota_usage(None, thread_id, agent_type)
+            usage["thread_context"] = thread_usage["thread_context"]
+        return usage
+
+    # Manutenção: cada shard cuida de si
+    def rollup_metrics(self) -> int:
+        return sum(self._map(lambda shard: shard.rollup_metrics(), self.shards()))
+
+    def compact_memory(self) -> Dict[str, int]:
+        folded: Dict[str, int] = {}
+        for result in self._map(lambda shard: shard.compact_memory(), self.shards()):
+            folded.update(result)
+        return folded
+
+    def train_context_dictionary(self, samples: int = 5000, dict_size: int = 32 * 1024,
+                                 recompress: bool = False) -> Dict[str, Any]:
+        """Um dicionário por shard, treinado com as linhas do próprio shard"""
+        shards = self.shards()
+        reports = self._map(lambda shard: shard.train_context_dictionary(samples, dict_size, recompress), shards)
+        return {shard.db_path: report for shard, report in zip(shards, reports)}
+
+    def cleanup_old_data(self, days: int = 90) -> Dict[str, Any]:
+        reports = self._map(lambda shard: shard.cleanup_old_data(days), self.shards())
+        return {shard.db_path: report for shard, report in zip(self.shards(), reports)}
+
+
+def _unsharded_migrated(path: str) -> bool:
+    conn = sqlite3.connect(path)
+    try:
+        return conn.execute(SQL_SELECT_LEGACY_MARKER).fetchone() is not None
+    finally:
+        conn.close()
+
+
+def create_memory_manager(db_path: str = "agent_memory.db", sharding: Optional[str] = None, **kwargs):
+    """MemoryManager ou ShardedMemoryManager conforme ``sharding``/AGENT_MEMORY_SHARDING.
+
+    ``""``/``"off"``: um único arquivo; ``"agent"``: um arquivo por agent_type;
+    ``"user:N"``: cada agent_type dividido em N arquivos por hash.
+    """
+    mode = (sharding if sharding is not None else os.getenv("AGENT_MEMORY_SHARDING", "")).strip().lower()
+    if mode in ("", "off", "none"):
+        return MemoryManager(db_path, **kwargs)
+    if mode == "agent":
+        return ShardedMemoryManager(db_path, **kwargs)
+    if mode.startswith("user:"):
+        return ShardedMemoryManager(db_path, user_shards=int(mode.split(":", 1)[1]), **kwargs)
+    raise ValueError(f"AGENT_MEMORY_SHARDING inválido: {mode!r} (use off, agent ou user:N)")
@@ -0,0 +1,488 @@
+"""Schema da memória persistente e migrações versionadas (PRAGMA user_version)"""
+
+import sqlite3
+from typing import Callable, List, Tuple
+
+# Tabelas originais; novas colunas/índices entram sempre como migração
+BASE_TABLES = [
+    # Tabela para conversas
+    '''
+    CREATE TABLE IF NOT EXISTS conversations (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        thread_id TEXT UNIQUE,
+        user_id TEXT,
+        agent_type TEXT,
+        title TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        metadata TEXT
+    )
+    ''',
+    # Tabela para contexto de longo prazo
+    '''
+    CREATE TABLE IF NOT EXISTS long_term_context (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        thread_id TEXT,
+        agent_type TEXT,
+        context_type TEXT,
+        content TEXT,
+        importance_score INTEGER DEFAULT 1,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (thread_id) REFERENCES conversations (thread_id)
+    )
+    ''',
+    # Tabela para preferências do usuário
+    '''
+    CREATE TABLE IF NOT EXISTS user_preferences (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id TEXT,
+        agent_type TEXT,
+        preference_key TEXT,
+        preference_value TEXT,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    ''',
+    # Tabela para sessões de agentes
+    '''
+    CREATE TABLE IF NOT EXISTS agent_sessions (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        session_id TEXT UNIQUE,
+        agent_type TEXT,
+        user_id TEXT,
+        thread_id TEXT,
+        status TEXT DEFAULT 'active',
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        last_activity TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    ''',
+    # Tabela para performance tracking
+    '''
+    CREATE TABLE IF NOT EXISTS performance_metrics (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        agent_type TEXT,
+        user_id TEXT,
+        metric_type TEXT,
+        metric_value REAL,
+        timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    ''',
+]
+
+
+def _migration_indexes_and_unique_keys(conn: sqlite3.Connection):
+    """Índices para cada query do MemoryManager e chave única de preferências"""
+    # Preferências: antes havia uma linha por save_user_preference; mantém a mais recente
+    conn.execute('''
+        DELETE FROM user_preferences
+        WHERE id NOT IN (
+            SELECT MAX(id) FROM user_preferences
+            GROUP BY user_id, agent_type, preference_key
+        )
+    ''')
+    conn.execute('''
+        CREATE UNIQUE INDEX IF NOT EXISTS ux_user_preferences_key
+        ON user_preferences (user_id, agent_type, preference_key)
+    ''')
+
+    # get_conversation_context: filtro + ORDER BY resolvidos pelo índice
+    conn.execute('''
+        CREATE INDEX IF NOT EXISTS ix_long_term_context_thread
+        ON long_term_context (thread_id, agent_type, importance_score DESC, created_at DESC)
+    ''')
+    # cleanup_old_data
+    conn.execute('''
+        CREATE INDEX IF NOT EXISTS ix_long_term_context_created
+        ON long_term_context (created_at, importance_score)
+    ''')
+
+    # update_session_activity
+    conn.execute('''
+        CREATE INDEX IF NOT EXISTS ix_agent_sessions_thread
+        ON agent_sessions (thread_id)
+    ''')
+
+    # get_performance_metrics: índice cobrindo todas as colunas lidas
+    conn.execute('''
+        CREATE INDEX IF NOT EXISTS ix_performance_metrics_user
+        ON performance_metrics (agent_type, user_id, timestamp, metric_type, metric_value)
+    ''')
+    # cleanup_old_data
+    conn.execute('''
+        CREATE INDEX IF NOT EXISTS ix_performance_metrics_timestamp
+        ON performance_metrics (timestamp)
+    ''')
+
+
+def _migration_version_stamps(conn: sqlite3.Connection):
+    """Carimbo de versão por escopo, incrementado por triggers a cada escrita.
+
+    Os caches em processo comparam esse número antes de reutilizar uma
+    entrada, então uma escrita feita por outro worker uvicorn invalida o cache
+    de todos. Escopos: ``prefs:<user_id>:<agent_type>`` e
+    ``ctx:<thread_id>:<agent_type>``.
+    """
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS memory_versions (
+            scope TEXT PRIMARY KEY,
+            version INTEGER NOT NULL DEFAULT 0
+        ) WITHOUT ROWID
+    ''')
+    for table, prefix, key_column in (
+        ("user_preferences", "prefs", "user_id"),
+        ("long_term_context", "ctx", "thread_id"),
+    ):
+        for event, row in (("INSERT", "NEW"), ("UPDATE", "NEW"), ("DELETE", "OLD")):
+            conn.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS trg_{table}_version_{event.lower()}
+                AFTER {event} ON {table}
+                BEGIN
+                    INSERT INTO memory_versions (scope, version)
+                    VALUES ('{prefix}:' || COALESCE({row}.{key_column}, '') || ':' || COALESCE({row}.agent_type, ''), 1)
+                    ON CONFLICT (scope) DO UPDATE SET version = version + 1;
+                END
+            ''')
+
+
+def _migration_metric_rollups(conn: sqlite3.Connection):
+    """Agregados por minuto/hora de performance_metrics (ver utils/metrics_rollup.py)"""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS metric_rollups (
+            granularity TEXT NOT NULL,
+            agent_type TEXT NOT NULL,
+            bucket_start TEXT NOT NULL,
+            metric_type TEXT NOT NULL,
+            count INTEGER NOT NULL,
+            sum REAL NOT NULL,
+            min REAL NOT NULL,
+            max REAL NOT NULL,
+            sketch TEXT NOT NULL,
+            PRIMARY KEY (granularity, agent_type, bucket_start, metric_type)
+        ) WITHOUT ROWID
+    ''')
+    # Último performance_metrics.id já consolidado
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS metric_rollup_state (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            last_id INTEGER NOT NULL
+        )
+    ''')
+    conn.execute("INSERT OR IGNORE INTO metric_rollup_state (id, last_id) VALUES (1, 0)")
+
+
+def _migration_retention_indexes(conn: sqlite3.Connection):
+    """Índice usado pelas remoções em lote do RetentionService em agent_sessions"""
+    conn.execute('''
+        CREATE INDEX IF NOT EXISTS ix_agent_sessions_last_activity
+        ON agent_sessions (last_activity)
+    ''')
+
+
+def _migration_context_compactions(conn: sqlite3.Connection):
+    """Histórico de compactações: tokens do histórico antes/depois por thread"""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS context_compactions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            thread_id TEXT,
+            agent_type TEXT,
+            kind TEXT,
+            tokens_before INTEGER,
+            tokens_after INTEGER,
+            items_folded INTEGER,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    conn.execute('''
+        CREATE INDEX IF NOT EXISTS ix_context_compactions_thread
+        ON context_compactions (thread_id, agent_type, created_at DESC)
+    ''')
+    conn.execute('''
+        CREATE INDEX IF NOT EXISTS ix_context_compactions_created
+        ON context_compactions (created_at)
+    ''')
+
+
+# Limite de linhas por escopo (0 = sem limite); os valores vivem em
+# memory_quotas e podem ser trocados com MemoryManager(quotas=...)
+DEFAULT_QUOTAS = {
+    "thread_context": 500,   # long_term_context por thread_id/agent_type
+    "user_context": 2000,    # long_term_context por user_id/agent_type
+    "user_sessions": 50,     # agent_sessions por user_id/agent_type
+}
+
+# (tabela, quota, prefixo do escopo, coluna da chave, ordem de despejo)
+_QUOTA_SCOPES = [
+    ("long_term_context", "thread_context", "thread", "thread_id", "importance_score, created_at, id"),
+    ("long_term_context", "user_context", "user", "user_id", "importance_score, created_at, id"),
+    ("agent_sessions", "user_sessions", "sessions", "user_id", "last_activity, id"),
+]
+
+
+def _migration_quotas(conn: sqlite3.Connection):
+    """Cotas por usuário/thread com contadores mantidos por triggers.
+
+    memory_usage guarda quantas linhas cada escopo tem
+    (``thread:<thread_id>:<agent_type>``, ``user:<user_id>:<agent_type>``,
+    ``sessions:<user_id>:<agent_type>``), então conferir a cota é uma leitura
+    por chave primária em vez de um COUNT(*). O trigger de INSERT incrementa o
+    contador e, se a cota foi ultrapassada, despeja o excedente na mesma
+    instrução: menor importance_score e mais antigas primeiro (sessões: menor
+    last_activity), nunca a linha recém-inserida. Vale para qualquer caminho
+    de escrita (síncrono, write-behind, importação, outros processos), com uma
+    ressalva: o DELETE implícito de ``INSERT OR REPLACE`` só dispara o trigger
+    de DELETE com ``PRAGMA recursive_triggers=ON`` (import_memory liga); sem
+    isso a linha substituída continua contada.
+    ``evicted:<quota>`` acumula as linhas despejadas. Linhas antigas de
+    long_term_context ficam sem user_id e contam só na cota da thread.
+    """
+    conn.execute("ALTER TABLE long_term_context ADD COLUMN user_id TEXT")
+    conn.execute('''
+        CREATE INDEX IF NOT EXISTS ix_long_term_context_user
+        ON long_term_context (user_id, agent_type, importance_score, created_at)
+    ''')
+    conn.execute('''
+        CREATE INDEX IF NOT EXISTS ix_agent_sessions_user
+        ON agent_sessions (user_id, agent_type, last_activity)
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS memory_quotas (
+            name TEXT PRIMARY KEY,
+            max_rows INTEGER NOT NULL
+        ) WITHOUT ROWID
+    ''')
+    conn.executemany("INSERT OR IGNORE INTO memory_quotas (name, max_rows) VALUES (?, ?)",
+                     DEFAULT_QUOTAS.items())
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS memory_usage (
+            scope TEXT PRIMARY KEY,
+            rows INTEGER NOT NULL DEFAULT 0
+        ) WITHOUT ROWID
+    ''')
+
+    insert_steps, delete_steps = {}, {}
+    for table, quota, prefix, key_column, order in _QUOTA_SCOPES:
+        new_scope = f"'{prefix}:' || NEW.{key_column} || ':' || COALESCE(NEW.agent_type, '')"
+        old_scope = f"'{prefix}:' || OLD.{key_column} || ':' || COALESCE(OLD.agent_type, '')"
+        conn.execute(f'''
+            INSERT INTO memory_usage (scope, rows)
+            SELECT '{prefix}:' || {key_column} || ':' || COALESCE(agent_type, ''), COUNT(*)
+            FROM {table}
+            WHERE {key_column} IS NOT NULL
+            GROUP BY {key_column}, agent_type
+        ''')
+        # Linhas acima da cota (0 sem cota ou sem chave)
+        excess = f'''
+            COALESCE(MAX(0, (SELECT rows FROM memory_usage WHERE scope = {new_scope})
+                            - (SELECT max_rows FROM memory_quotas WHERE name = '{quota}' AND max_rows > 0)), 0)
+        '''
+        insert_steps.setdefault(table, []).append(f'''
+            INSERT INTO memory_usage (scope, rows)
+            SELECT {new_scope}, 1 WHERE NEW.{key_column} IS NOT NULL
+            ON CONFLICT (scope) DO UPDATE SET rows = rows + 1;
+            INSERT INTO memory_usage (scope, rows)
+            SELECT 'evicted:{quota}', excess FROM (SELECT {excess} AS excess) WHERE excess > 0
+            ON CONFLICT (scope) DO UPDATE SET rows = rows + excluded.rows;
+            DELETE FROM {table} WHERE id IN (
+                SELECT id FROM {table}
+                WHERE {key_column} = NEW.{key_column} AND agent_type IS NEW.agent_type AND id != NEW.id
+                ORDER BY {order}
+                LIMIT {excess}
+            );
+        ''')
+        delete_steps.setdefault(table, []).append(f'''
+            UPDATE memory_usage SET rows = rows - 1 WHERE scope = {old_scope};
+        ''')
+
+    for table in insert_steps:
+        conn.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS trg_{table}_quota_insert
+            AFTER INSERT ON {table}
+            BEGIN
+                {"".join(insert_steps[table])}
+            END
+        ''')
+        conn.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS trg_{table}_quota_delete
+            AFTER DELETE ON {table}
+            BEGIN
+                {"".join(delete_steps[table])}
+            END
+        ''')
+
+
+def _fts_text(row: str) -> str:
+    """Texto pesquisável de long_term_context.content: resumo ou pergunta + resposta"""
+    content = f"{row}.content"
+    return f'''
+        CASE WHEN json_valid({content}) AND json_type({content}) = 'object' THEN COALESCE(
+            json_extract({content}, '$.summary'),
+            NULLIF(TRIM(COALESCE(json_extract({content}, '$.prompt'), '') || ' ' ||
+                        COALESCE(json_extract({content}, '$.response'), '')), ''),
+            {content})
+        ELSE {content} END
+    '''
+
+
+def _migration_context_fts(conn: sqlite3.Connection):
+    """Índice FTS5 do histórico, mantido por triggers (ver utils/context_search.py).
+
+    ``thread`` guarda ``<thread_id>_<agent_type>`` como um único termo ('_'
+    faz parte das palavras): a busca combina a pergunta com a thread no
+    próprio MATCH, então só as linhas da thread são pontuadas, por maior que
+    seja a tabela. O rowid é o id de long_term_context. Acentos são
+    ignorados (remove_diacritics).
+    """
+    conn.execute('''
+        CREATE VIRTUAL TABLE IF NOT EXISTS context_fts USING fts5(
+            text, thread, tokenize = "unicode61 remove_diacritics 2 tokenchars '_'"
+        )
+    ''')
+    conn.execute(f'''
+        INSERT INTO context_fts (rowid, text, thread)
+        SELECT id, {_fts_text("long_term_context")}, COALESCE(thread_id, '') || '_' || COALESCE(agent_type, '')
+        FROM long_term_context
+    ''')
+    conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS trg_long_term_context_fts_insert
+        AFTER INSERT ON long_term_context
+        BEGIN
+            INSERT INTO context_fts (rowid, text, thread)
+            VALUES (NEW.id, {_fts_text("NEW")}, COALESCE(NEW.thread_id, '') || '_' || COALESCE(NEW.agent_type, ''));
+        END
+    ''')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_long_term_context_fts_delete
+        AFTER DELETE ON long_term_context
+        BEGIN
+            DELETE FROM context_fts WHERE rowid = OLD.id;
+        END
+    ''')
+    conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS trg_long_term_context_fts_update
+        AFTER UPDATE OF content, thread_id, agent_type ON long_term_context
+        BEGIN
+            DELETE FROM context_fts WHERE rowid = OLD.id;
+            INSERT INTO context_fts (rowid, text, thread)
+            VALUES (NEW.id, {_fts_text("NEW")}, COALESCE(NEW.thread_id, '') || '_' || COALESCE(NEW.agent_type, ''));
+        END
+    ''')
+
+
+def _migration_context_compression(conn: sqlite3.Connection):
+    """Conteúdo comprimido (BLOB zstd) em long_term_context (ver utils/context_codec.py).
+
+    Os dicionários ficam em ``context_dictionaries``. Os triggers do FTS5
+    passam a ignorar BLOBs, que o SQL não consegue ler: linhas comprimidas
+    entram pela view ``long_term_context_packed``, que recebe também o texto
+    pesquisável calculado em Python e o grava no índice na mesma instrução.
+    Recomprimir uma linha antiga (TEXT → BLOB) mantém o texto já indexado.
+    """
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS context_dictionaries (
+            dict_id INTEGER PRIMARY KEY,
+            data BLOB NOT NULL,
+            samples INTEGER,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    conn.execute("DROP TRIGGER IF EXISTS trg_long_term_context_fts_insert")
+    conn.execute("DROP TRIGGER IF EXISTS trg_long_term_context_fts_update")
+    conn.execute(f'''
+        CREATE TRIGGER trg_long_term_context_fts_insert
+        AFTER INSERT ON long_term_context
+        WHEN typeof(NEW.content) != 'blob'
+        BEGIN
+            INSERT INTO context_fts (rowid, text, thread)
+            VALUES (NEW.id, {_fts_text("NEW")}, COALESCE(NEW.thread_id, '') || '_' || COALESCE(NEW.agent_type, ''));
+        END
+    ''')
+    conn.execute(f'''
+        CREATE TRIGGER trg_long_term_context_fts_update
+        AFTER UPDATE OF content, thread_id, agent_type ON long_term_context
+        WHEN typeof(NEW.content) != 'blob'
+        BEGIN
+            DELETE FROM context_fts WHERE rowid = OLD.id;
+            INSERT INTO context_fts (rowid, text, thread)
+            VALUES (NEW.id, {_fts_text("NEW")}, COALESCE(NEW.thread_id, '') || '_' || COALESCE(NEW.agent_type, ''));
+        END
+    ''')
+    conn.execute('''
+        CREATE VIEW IF NOT EXISTS long_term_context_packed AS
+        SELECT thread_id, agent_type, context_type, content, importance_score, user_id,
+               NULL AS search_text
+        FROM long_term_context
+    ''')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_long_term_context_packed_insert
+        INSTEAD OF INSERT ON long_term_context_packed
+        BEGIN
+            INSERT INTO long_term_context
+            (thread_id, agent_type, context_type, content, importance_score, user_id)
+            VALUES (NEW.thread_id, NEW.agent_type, NEW.context_type, NEW.content, NEW.importance_score, NEW.user_id);
+            INSERT INTO context_fts (rowid, text, thread)
+            VALUES (last_insert_rowid(), NEW.search_text,
+                    COALESCE(NEW.thread_id, '') || '_' || COALESCE(NEW.agent_type, ''));
+        END
+    ''')
+
+
+# (versão, descrição, função). Nunca altere uma migração já publicada:
+# acrescente uma nova com a próxima versão.
+MIGRATIONS: List[Tuple[int, str, Callable[[sqlite3.Connection], None]]] = [
+    (1, "índices e chaves únicas", _migration_indexes_and_unique_keys),
+    (2, "carimbos de versão para cache", _migration_version_stamps),
+    (3, "agregados de métricas", _migration_metric_rollups),
+    (4, "índices de retenção", _migration_retention_indexes),
+    (5, "histórico de compactações", _migration_context_compactions),
+    (6, "cotas por usuário e thread", _migration_quotas),
+    (7, "busca textual no histórico", _migration_context_fts),
+    (8, "contexto comprimido com dicionário", _migration_context_compression),
+]
+
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+
+def version_scope(prefix: str, key: str, agent_type: str) -> str:
+    """Escopo em memory_versions, no mesmo formato gerado pelos triggers"""
+    return f"{prefix}:{key or ''}:{agent_type or ''}"
+
+
+def create_tables(conn: sqlite3.Connection):
+    """Cria as tabelas base, se ainda não existirem"""
+    for ddl in BASE_TABLES:
+        conn.execute(ddl)
+
+
+def apply_migrations(conn: sqlite3.Connection) -> List[int]:
+    """Aplica as migrações pendentes e retorna as versões aplicadas.
+
+    Deve rodar dentro de uma transação de escrita (BEGIN IMMEDIATE) para que
+    dois processos iniciando juntos não migrem o mesmo arquivo em paralelo.
+    """
+    current = conn.execute("PRAGMA user_version").fetchone()[0]
+    applied = []
+    for version, description, migrate in MIGRATIONS:
+        if version <= current:
+            continue
+        migrate(conn)
+        conn.execute(f"PRAGMA user_version = {version}")
+        applied.append(version)
+        print(f"🗄️ Migração de memória v{version} aplicada: {description}")
+    if applied:
+        analyze(conn)
+    return applied
+
+
+def analyze(conn: sqlite3.Connection):
+    """ANALYZE das tabelas comuns, sem as tabelas internas do FTS5.
+
+    Com estatísticas do índice FTS5 (principalmente tiradas com ele vazio) a
+    conexão passa a escolher planos ruins para as consultas internas do
+    FTS5, e cada INSERT em long_term_context fica mais lento conforme a
+    tabela cresce.
+    """
+    tables = [row[0] for row in conn.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'table' "
+        "AND name NOT LIKE 'sqlite\\_%' ESCAPE '\\' AND name NOT LIKE 'context\\_fts%' ESCAPE '\\'"
+    )]
+    for table in tables:
+        conn.execute(f'ANALYZE "{table}"')
@@ -0,0 +1,319 @@
+"""Agregados por minuto/hora de performance_metrics com percentis aproximados"""
+
+import json
+import math
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, List, Optional
+
+from utils.sqlite_pool import SQLitePool
+
+# granularidade -> tamanho do prefixo do timestamp que identifica o bucket
+GRANULARITIES = {
+    "minute": 16,   # 'YYYY-MM-DD HH:MM'
+    "hour": 13,     # 'YYYY-MM-DD HH'
+}
+
+SQL_SELECT_NEW_RAW = '''
+    SELECT id, agent_type, metric_type, metric_value, timestamp
+    FROM performance_metrics
+    WHERE id > ?
+    ORDER BY id
+    LIMIT ?
+'''
+SQL_SELECT_ROLLUP = '''
+    SELECT count, sum, min, max, sketch FROM metric_rollups
+    WHERE granularity = ? AND agent_type = ? AND bucket_start = ? AND metric_type = ?
+'''
+SQL_UPSERT_ROLLUP = '''
+    INSERT INTO metric_rollups
+    (granularity, agent_type, bucket_start, metric_type, count, sum, min, max, sketch)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT (granularity, agent_type, bucket_start, metric_type)
+    DO UPDATE SET count = excluded.count, sum = excluded.sum, min = excluded.min,
+                  max = excluded.max, sketch = excluded.sketch
+'''
+SQL_INSERT_RAW = '''
+    INSERT INTO performance_metrics (agent_type, user_id, metric_type, metric_value, timestamp)
+    VALUES (?, ?, ?, ?, ?)
+'''
+SQL_MARK_ALL_ROLLED_UP = '''
+    UPDATE metric_rollup_state SET last_id = (SELECT COALESCE(MAX(id), 0) FROM performance_metrics)
+    WHERE id = 1
+'''
+SQL_SELECT_RANGE = '''
+    SELECT bucket_start, metric_type, count, sum, min, max, sketch FROM metric_rollups
+    WHERE granularity = ? AND agent_type = ? AND bucket_start >= ?
+'''
+# Linhas brutas ainda fora dos agregados (id acima do marcador): busca pelo rowid
+SQL_SELECT_PENDING_RAW = '''
+    SELECT metric_type, metric_value, timestamp FROM performance_metrics
+    WHERE id > (SELECT last_id FROM metric_rollup_state WHERE id = 1)
+      AND agent_type = ? AND timestamp >= ? AND metric_value IS NOT NULL
+'''
+
+
+class QuantileSketch:
+    """Histograma em escala logarítmica (estilo DDSketch), mesclável.
+
+    Cada valor positivo cai no bin ``ceil(log(v) / log(gamma))``; qualquer
+    quantil estimado tem erro relativo de no máximo ``relative_accuracy``.
+    Valores <= 0 ficam num contador à parte.
+    """
+
+    def __init__(self, relative_accuracy: float = 0.01):
+        self.relative_accuracy = relative_accuracy
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self.gamma)
+        self.bins: Dict[int, int] = defaultdict(int)
+        self.zero_count = 0
+        self.count = 0
+
+    def add(self, value: float, count: int = 1):
+        if value <= 0:
+            self.zero_count += count
+        else:
+            self.bins[math.ceil(math.log(value) / self._log_gamma)] += count
+        self.count += count
+
+    def merge(self, other: "QuantileSketch"):
+        for index, count in other.bins.items():
+            self.bins[index] += count
+        self.zero_count += other.zero_count
+        self.count += other.count
+
+    def quantile(self, q: float) -> Optional[float]:
+        if self.count == 0:
+            return None
+        rank = q * (self.count - 1)
+        seen = self.zero_count
+        if rank < seen:
+            return 0.0
+        for index in sorted(self.bins):
+            seen += self.bins[index]
+            if rank < seen:
+                # Centro do bin: 2 * gamma^i / (gamma + 1)
+                return 2 * self.gamma ** index / (self.gamma + 1)
+        return 2 * self.gamma ** max(self.bins) / (self.gamma + 1)
+
+    def to_json(self) -> str:
+        return json.dumps({"a": self.relative_accuracy, "z": self.zero_count,
+                           "b": {str(k): v for k, v in self.bins.items()}}, separators=(",", ":"))
+
+    @classmethod
+    def from_json(cls, data: Optional[str]) -> "QuantileSketch":
+        if not data:
+            return cls()
+        raw = json.loads(data)
+        sketch = cls(raw.get("a", 0.01))
+        sketch.zero_count = raw.get("z", 0)
+        for index, count in raw.get("b", {}).items():
+            sketch.bins[int(index)] = count
+        sketch.count = sketch.zero_count + sum(sketch.bins.values())
+        return sketch
+
+
+class MetricAggregate:
+    """count/sum/min/max + sketch de um conjunto de valores; mesclável entre shards"""
+
+    __slots__ = ("count", "sum", "min", "max", "sketch")
+
+    def __init__(self):
+        self.count = 0
+        self.sum = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+        self.sketch = QuantileSketch()
+
+    def add(self, value: float):
+        self.count += 1
+        self.sum += value
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+        self.sketch.add(value)
+
+    def merge_row(self, count, total, minimum, maximum, sketch_json):
+        self.count += count
+        self.sum += total
+        self.min = min(self.min, minimum)
+        self.max = max(self.max, maximum)
+        self.sketch.merge(QuantileSketch.from_json(sketch_json))
+
+    def merge(self, other: "MetricAggregate"):
+        self.count += other.count
+        self.sum += other.sum
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        self.sketch.merge(other.sketch)
+
+    def as_dict(self) -> Dict[str, Any]:
+        if not self.count:
+            return {"count": 0, "sum": 0.0, "avg": None, "min": None, "max": None,
+                    "p50": None, "p95": None, "p99": None}
+        return {
+            "count": self.count,
+            "sum": self.sum,
+            "avg": self.sum / self.count,
+            "min": self.min,
+            "max": self.max,
+            "p50": self.sketch.quantile(0.50),
+            "p95": self.sketch.quantile(0.95),
+            "p99": self.sketch.quantile(0.99),
+        }
+
+
+class MetricsRollup:
+    """Consolida performance_metrics em metric_rollups de forma incremental.
+
+    ``roll_up`` processa apenas as linhas com id maior que o último já
+    consolidado (guardado em metric_rollup_state) e, em seguida, apaga as
+    linhas brutas consolidadas mais antigas que ``raw_retention`` e os
+    buckets de minuto mais antigos que ``minute_retention``. As
+    consultas só leem: buckets agregados mais as linhas brutas que ainda não
+    foram consolidadas, num mesmo snapshot. O custo depende da janela pedida
+    e do intervalo entre consolidações, não do volume de métricas gravadas.
+    """
+
+    def __init__(self, pool: SQLitePool, raw_retention: timedelta = timedelta(days=2),
+                 minute_retention: timedelta = timedelta(days=3), batch_size: int = 5000):
+        self.pool = pool
+        self.raw_retention = raw_retention
+        self.minute_retention = minute_retention
+        self.batch_size = batch_size
+
+    def roll_up(self) -> int:
+        """Consolida as métricas novas; retorna quantas linhas brutas processou"""
+        processed = 0
+        while True:
+            with self.pool.transaction() as conn:
+                last_id = conn.execute("SELECT last_id FROM metric_rollup_state WHERE id = 1").fetchone()[0]
+                rows = conn.execute(SQL_SELECT_NEW_RAW, (last_id, self.batch_size)).fetchall()
+                if not rows:
+                    break
+                self._merge_batch(conn, rows)
+                conn.execute("UPDATE metric_rollup_state SET last_id = ? WHERE id = 1", (rows[-1][0],))
+                processed += len(rows)
+            if len(rows) < self.batch_size:
+                break
+        self.prune()
+        return processed
+
+    def _merge_batch(self, conn, rows: Iterable[tuple]):
+        buckets: Dict[tuple, MetricAggregate] = defaultdict(MetricAggregate)
+        for _, agent_type, metric_type, value, timestamp in rows:
+            if value is None or timestamp is None:
+                continue
+            for granularity, prefix in GRANULARITIES.items():
+                key = (granularity, agent_type or "", str(timestamp)[:prefix], metric_type or "")
+                buckets[key].add(float(value))
+
+        for key, aggregate in buckets.items():
+            existing = conn.execute(SQL_SELECT_ROLLUP, key).fetchone()
+            if existing:
+                aggregate.merge_row(*existing)
+            conn.execute(SQL_UPSERT_ROLLUP, (*key, aggregate.count, aggregate.sum, aggregate.min,
+                                             aggregate.max, aggregate.sketch.to_json()))
+
+    def absorb(self, conn, raw_rows: Iterable[tuple], rollup_rows: Iterable[tuple]) -> int:
+        """Incorpora métricas já consolidadas em outro banco (migração para shards).
+
+        Roda na transação do chamador. As linhas locais pendentes são
+        consolidadas antes; em seguida entram as linhas brutas importadas
+        ``(agent_type, user_id, metric_type, metric_value, timestamp)`` e os
+        agregados são mesclados bucket a bucket. O marcador avança sobre as
+        linhas importadas, que já estão nos agregados. Retorna quantas linhas
+        brutas entraram.
+        """
+        last_id = conn.execute("SELECT last_id FROM metric_rollup_state WHERE id = 1").fetchone()[0]
+        self._merge_batch(conn, conn.execute(SQL_SELECT_NEW_RAW, (last_id, -1)).fetchall())
+        imported = conn.executemany(SQL_INSERT_RAW, raw_rows).rowcount
+        for granularity, agent_type, bucket_start, metric_type, *values in rollup_rows:
+            key = (granularity, agent_type, bucket_start, metric_type)
+            aggregate = MetricAggregate()
+            aggregate.merge_row(*values)
+            existing = conn.execute(SQL_SELECT_ROLLUP, key).fetchone()
+            if existing:
+                aggregate.merge_row(*existing)
+            conn.execute(SQL_UPSERT_ROLLUP, (*key, aggregate.count, aggregate.sum, aggregate.min,
+                                             aggregate.max, aggregate.sketch.to_json()))
+        conn.execute(SQL_MARK_ALL_ROLLED_UP)
+        return imported
+
+    def prune(self) -> int:
+        """Apaga linhas brutas já consolidadas e buckets de minuto antigos"""
+        now = datetime.utcnow()
+        raw_cutoff = (now - self.raw_retention).strftime("%Y-%m-%d %H:%M:%S")
+        minute_cutoff = (now - self.minute_retention).strftime("%Y-%m-%d %H:%M")
+        with self.pool.transaction() as conn:
+            last_id = conn.execute("SELECT last_id FROM metric_rollup_state WHERE id = 1").fetchone()[0]
+            removed = conn.execute(
+                "DELETE FROM performance_metrics WHERE timestamp < ? AND id <= ?", (raw_cutoff, last_id)
+            ).rowcount
+            removed += conn.execute(
+                "DELETE FROM metric_rollups WHERE granularity = 'minute' AND bucket_start < ?", (minute_cutoff,)
+            ).rowcount
+            return removed
+
+    def _load(self, granularity: str, agent_type: str, since: datetime) -> List[tuple]:
+        """Linhas de metric_rollups da janela, com as métricas pendentes somadas por bucket"""
+        prefix = GRANULARITIES[granularity]
+        start = since.strftime("%Y-%m-%d %H:%M:%S")
+        with self.pool.connection() as conn:
+            # Uma transação de leitura: uma consolidação no meio não conta nada duas vezes
+            conn.execute("BEGIN")
+            try:
+                rows = conn.execute(SQL_SELECT_RANGE, (granularity, agent_type, start[:prefix])).fetchall()
+                pending = conn.execute(SQL_SELECT_PENDING_RAW, (agent_type, start)).fetchall()
+            finally:
+                conn.execute("COMMIT")
+        if not pending:
+            return rows
+        buckets: Dict[tuple, MetricAggregate] = defaultdict(MetricAggregate)
+        for metric_type, value, timestamp in pending:
+            buckets[(str(timestamp)[:prefix], metric_type or "")].add(float(value))
+        return rows + [(bucket_start, metric_type, a.count, a.sum, a.min, a.max, a.sketch.to_json())
+                       for (bucket_start, metric_type), a in buckets.items()]
+
+    @staticmethod
+    def _pick_granularity(window: timedelta) -> str:
+        # Até 3 horas: buckets de minuto (<= 180 linhas); acima disso, de hora
+        return "minute" if window <= timedelta(hours=3) else "hour"
+
+    def aggregates(self, agent_type: str, window: timedelta = timedelta(days=30),
+                   metric_type: Optional[str] = None) -> Dict[str, MetricAggregate]:
+        """Agregado por metric_type dentro da janela (antes de virar dict)"""
+        since = datetime.utcnow() - window
+        totals: Dict[str, MetricAggregate] = defaultdict(MetricAggregate)
+        for _, m_type, count, total, minimum, maximum, sketch in self._load(
+                self._pick_granularity(window), agent_type, since):
+            if metric_type is None or m_type == metric_type:
+                totals[m_type].merge_row(count, total, minimum, maximum, sketch)
+        return dict(totals)
+
+    def summary(self, agent_type: str, window: timedelta = timedelta(days=30),
+                metric_type: Optional[str] = None) -> Dict[str, Dict[str, Any]]:
+        """count/sum/avg/min/max/p50/p95/p99 por metric_type dentro da janela"""
+        return {m_type: aggregate.as_dict()
+                for m_type, aggregate in self.aggregates(agent_type, window, metric_type).items()}
+
+    def bucket_aggregates(self, agent_type: str, metric_type: str, window: timedelta = timedelta(hours=24),
+                          granularity: Optional[str] = None) -> Dict[str, MetricAggregate]:
+        """Agregado por bucket de um metric_type (antes de virar série)"""
+        granularity = granularity or self._pick_granularity(window)
+        since = datetime.utcnow() - window
+        buckets: Dict[str, MetricAggregate] = {}
+        for bucket_start, m_type, count, total, minimum, maximum, sketch in self._load(
+                granularity, agent_type, since):
+            if m_type == metric_type:
+                buckets.setdefault(bucket_start, MetricAggregate()).merge_row(count, total, minimum, maximum, sketch)
+        return buckets
+
+    def series(self, agent_type: str, metric_type: str, window: timedelta = timedelta(hours=24),
+               granularity: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Série temporal (um ponto por bucket) de um metric_type"""
+        return series_points(self.bucket_aggregates(agent_type, metric_type, window, granularity))
+
+
+def series_points(buckets: Dict[str, MetricAggregate]) -> List[Dict[str, Any]]:
+    """Pontos da série, em ordem de bucket"""
+    return [{"bucket": bucket, **buckets[bucket].as_dict()} for bucket in sorted(buckets)]
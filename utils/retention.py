@@ -0,0 +1,212 @@
+"""Serviço de retenção: apaga dados expirados em lotes pequenos e recupera espaço"""
+
+import asyncio
+import os
+import time
+from datetime import datetime, timedelta
+from typing import Any, Dict, Optional
+
+from utils.sqlite_pool import SQLitePool
+
+# Política por tabela: coluna de data, dias de retenção e filtro extra opcional.
+# Contexto com importance_score >= 3 (resumos, trading/apostas críticos) não expira;
+# métricas só expiram depois de entrarem nos agregados (ver utils/metrics_rollup.py).
+DEFAULT_RETENTION_POLICIES: Dict[str, Dict[str, Any]] = {
+    "long_term_context": {"column": "created_at", "days": 90, "where": "importance_score < 3"},
+    "performance_metrics": {"column": "timestamp", "days": 30,
+                            "where": "id <= (SELECT last_id FROM metric_rollup_state WHERE id = 1)"},
+    "agent_sessions": {"column": "last_activity", "days": 30},
+    "context_compactions": {"column": "created_at", "days": 30},
+}
+
+
+class RetentionService:
+    """Executa as políticas de retenção sem bloquear os escritores.
+
+    Cada lote apaga no máximo ``batch_size`` linhas numa transação curta e
+    uma passada inteira respeita ``max_pass_seconds``; o que sobrar fica para
+    a próxima passada. Depois das remoções roda ``PRAGMA incremental_vacuum``
+    em passos limitados e registra quantos bytes voltaram ao sistema. Com a
+    memória particionada (ShardedMemoryManager) cada shard é tratado igual.
+
+    A manutenção (agregados de métricas, dicionário de compressão e
+    compactação do histórico) é outra tarefa, ``run_maintenance``, agendada
+    a cada ``maintenance_interval`` com o mesmo limite de tempo por passada.
+    """
+
+    def __init__(self, memory_manager, policies: Optional[Dict[str, Dict[str, Any]]] = None,
+                 interval: float = 300.0, batch_size: int = 500, max_pass_seconds: float = 2.0,
+                 pause: float = 0.01, vacuum_pages: int = 256,
+                 max_full_vacuum_bytes: int = 256 * 1024 * 1024, maintenance_interval: float = 60.0):
+        self.memory_manager = memory_manager
+        self.policies = policies if policies is not None else DEFAULT_RETENTION_POLICIES
+        self.interval = interval
+        self.maintenance_interval = maintenance_interval
+        self.batch_size = batch_size
+        self.max_pass_seconds = max_pass_seconds
+        self.pause = pause
+        self.vacuum_pages = vacuum_pages
+        self.max_full_vacuum_bytes = max_full_vacuum_bytes
+        self._task: Optional[asyncio.Task] = None
+        self.stats: Dict[str, Any] = {"passes": 0, "deleted": {}, "reclaimed_bytes": 0, "last_run": None,
+                                      "maintenance_passes": 0, "skipped_steps": 0}
+
+    def delete_expired(self, pool: SQLitePool, table: str, policy: Dict[str, Any],
+                       deadline: Optional[float] = None) -> int:
+        """Apaga linhas expiradas de uma tabela em lotes; retorna o total removido"""
+        cutoff = (datetime.utcnow() - timedelta(days=policy["days"])).strftime("%Y-%m-%d %H:%M:%S")
+        extra = f" AND ({policy['where']})" if policy.get("where") else ""
+        sql = f'''
+            DELETE FROM {table} WHERE rowid IN (
+                SELECT rowid FROM {table}
+                WHERE {policy["column"]} < ?{extra}
+                LIMIT ?
+            )
+        '''
+        removed = 0
+        # Sempre ao menos um lote por tabela, para nenhuma política ficar sem vez
+        while True:
+            with pool.transaction() as conn:
+                batch = conn.execute(sql, (cutoff, self.batch_size)).rowcount
+            removed += batch
+            if batch < self.batch_size or (deadline is not None and time.monotonic() >= deadline):
+                break
+            # Libera o lock de escrita entre lotes
+            time.sleep(self.pause)
+        return removed
+
+    def enable_incremental_vacuum(self, pool: SQLitePool) -> bool:
+        """Converte bancos antigos para auto_vacuum=INCREMENTAL.
+
+        Bancos novos já nascem assim (ver DEFAULT_PRAGMAS); nos antigos a troca
+        exige um VACUUM completo, feito uma única vez e só se o arquivo for
+        menor que ``max_full_vacuum_bytes`` para não travar a inicialização.
+        """
+        with pool.connection() as conn:
+            if conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 2:
+                return True
+            size = self._db_size(pool)
+            if size > self.max_full_vacuum_bytes:
+                print(f"⚠️ Banco com {size} bytes: rode 'PRAGMA auto_vacuum=INCREMENTAL; VACUUM' manualmente")
+                return False
+            conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+            # VACUUM não pode rodar dentro de transação
+            conn.execute("VACUUM")
+            print(f"🗄️ auto_vacuum incremental ativado em {pool.db_path}")
+            return True
+
+    def incremental_vacuum(self, pool: SQLitePool, deadline: Optional[float] = None) -> int:
+        """Devolve páginas livres ao sistema; retorna bytes recuperados"""
+        with pool.connection() as conn:
+            if conn.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+                return 0
+            page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+            before = conn.execute("PRAGMA freelist_count").fetchone()[0]
+            free = before
+            while free:
+                # executescript executa todos os passos; execute() liberaria uma página só
+                conn.executescript(f"PRAGMA incremental_vacuum({self.vacuum_pages});")
+                free = conn.execute("PRAGMA freelist_count").fetchone()[0]
+                if deadline is not None and time.monotonic() >= deadline:
+                    break
+            # Leva as páginas truncadas do WAL para o arquivo principal
+            conn.execute("PRAGMA wal_checkpoint(PASSIVE)").fetchall()
+        return (before - free) * page_size
+
+    def run_maintenance(self) -> Dict[str, Any]:
+        """Uma passada de manutenção: agregados de métricas, dicionário e compactação.
+
+        Cada etapa só começa se a passada ainda estiver dentro de
+        ``max_pass_seconds``; as que ficarem de fora rodam na próxima.
+        """
+        started = time.monotonic()
+        deadline = started + self.max_pass_seconds if self.max_pass_seconds else None
+        steps = [
+            ("rolled_up", self.memory_manager.rollup_metrics),
+            # Compressão ligada e ainda sem dicionário: treina assim que houver
+            # histórico, antes que a compactação troque os turnos por resumos
+            ("trained", lambda: [shard.train_context_dictionary() for shard in self.memory_manager.shards()
+                                 if shard.codec.needs_dictionary()]),
+            ("compacted", self.memory_manager.compact_memory),
+        ]
+        report: Dict[str, Any] = {"skipped": []}
+        for name, step in steps:
+            if deadline is not None and time.monotonic() >= deadline:
+                report["skipped"].append(name)
+                continue
+            report[name] = step()
+        self.stats["maintenance_passes"] += 1
+        self.stats["skipped_steps"] += len(report["skipped"])
+        report["seconds"] = round(time.monotonic() - started, 3)
+        if report["skipped"]:
+            print(f"⏱️ Manutenção da memória adiada: {report['skipped']} ({report['seconds']}s)")
+        return report
+
+    def run_once(self) -> Dict[str, Any]:
+        """Uma passada de retenção: remoções em lote e vacuum"""
+        started = time.monotonic()
+        deadline = started + self.max_pass_seconds if self.max_pass_seconds else None
+        pools = [shard.pool for shard in self.memory_manager.shards()]
+        size_before = sum(self._db_size(pool) for pool in pools)
+
+        deleted = {table: 0 for table in self.policies}
+        for pool in pools:
+            for table, policy in self.policies.items():
+                deleted[table] += self.delete_expired(pool, table, policy, deadline)
+        for table, count in deleted.items():
+            self.stats["deleted"][table] = self.stats["deleted"].get(table, 0) + count
+
+        reclaimed = sum(self.incremental_vacuum(pool, deadline) for pool in pools)
+        self.stats["passes"] += 1
+        self.stats["reclaimed_bytes"] += reclaimed
+        self.stats["last_run"] = datetime.now().isoformat()
+
+        report = {
+            "deleted": deleted,
+            "reclaimed_bytes": reclaimed,
+            "db_bytes_before": size_before,
+            "db_bytes_after": sum(self._db_size(pool) for pool in pools),
+            "seconds": round(time.monotonic() - started, 3),
+        }
+        if any(deleted.values()) or reclaimed:
+            print(f"🧹 Retenção: {deleted} | {reclaimed} bytes recuperados em {report['seconds']}s")
+        return report
+
+    @staticmethod
+    def _db_size(pool: SQLitePool) -> int:
+        path = pool.db_path
+        return sum(os.path.getsize(p) for p in (path, f"{path}-wal") if os.path.exists(p))
+
+    async def _loop(self):
+        loop = asyncio.get_running_loop()
+        for shard in self.memory_manager.shards():
+            try:
+                await loop.run_in_executor(None, self.enable_incremental_vacuum, shard.pool)
+            except Exception as e:
+                print(f"⚠️ Não foi possível ativar o auto_vacuum incremental: {e}")
+        await asyncio.gather(self._every(self.maintenance_interval, self.run_maintenance, "manutenção"),
+                             self._every(self.interval, self.run_once, "retenção"))
+
+    @staticmethod
+    async def _every(interval: float, job, label: str):
+        loop = asyncio.get_running_loop()
+        while True:
+            try:
+                await loop.run_in_executor(None, job)
+            except Exception as e:
+                print(f"⚠️ Erro na {label} da memória: {e}")
+            await asyncio.sleep(interval)
+
+    def start(self):
+        """Inicia a tarefa periódica no event loop atual (lifespan do FastAPI)"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
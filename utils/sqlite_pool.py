@@ -0,0 +1,120 @@
+"""Pool de conexões SQLite de longa duração usado pela camada de memória"""
+
+import queue
+import sqlite3
+import threading
+from contextlib import contextmanager
+from typing import Dict, Iterator, Optional
+
+# Pragmas aplicados em toda conexão aberta pelo pool.
+# WAL permite leitores concorrentes com um escritor; synchronous=NORMAL em WAL
+# só faz fsync no checkpoint, mantendo a durabilidade contra crash do processo.
+# auto_vacuum só vale para arquivos novos (precisa vir antes de criar tabelas);
+# bancos existentes são convertidos pelo RetentionService.
+DEFAULT_PRAGMAS: Dict[str, object] = {
+    "auto_vacuum": "INCREMENTAL",
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "cache_size": -16000,      # ~16 MB de page cache por conexão
+    "temp_store": "MEMORY",
+    "mmap_size": 134217728,    # 128 MB
+    "busy_timeout": 5000,      # ms esperando o lock de escrita antes de falhar
+    "foreign_keys": "OFF",
+}
+
+
+class SQLitePool:
+    """Mantém conexões abertas e as reutiliza entre chamadas.
+
+    Cada conexão guarda o cache de statements compilados do sqlite3
+    (``cached_statements``), então as queries fixas do MemoryManager são
+    preparadas uma única vez por conexão.
+    """
+
+    def __init__(self, db_path: str, size: int = 4, timeout: float = 10.0,
+                 pragmas: Optional[Dict[str, object]] = None, cached_statements: int = 256):
+        self.db_path = db_path
+        self.size = max(1, size)
+        self.timeout = timeout
+        self.pragmas = {**DEFAULT_PRAGMAS, **(pragmas or {})}
+        self.cached_statements = cached_statements
+        self._idle: "queue.LifoQueue[sqlite3.Connection]" = queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+        self._closed = False
+
+    def _open(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(
+            self.db_path,
+            timeout=self.timeout,
+            check_same_thread=False,
+            cached_statements=self.cached_statements,
+            isolation_level=None,  # transações controladas explicitamente em transaction()
+        )
+        for name, value in self.pragmas.items():
+            conn.execute(f"PRAGMA {name}={value}")
+        return conn
+
+    def _acquire(self) -> sqlite3.Connection:
+        if self._closed:
+            raise RuntimeError("SQLitePool já foi fechado")
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+
+        with self._lock:
+            if self._created < self.size:
+                self._created += 1
+                try:
+                    return self._open()
+                except Exception:
+                    self._created -= 1
+                    raise
+
+        try:
+            return self._idle.get(timeout=self.timeout)
+        except queue.Empty:
+            raise TimeoutError(f"Nenhuma conexão SQLite livre após {self.timeout}s ({self.db_path})")
+
+    def _release(self, conn: sqlite3.Connection):
+        if self._closed:
+            conn.close()
+            return
+        self._idle.put(conn)
+
+    @contextmanager
+    def connection(self) -> Iterator[sqlite3.Connection]:
+        """Empresta uma conexão do pool (sem abrir transação)"""
+        conn = self._acquire()
+        try:
+            yield conn
+        finally:
+            if conn.in_transaction:
+                conn.rollback()
+            self._release(conn)
+
+    @contextmanager
+    def transaction(self) -> Iterator[sqlite3.Connection]:
+        """Empresta uma conexão dentro de uma transação BEGIN IMMEDIATE.
+
+        Commit ao sair normalmente, rollback em caso de exceção.
+        """
+        with self.connection() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn
+            except BaseException:
+                conn.rollback()
+                raise
+            else:
+                conn.commit()
+
+    def close(self):
+        """Fecha todas as conexões ociosas; as emprestadas fecham ao voltar"""
+        self._closed = True
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
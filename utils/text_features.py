@@ -0,0 +1,47 @@
+"""Features de texto com hashing (palavras, bigramas e trigramas de caracteres)"""
+
+import re
+import unicodedata
+import zlib
+from typing import Iterable, List
+
+import numpy as np
+
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def normalize_text(text: str) -> str:
+    """Minúsculas e sem acentos: 'Preço' e 'preco' viram o mesmo token"""
+    decomposed = unicodedata.normalize("NFKD", text.lower())
+    return "".join(ch for ch in decomposed if not unicodedata.combining(ch))
+
+
+def tokenize(text: str) -> List[str]:
+    return _WORD_RE.findall(normalize_text(text))
+
+
+def ngram_features(text: str) -> List[str]:
+    """Palavras, bigramas de palavras e trigramas de caracteres de cada palavra.
+
+    Os trigramas aproximam variações de flexão ('aposta', 'apostas',
+    'apostar') sem precisar de stemmer.
+    """
+    words = tokenize(text)
+    features = [f"w:{w}" for w in words]
+    features.extend(f"b:{a}_{b}" for a, b in zip(words, words[1:]))
+    for word in words:
+        if len(word) > 3:
+            padded = f"<{word}>"
+            features.extend(f"c:{padded[i:i + 3]}" for i in range(len(padded) - 2))
+    return features
+
+
+def hash_features(features: Iterable[str], n_features: int) -> np.ndarray:
+    """Índices estáveis entre processos (crc32, não o hash() do Python)"""
+    return np.fromiter((zlib.crc32(f.encode()) % n_features for f in features), dtype=np.int64)
+
+
+def term_counts(text: str, n_features: int) -> np.ndarray:
+    """Vetor denso de contagens das features hasheadas do texto"""
+    return np.bincount(hash_features(ngram_features(text), n_features),
+                       minlength=n_features).astype(np.float32)
@@ -0,0 +1,172 @@
+"""Cache de resultados de tools MCP idempotentes (memória LRU + TTL, disco opcional)"""
+
+import asyncio
+import hashlib
+import json
+import os
+import time
+from typing import Any, Dict, Optional
+
+from langchain_core.tools import BaseTool, StructuredTool
+
+from utils.lru_cache import LRUTTLCache
+from utils.sqlite_pool import SQLitePool
+
+# TTL (s) das tools conhecidamente idempotentes dos servidores em mcp_servers.py
+TOOL_TTLS: Dict[str, float] = {
+    "search": 600.0,                  # duckduckgo
+    "fetch_content": 3600.0,          # duckduckgo
+    "resolve-library-id": 86400.0,    # context7
+    "get-library-docs": 21600.0,      # context7
+}
+
+# Nunca em cache: guardam estado entre chamadas ou têm efeito colateral
+NON_CACHEABLE = {
+    "sequentialthinking",
+    "sequentialthinking_tools",
+    "use_tool",
+}
+
+SQL_CREATE_RESULTS = """
+CREATE TABLE IF NOT EXISTS tool_results (
+    key TEXT PRIMARY KEY,
+    tool TEXT NOT NULL,
+    content TEXT NOT NULL,
+    cost_ms REAL NOT NULL,
+    expires_at REAL NOT NULL
+)
+"""
+SQL_GET_RESULT = "SELECT content, cost_ms FROM tool_results WHERE key = ? AND expires_at > ?"
+SQL_PUT_RESULT = ("INSERT OR REPLACE INTO tool_results (key, tool, content, cost_ms, expires_at) "
+                  "VALUES (?, ?, ?, ?, ?)")
+SQL_PURGE_RESULTS = "DELETE FROM tool_results WHERE expires_at <= ?"
+
+
+def _normalize(value: Any) -> Any:
+    """Mesma pergunta com espaços diferentes = mesma chave"""
+    if isinstance(value, str):
+        return " ".join(value.split())
+    if isinstance(value, dict):
+        return {k: _normalize(v) for k, v in value.items() if v is not None}
+    if isinstance(value, (list, tuple)):
+        return [_normalize(v) for v in value]
+    return value
+
+
+class ToolResultCache:
+    """Envolve tools LangChain do MCP com um cache por (tool, argumentos normalizados).
+
+    Uma tool é cacheável se está em ``ttls`` ou se o servidor a anuncia como
+    ``readOnlyHint``/``idempotentHint`` (TTL ``default_ttl``); ``NON_CACHEABLE``
+    e ``destructiveHint`` vencem qualquer outra regra. A camada em memória é
+    um LRUTTLCache; com ``disk_path`` os resultados textuais também vão para
+    um SQLite compartilhado entre os processos dos agentes. Erros da tool
+    (ToolException) nunca são guardados.
+    """
+
+    def __init__(self, maxsize: int = 2048, default_ttl: float = 300.0, ttls: Optional[Dict[str, float]] = None,
+                 non_cacheable=NON_CACHEABLE, disk_path: Optional[str] = None):
+        self.default_ttl = default_ttl
+        self.ttls = {**TOOL_TTLS, **(ttls or {})}
+        self.non_cacheable = set(non_cacheable)
+        self.memory = LRUTTLCache(maxsize=maxsize, ttl=default_ttl)
+        self.disk: Optional[SQLitePool] = None
+        if disk_path:
+            self.disk = SQLitePool(disk_path, size=2, pragmas={"auto_vacuum": "NONE"})
+            with self.disk.transaction() as conn:
+                conn.execute(SQL_CREATE_RESULTS)
+                conn.execute(SQL_PURGE_RESULTS, (time.time(),))
+        self._tools: Dict[str, Dict[str, float]] = {}
+
+    def ttl_for(self, tool: BaseTool) -> Optional[float]:
+        """TTL da tool, ou None se ela não pode ir para o cache"""
+        hints = tool.metadata or {}
+        if tool.name in self.non_cacheable or hints.get("destructiveHint"):
+            return None
+        if tool.name in self.ttls:
+            return self.ttls[tool.name]
+        if hints.get("readOnlyHint") or hints.get("idempotentHint"):
+            return self.default_ttl
+        return None
+
+    def wrap(self, tool: BaseTool, namespace: str = "") -> BaseTool:
+        """A própria tool se não for cacheável; senão uma cópia que consulta o cache antes"""
+        ttl = self.ttl_for(tool)
+        if ttl is None or tool.coroutine is None:
+            return tool
+        call = tool.coroutine
+
+        async def cached_call(**arguments):
+            key = self._key(namespace, tool.name, arguments)
+            # Em memória fica (resultado, custo da chamada real em ms)
+            entry = self.memory.get(key)
+            if entry is None and self.disk is not None:
+                entry = await asyncio.to_thread(self._disk_get, key)
+                if entry is not None:
+                    self.memory.put(key, entry, ttl=ttl)
+            if entry is not None:
+                self._record(tool.name, "hits", entry[1])
+                return entry[0]
+            started = time.perf_counter()
+            result = await call(**arguments)
+            cost_ms = (time.perf_counter() - started) * 1000
+            self._record(tool.name, "misses", cost_ms)
+            self.memory.put(key, (result, cost_ms), ttl=ttl)
+            if self.disk is not None:
+                await asyncio.to_thread(self._disk_put, key, tool.name, result, cost_ms, ttl)
+            return result
+
+        return StructuredTool(name=tool.name, description=tool.description, args_schema=tool.args_schema,
+                              coroutine=cached_call, response_format=tool.response_format,
+                              metadata=tool.metadata)
+
+    @staticmethod
+    def _key(namespace: str, name: str, arguments: dict) -> str:
+        payload = json.dumps(_normalize(arguments), sort_keys=True, ensure_ascii=False, default=str)
+        return hashlib.sha256(f"{namespace}\x00{name}\x00{payload}".encode()).hexdigest()
+
+    def _disk_get(self, key: str):
+        with self.disk.connection() as conn:
+            row = conn.execute(SQL_GET_RESULT, (key, time.time())).fetchone()
+        return (tuple(json.loads(row[0])), row[1]) if row else None
+
+    def _disk_put(self, key: str, name: str, result, cost_ms: float, ttl: float):
+        # Só (conteúdo, None): artefatos não textuais (imagens, recursos) ficam só em memória
+        if not (isinstance(result, tuple) and len(result) == 2 and result[1] is None):
+            return
+        with self.disk.transaction() as conn:
+            conn.execute(SQL_PUT_RESULT, (key, name, json.dumps(list(result), ensure_ascii=False),
+                                          cost_ms, time.time() + ttl))
+
+    def _record(self, name: str, field: str, cost_ms: float):
+        stats = self._tools.setdefault(name, {"hits": 0, "misses": 0, "miss_ms": 0.0, "saved_ms": 0.0})
+        stats[field] += 1
+        # Cada acerto poupa o tempo que a chamada real levou quando foi guardada
+        stats["saved_ms" if field == "hits" else "miss_ms"] += cost_ms
+
+    def stats(self) -> Dict[str, Any]:
+        hits = sum(s["hits"] for s in self._tools.values())
+        misses = sum(s["misses"] for s in self._tools.values())
+        return {
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": round(hits / (hits + misses), 4) if hits + misses else 0.0,
+            "latency_saved_ms": round(sum(s["saved_ms"] for s in self._tools.values()), 1),
+            "memory": self.memory.stats(),
+            "disk": self.disk.db_path if self.disk is not None else None,
+            "tools": {name: {"hits": s["hits"], "misses": s["misses"],
+                             "avg_ms": round(s["miss_ms"] / s["misses"], 1) if s["misses"] else None}
+                      for name, s in self._tools.items()},
+        }
+
+    def close(self):
+        if self.disk is not None:
+            self.disk.close()
+
+
+def result_cache_from_env() -> Optional[ToolResultCache]:
+    """AGENT_MCP_RESULT_CACHE: ``memory`` (padrão), ``off`` ou caminho do SQLite da camada em disco"""
+    setting = os.getenv("AGENT_MCP_RESULT_CACHE", "memory")
+    if setting == "off":
+        return None
+    return ToolResultCache(disk_path=None if setting == "memory" else setting)
@@ -0,0 +1,111 @@
+"""Cache em disco dos schemas de tools MCP, um arquivo por endpoint"""
+
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from importlib import metadata
+from typing import Any, Dict, List, Optional
+
+# Sobe quando o formato do arquivo muda; a versão do adaptador MCP também invalida
+CACHE_VERSION = 1
+DEFAULT_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), ".mcp_cache")
+
+
+def _adapter_version() -> str:
+    try:
+        return f"{metadata.version('langchain-mcp-adapters')}/{metadata.version('mcp')}"
+    except metadata.PackageNotFoundError:
+        return "desconhecida"
+
+
+def content_hash(schemas: List[dict]) -> str:
+    return hashlib.sha256(json.dumps(schemas, sort_keys=True, ensure_ascii=False).encode()).hexdigest()
+
+
+class ToolSchemaCache:
+    """Schemas (``mcp.types.Tool`` em JSON) de cada endpoint, endereçados por hash.
+
+    O nome do arquivo é o hash da identidade do endpoint (URL + transporte),
+    então a api_key da URL nunca vai para o disco. Cada arquivo guarda o
+    hash do conteúdo: só é regravado quando o servidor muda as tools.
+    Entradas de outra ``CACHE_VERSION``, de outra versão do adaptador ou
+    mais velhas que ``max_age`` contam como vencidas e são ignoradas.
+    """
+
+    def __init__(self, directory: str = DEFAULT_DIR, max_age: Optional[float] = 7 * 24 * 3600.0):
+        self.directory = directory
+        self.max_age = max_age
+        self.adapter_version = _adapter_version()
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "stale": 0, "writes": 0, "unchanged": 0}
+
+    def _path(self, identity: tuple) -> str:
+        key = hashlib.sha256(repr(identity).encode()).hexdigest()[:32]
+        return os.path.join(self.directory, f"{key}.json")
+
+    def load(self, identity: tuple) -> Optional[List[dict]]:
+        """Schemas do endpoint, ou None se não houver entrada válida"""
+        path = self._path(identity)
+        try:
+            with open(path, encoding="utf-8") as f:
+                entry = json.load(f)
+            # Idade pelo mtime: save() de conteúdo igual só faz touch
+            age = time.time() - os.stat(path).st_mtime
+        except (OSError, ValueError):
+            self._count("misses")
+            return None
+        if (entry.get("version") != CACHE_VERSION or entry.get("adapter") != self.adapter_version
+                or (self.max_age is not None and age > self.max_age)
+                or content_hash(entry.get("tools", [])) != entry.get("hash")):
+            self._count("stale")
+            return None
+        self._count("hits")
+        return entry["tools"]
+
+    def save(self, identity: tuple, schemas: List[dict]) -> bool:
+        """Grava os schemas se mudaram; True quando o arquivo foi (re)escrito"""
+        digest = content_hash(schemas)
+        path = self._path(identity)
+        try:
+            with open(path, encoding="utf-8") as f:
+                entry = json.load(f)
+            if (entry.get("hash") == digest and entry.get("version") == CACHE_VERSION
+                    and entry.get("adapter") == self.adapter_version):
+                # Mesmo conteúdo: só renova a data, sem reescrever as tools
+                os.utime(path)
+                self._count("unchanged")
+                return False
+        except (OSError, ValueError):
+            pass
+        os.makedirs(self.directory, exist_ok=True)
+        entry = {"version": CACHE_VERSION, "adapter": self.adapter_version, "hash": digest, "tools": schemas}
+        # Escrita atômica: outro worker nunca lê um arquivo pela metade
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(entry, f, ensure_ascii=False)
+        os.replace(tmp, path)
+        self._count("writes")
+        return True
+
+    def invalidate(self, identity: tuple):
+        try:
+            os.remove(self._path(identity))
+        except FileNotFoundError:
+            pass
+
+    def _count(self, key: str):
+        with self._lock:
+            self._stats[key] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"directory": self.directory, **self._stats}
+
+
+def schema_cache_from_env() -> Optional[ToolSchemaCache]:
+    """AGENT_MCP_SCHEMA_CACHE: diretório do cache, ou ``off`` para desligar"""
+    setting = os.getenv("AGENT_MCP_SCHEMA_CACHE", DEFAULT_DIR)
+    return None if setting == "off" else ToolSchemaCache(setting)
@@ -0,0 +1,43 @@
+"""União dos servidores MCP exigidos por um conjunto de intenções"""
+
+from typing import Dict, Iterable, List, Tuple, Union
+
+# Uma intenção, uma lista de intenções ou o ranking [(intenção, escore), ...]
+Intencoes = Union[str, Iterable[str], Iterable[Tuple[str, float]]]
+
+
+def intent_names(intencoes: Intencoes) -> List[str]:
+    """Nomes das intenções, na ordem do ranking e sem repetição"""
+    if isinstance(intencoes, str):
+        return [intencoes]
+    names = [item[0] if isinstance(item, (tuple, list)) else item for item in intencoes]
+    return list(dict.fromkeys(names))
+
+
+def server_identity(config: dict) -> tuple:
+    """Mesma URL + transporte (ou mesmo comando stdio) = mesmo servidor"""
+    if "url" in config:
+        return (config.get("transport"), config["url"])
+    return (config.get("transport"), config.get("command"), tuple(config.get("args") or ()))
+
+
+def union_servers(configs: Iterable[Dict[str, dict]]) -> Dict[str, dict]:
+    """Junta sub-configs do MultiServerMCPClient conectando cada servidor uma única vez.
+
+    Nomes diferentes para o mesmo endpoint (ex.: ``codigo_ajustado`` e
+    ``explicador_codigo`` no mesmo context7) viram uma entrada só, com o
+    primeiro nome visto. O mesmo nome para endpoints diferentes ganha sufixo.
+    """
+    merged: Dict[str, dict] = {}
+    seen = set()
+    for config in configs:
+        for name, server in config.items():
+            identity = server_identity(server)
+            if identity in seen:
+                continue
+            seen.add(identity)
+            key, n = name, 2
+            while key in merged:
+                key, n = f"{name}_{n}", n + 1
+            merged[key] = server
+    return merged
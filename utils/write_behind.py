@@ -0,0 +1,138 @@
+"""Fila write-behind: agrupa gravações da memória em transações em lote"""
+
+import threading
+import time
+from collections import defaultdict
+from itertools import groupby
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+from utils.sqlite_pool import SQLitePool
+
+# (tabela, sql, parâmetros, escopo)
+PendingWrite = Tuple[str, str, tuple, Optional[str]]
+
+
+class WriteBehindQueue:
+    """Enfileira INSERT/UPDATE e grava em lote numa única transação.
+
+    O lote é gravado quando atinge ``max_batch`` operações ou quando a mais
+    antiga espera há ``flush_interval`` segundos. Quem precisa ler uma tabela
+    chama ``flush_if_pending(tabela, escopo)`` antes, garantindo
+    read-your-writes. Com escopo (ex.: a thread da conversa) só espera a
+    gravação quem lê o mesmo escopo: os demais leitores seguem no snapshot
+    WAL já commitado, sem entrar na fila do lock de escrita.
+    ``on_flush`` recebe as tabelas de cada lote depois do commit.
+    """
+
+    def __init__(self, pool: SQLitePool, max_batch: int = 200, flush_interval: float = 0.5,
+                 on_flush: Optional[Callable[[Set[str]], None]] = None):
+        self.pool = pool
+        self.on_flush = on_flush
+        self.max_batch = max(1, max_batch)
+        self.flush_interval = flush_interval
+        self._pending: List[PendingWrite] = []
+        self._oldest: float = 0.0
+        # Operações por tabela ainda não commitadas (inclui o lote em gravação)
+        self._unflushed: Dict[str, int] = defaultdict(int)
+        self._unflushed_scopes: Dict[Tuple[str, str], int] = defaultdict(int)
+        self._cond = threading.Condition()
+        self._flush_lock = threading.Lock()
+        self._closed = False
+        self.stats = {"batches": 0, "writes": 0, "errors": 0}
+        self._thread = threading.Thread(target=self._run, name="memory-write-behind", daemon=True)
+        self._thread.start()
+
+    def submit(self, table: str, sql: str, params: tuple, scope: Optional[str] = None):
+        """Enfileira uma gravação; retorna sem tocar no disco"""
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("WriteBehindQueue já foi fechada")
+            if not self._pending:
+                self._oldest = time.monotonic()
+            self._pending.append((table, sql, params, scope))
+            self._unflushed[table] += 1
+            if scope is not None:
+                self._unflushed_scopes[(table, scope)] += 1
+            if len(self._pending) >= self.max_batch:
+                self._cond.notify()
+
+    def has_pending(self, table: str, scope: Optional[str] = None) -> bool:
+        with self._cond:
+            if scope is None:
+                return self._unflushed.get(table, 0) > 0
+            return self._unflushed_scopes.get((table, scope), 0) > 0
+
+    def flush_if_pending(self, table: str, scope: Optional[str] = None):
+        """Grava o que estiver pendente se houver algo para a tabela (ou o escopo) lido"""
+        if self.has_pending(table, scope):
+            self.flush()
+
+    def flush(self) -> int:
+        """Grava imediatamente tudo o que está na fila; retorna o total gravado"""
+        with self._flush_lock:
+            with self._cond:
+                batch, self._pending = self._pending, []
+            if not batch:
+                return 0
+            try:
+                self._write(batch)
+                if self.on_flush is not None:
+                    self.on_flush({table for table, _, _, _ in batch})
+            finally:
+                with self._cond:
+                    for table, _, _, scope in batch:
+                        self._unflushed[table] -= 1
+                        if scope is not None:
+                            key = (table, scope)
+                            self._unflushed_scopes[key] -= 1
+                            if not self._unflushed_scopes[key]:
+                                del self._unflushed_scopes[key]
+            return len(batch)
+
+    def _write(self, batch: List[PendingWrite]):
+        try:
+            with self.pool.transaction() as conn:
+                # Statements iguais e consecutivos viram um único executemany
+                for sql, group in groupby(batch, key=lambda op: op[1]):
+                    conn.executemany(sql, [params for _, _, params, _ in group])
+            self.stats["batches"] += 1
+            self.stats["writes"] += len(batch)
+        except Exception as e:
+            # Um registro inválido não pode derrubar o lote inteiro
+            print(f"⚠️ Falha ao gravar lote de memória ({len(batch)} ops): {e}")
+            for table, sql, params, _ in batch:
+                try:
+                    with self.pool.transaction() as conn:
+                        conn.execute(sql, params)
+                    self.stats["writes"] += 1
+                except Exception as op_error:
+                    self.stats["errors"] += 1
+                    print(f"❌ Gravação descartada em {table}: {op_error}")
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._closed:
+                    if len(self._pending) >= self.max_batch:
+                        break
+                    if self._pending:
+                        remaining = self.flush_interval - (time.monotonic() - self._oldest)
+                        if remaining <= 0:
+                            break
+                        self._cond.wait(remaining)
+                    else:
+                        self._cond.wait()
+                closed = self._closed
+            self.flush()
+            if closed:
+                return
+
+    def close(self):
+        """Para a thread de gravação depois de esvaziar a fila"""
+        with self._cond:
+            if self._closed:
+                return
+            self._closed = True
+            self._cond.notify()
+        self._thread.join()
+        self.flush()